@@ -0,0 +1,151 @@
+"""Compares the TFLite inference backends with the TF backend.
+
+For every model mode and backend, runs the predictor on the same clips and
+reports the top-1 agreement and top-5 overlap with the TF backend, the largest
+probability difference and the inference throughput.
+
+Usage (from analysis-core):
+  python benchmarks/backend_parity.py --backends tf,tflite,tflite-fp16,tflite-int8
+  python benchmarks/backend_parity.py --model movinet --videos clip1.mp4 clip2.gif
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from synthetic_videos import write_clip  # noqa: E402
+
+
+def run_backend(mode, backend, videos, repeat):
+    """Returns the model load time, the per-video probabilities and the fps."""
+    from services import video_predictor
+    from services.video_predictor import VideoPredictor
+
+    video_predictor.inference_backends[mode] = backend
+    VideoPredictor._instances.pop(mode, None)
+    start = time.perf_counter()
+    predictor = VideoPredictor(mode)
+    load_seconds = time.perf_counter() - start
+    if predictor.backend != backend:
+        raise RuntimeError(f"The {backend} {mode} model is not exported")
+
+    probs = []
+    fps = []
+    for path in videos:
+        predictor.run_prediction(path)  # Warmup, e.g. tracing or tensor allocation
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            predictor.run_prediction(path)
+            seconds.append(time.perf_counter() - start)
+        probs.append(np.asarray(predictor.probs))
+        fps.append(predictor.num_frames / statistics.median(seconds))
+    return load_seconds, probs, statistics.mean(fps)
+
+
+def top_k(probs, k):
+    return np.argsort(-probs, axis=-1)[..., :k]
+
+
+def compare_probs(expected, actual, k=5):
+    """Compares the final (and for streams per-frame) predictions of two runs."""
+    expected_final = expected if expected.ndim == 1 else expected[-1]
+    actual_final = actual if actual.ndim == 1 else actual[-1]
+    expected_top = top_k(expected_final, k)
+    actual_top = top_k(actual_final, k)
+    result = {
+        "top1_agreement": float(expected_top[0] == actual_top[0]),
+        "top5_overlap": len(set(expected_top) & set(actual_top)) / k,
+        "max_prob_difference": float(np.max(np.abs(expected - actual))),
+    }
+    if expected.ndim == 2:
+        result["per_frame_top1_agreement"] = float(
+            np.mean(top_k(expected, 1) == top_k(actual, 1))
+        )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--modes", default="base,stream", help="model modes")
+    parser.add_argument(
+        "--backends",
+        default="tf,tflite,tflite-fp16,tflite-int8",
+        help="backends to compare, the first one is the reference",
+    )
+    parser.add_argument("--videos", nargs="*", help="clips, synthetic ones by default")
+    parser.add_argument("--clips", type=int, default=4, help="synthetic clips")
+    parser.add_argument("--frames", type=int, default=48, help="frames per synthetic clip")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per clip")
+    parser.add_argument(
+        "--model",
+        choices=("stub", "movinet"),
+        default="stub",
+        help="the stub model, or the MoViNet models cached in WORKING_DIR/models",
+    )
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+
+    modes = [value for value in args.modes.split(",") if value]
+    backends = [value for value in args.backends.split(",") if value]
+    work_dir = tempfile.mkdtemp(prefix="var-parity-")
+    if args.model == "stub" or not os.environ.get("WORKING_DIR"):
+        os.environ["WORKING_DIR"] = work_dir
+    working_dir = os.environ["WORKING_DIR"]
+
+    videos = args.videos or [
+        write_clip(os.path.join(work_dir, f"clip-{seed}.mp4"), args.frames, 320, 240, seed=seed)
+        for seed in range(args.clips)
+    ]
+
+    if args.model == "stub":
+        from stub_model import install_stub_model
+
+        install_stub_model(working_dir)
+    from export_models import export_models
+    from services.tflite_backend import parse_backend
+
+    quantizations = [parse_backend(b)[1] for b in backends if b != "tf"]
+    export_models(modes, quantizations=quantizations, force=args.model == "stub")
+
+    results = {}
+    for mode in modes:
+        reference = None
+        for backend in backends:
+            load_seconds, probs, fps = run_backend(mode, backend, videos, args.repeat)
+            reference = reference or probs
+            comparisons = [compare_probs(e, a) for e, a in zip(reference, probs)]
+            results[f"{mode}/{backend}"] = {
+                "model_load_seconds": round(load_seconds, 4),
+                "fps": round(fps, 2),
+                **{
+                    name: round(statistics.mean(c[name] for c in comparisons), 6)
+                    for name in comparisons[0]
+                },
+            }
+
+    print(
+        f"\n{'model':22s} {'load s':>8s} {'fps':>9s} {'top-1':>7s} {'top-5':>7s} {'max diff':>9s}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:22s} {result['model_load_seconds']:8.3f} {result['fps']:9.1f}"
+            f" {result['top1_agreement']:7.1%} {result['top5_overlap']:7.1%}"
+            f" {result['max_prob_difference']:9.2e}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
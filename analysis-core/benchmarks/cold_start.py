@@ -0,0 +1,77 @@
+"""Runs one analysis job in a fresh process and prints its cold start timings.
+
+Started by run_benchmarks.py with the local S3 stand-in in the environment.
+The last output line is a JSON object with the time to first inference.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import types
+
+START = time.perf_counter()
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+
+def lazy_stub_hub_module():
+    """Returns a `tensorflow_hub` stand-in that imports the stub model (and
+    TensorFlow) only when a hub layer is created, like the real module."""
+
+    def keras_layer(hub_path, trainable=False):
+        from stub_model import stub_hub_module
+
+        return stub_hub_module().KerasLayer(hub_path, trainable)
+
+    return types.SimpleNamespace(KerasLayer=keras_layer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--video-key", required=True)
+    parser.add_argument("--model-name", required=True)
+    parser.add_argument("--stub", action="store_true", help="use the stub hub model")
+    args = parser.parse_args()
+
+    if args.stub:
+        sys.modules["tensorflow_hub"] = lazy_stub_hub_module()
+
+    import app
+    import boto3
+    from utils import metrics
+
+    app.events_client = boto3.client(
+        "events", endpoint_url=os.environ["S3_ENDPOINT_URL"]
+    )
+    app.process_job(
+        {
+            "bucket": args.bucket,
+            "video_key": args.video_key,
+            "user_id": "benchmark",
+            "file_id": "benchmark",
+            "analysis_id": "benchmark",
+            "model_name": args.model_name,
+        }
+    )
+    summary = metrics.current().summary()
+    print(
+        json.dumps(
+            {
+                # Includes the imports done before the metrics clock started
+                "time_to_first_inference": summary["gauges"].get(
+                    "time_to_first_inference", 0.0
+                )
+                + (metrics.PROCESS_START - START),
+                "model_load": summary["timings"].get("model_load"),
+                "total": time.perf_counter() - START,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
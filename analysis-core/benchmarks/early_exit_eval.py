@@ -0,0 +1,118 @@
+"""Evaluates early exit policies of the stream model against full runs.
+
+An early exit analysis is a prefix of the full one, so every clip is
+analyzed once and its per-frame probabilities are replayed through each
+policy, clip by clip as in `VideoPredictor.predict_top_k`. Reports the
+fraction of frames saved and the top-1 agreement and top-5 overlap of the
+final predictions with the full runs.
+
+Usage (from analysis-core):
+  python benchmarks/early_exit_eval.py --policies "stable:16,stable:32+margin:0.05,confidence:0.6"
+  python benchmarks/early_exit_eval.py --model movinet --videos clip1.mp4 clip2.gif
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from backend_parity import top_k  # noqa: E402
+from segment_deviation import softmax  # noqa: E402
+from synthetic_videos import write_clip  # noqa: E402
+
+
+def replay(policy, probs, clip_size, k=5):
+    """Returns the number of frames an early exit analysis would analyze."""
+    monitor = policy.monitor(k, expected_frames=lambda: probs.shape[0])
+    for start in range(0, probs.shape[0], clip_size):
+        if monitor.update(probs[start : start + clip_size]):
+            break
+    return monitor.frame_index
+
+
+def evaluate(policy, probs, clip_size, k=5):
+    """Compares the final predictions of an early exit analysis with the full one."""
+    frames = replay(policy, probs, clip_size, k)
+    expected_top = top_k(probs[-1], k)
+    actual_top = top_k(probs[frames - 1], k)
+    return {
+        "exited": float(frames < probs.shape[0]),
+        "frames_saved": 1 - frames / probs.shape[0],
+        "top1_agreement": float(expected_top[0] == actual_top[0]),
+        "top5_overlap": len(set(expected_top) & set(actual_top)) / k,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--policies",
+        default="stable:8,stable:16,stable:32+margin:0.05,confidence:0.5,stable:16+coverage:0.5",
+        help="comma separated early exit policies",
+    )
+    parser.add_argument("--videos", nargs="*", help="clips, synthetic ones by default")
+    parser.add_argument("--clips", type=int, default=4, help="synthetic clips")
+    parser.add_argument("--frames", type=int, default=128, help="frames per synthetic clip")
+    parser.add_argument(
+        "--model",
+        choices=("stub", "movinet"),
+        default="stub",
+        help="the stub model, or the MoViNet model cached in WORKING_DIR/models",
+    )
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="var-early-exit-")
+    if args.model == "stub" or not os.environ.get("WORKING_DIR"):
+        os.environ["WORKING_DIR"] = work_dir
+    working_dir = os.environ["WORKING_DIR"]
+
+    paths = args.videos or [
+        write_clip(os.path.join(work_dir, f"clip-{seed}.mp4"), args.frames, 320, 240, seed=seed)
+        for seed in range(args.clips)
+    ]
+
+    if args.model == "stub":
+        from stub_model import install_stub_model
+
+        install_stub_model(working_dir)
+    from config import stream_clip_size
+    from services.early_exit import EarlyExitPolicy
+    from services.frame_source import FrameSource
+    from services.video_predictor import VideoPredictor
+
+    predictor = VideoPredictor("stream")
+    all_probs = []
+    for path in paths:
+        video = np.concatenate(list(FrameSource(path).iter_chunks()))
+        all_probs.append(softmax(predictor.stream_frames(video)[0]))
+
+    results = {}
+    for spec in (value for value in args.policies.split(",") if value):
+        policy = EarlyExitPolicy.parse(spec)
+        evaluations = [evaluate(policy, probs, stream_clip_size) for probs in all_probs]
+        results[str(policy)] = {
+            name: round(statistics.mean(e[name] for e in evaluations), 4)
+            for name in evaluations[0]
+        }
+
+    print(f"\n{'policy':36s} {'exited':>7s} {'saved':>7s} {'top-1':>7s} {'top-5':>7s}")
+    for name, result in results.items():
+        print(
+            f"{name:36s} {result['exited']:7.1%} {result['frames_saved']:7.1%}"
+            f" {result['top1_agreement']:7.1%} {result['top5_overlap']:7.1%}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
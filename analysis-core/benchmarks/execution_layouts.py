@@ -0,0 +1,257 @@
+"""Sweeps the worker execution layouts and reports their throughput and latency.
+
+For every clip length and layout (see `services.execution_layout`), starts
+the worker with `WORKER_LAYOUT` on a fresh directory job queue, waits until
+every worker process has loaded its models, then queues the jobs and
+reports:
+
+  - the throughput in jobs and frames per second, from the first job queued
+    to the last one finished,
+  - the p50 and p95 latency from queuing to the end of a job, and of the job
+    itself as logged by the worker,
+  - the startup time and the resident memory of all the worker processes.
+
+The jobs are queued at once by default, a backlog, or every `--interval`
+seconds to measure the latency under a lighter load.
+
+Usage (from analysis-core):
+  python benchmarks/execution_layouts.py --frames 32,256 --jobs 16
+  python benchmarks/execution_layouts.py --layouts "default,processes:2+pin,processes:4+intra:1+pin"
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from local_s3 import LocalS3  # noqa: E402
+from synthetic_videos import write_clip  # noqa: E402
+
+MODEL_NAMES = {
+    "base": "a2-base-kinetics-600-classification",
+    "stream": "a2-stream-kinetics-600-classification",
+}
+READY = "Worker is waiting for jobs..."
+FINISHED = re.compile(r"Job (\S+) finished in ([0-9.]+)s")
+FAILED = re.compile(r"Job (\S+) failed")
+
+
+def default_layouts():
+    """A single process with the TensorFlow defaults, then 1, 2, 4, ... pinned
+    processes sharing the CPUs, up to one process per CPU."""
+    num_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    layouts = ["default"]
+    processes = 1
+    while processes <= num_cpus:
+        layouts.append(f"processes:{processes}+pin")
+        processes *= 2
+    return layouts
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class WorkerRun:
+    """A worker started with a layout, whose output is followed in a thread."""
+
+    def __init__(self, env):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(BENCHMARKS_DIR, "layout_worker.py")],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        self.ready = 0
+        self.finished = {}
+        self.failed = set()
+        self.lines = []
+        self._thread = threading.Thread(target=self._follow, daemon=True)
+        self._thread.start()
+
+    def _follow(self):
+        for line in self.process.stdout:
+            self.lines.append(line)
+            if READY in line:
+                self.ready += 1
+            match = FINISHED.search(line)
+            if match:
+                self.finished[match.group(1)] = (time.perf_counter(), float(match.group(2)))
+            match = FAILED.search(line)
+            if match:
+                self.failed.add(match.group(1))
+
+    def wait_for(self, condition, timeout):
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if self.process.poll() is not None:
+                raise RuntimeError("The worker stopped:\n" + "".join(self.lines[-20:]))
+            if time.perf_counter() > deadline:
+                raise TimeoutError("The worker timed out:\n" + "".join(self.lines[-20:]))
+            time.sleep(0.01)
+
+    def rss_mb(self):
+        """The resident memory of the worker and its processes, pages shared between them counted once per process."""
+        parent = psutil.Process(self.process.pid)
+        return sum(process.memory_info().rss for process in [parent, *parent.children(recursive=True)]) / 1024**2
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._thread.join()
+
+
+def run_layout(args, s3, layout, num_frames, video_keys):
+    """Runs the jobs of one clip length with one layout and returns its results."""
+    from services.execution_layout import ExecutionLayout
+    from services.job_queue import DirectoryJobQueue
+
+    run_dir = tempfile.mkdtemp(prefix="var-layout-", dir=os.environ["WORKING_DIR"])
+    env = dict(
+        os.environ,
+        WORKER_LAYOUT=layout,
+        JOB_QUEUE_DIR=os.path.join(run_dir, "jobs"),
+        WORKER_PRELOAD_MODELS=args.model_name,
+        WORKER_EXIT_WHEN_IDLE="false",
+        PYTHONUNBUFFERED="1",
+        BENCHMARK_STUB_MODEL=str(args.model == "stub").lower(),
+    )
+    job_queue = DirectoryJobQueue(env["JOB_QUEUE_DIR"])
+    processes = ExecutionLayout.parse(layout).processes
+
+    start = time.perf_counter()
+    run = WorkerRun(env)
+    try:
+        run.wait_for(lambda: run.ready >= processes, args.timeout)
+        startup_seconds = time.perf_counter() - start
+
+        queued = {}
+        for i, video_key in enumerate(video_keys):
+            analysis_id = f"layout-{num_frames}f-{i:04d}"
+            queued[analysis_id] = time.perf_counter()
+            job_queue.put(
+                {
+                    "bucket": s3.bucket,
+                    "video_key": video_key,
+                    "user_id": "benchmark",
+                    "file_id": "benchmark",
+                    "analysis_id": analysis_id,
+                    "model_name": args.model_name,
+                }
+            )
+            if args.interval:
+                time.sleep(args.interval)
+        run.wait_for(lambda: len(run.finished) >= len(queued), args.timeout)
+        rss_mb = run.rss_mb()
+    finally:
+        run.stop()
+
+    first = min(queued.values())
+    last = max(end for end, _ in run.finished.values())
+    latencies = [run.finished[analysis_id][0] - queued_at for analysis_id, queued_at in queued.items()]
+    job_seconds = [seconds for _, seconds in run.finished.values()]
+    return {
+        "jobs_per_second": round(len(queued) / (last - first), 3),
+        "frames_per_second": round(len(queued) * num_frames / (last - first), 1),
+        "latency_p50": round(percentile(latencies, 0.5), 3),
+        "latency_p95": round(percentile(latencies, 0.95), 3),
+        "job_p50": round(percentile(job_seconds, 0.5), 3),
+        "job_p95": round(percentile(job_seconds, 0.95), 3),
+        "job_mean": round(statistics.mean(job_seconds), 3),
+        "failed_jobs": len(run.failed),
+        "startup_seconds": round(startup_seconds, 2),
+        "rss_mb": round(rss_mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--layouts", help="comma separated layouts, by default 1, 2, 4, ... pinned processes")
+    parser.add_argument("--frames", default="32,256", help="comma separated frames per clip, the task sizes")
+    parser.add_argument("--jobs", type=int, default=16, help="jobs per layout and clip length")
+    parser.add_argument("--interval", type=float, default=0, help="seconds between queued jobs, 0 for a backlog")
+    parser.add_argument("--size", default="320x240", help="clip resolution as WIDTHxHEIGHT")
+    parser.add_argument("--mode", choices=tuple(MODEL_NAMES), default="base", help="the model mode")
+    parser.add_argument(
+        "--model",
+        choices=("stub", "movinet"),
+        default="stub",
+        help="the stub model, or the MoViNet model cached in WORKING_DIR/models",
+    )
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for the startup or the jobs")
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+    args.model_name = MODEL_NAMES[args.mode]
+    layouts = [layout for layout in (args.layouts or ",".join(default_layouts())).split(",") if layout]
+    width, height = (int(value) for value in args.size.lower().split("x"))
+
+    work_dir = tempfile.mkdtemp(prefix="var-layouts-")
+    if args.model == "stub" or not os.environ.get("WORKING_DIR"):
+        os.environ["WORKING_DIR"] = work_dir
+    working_dir = os.environ["WORKING_DIR"]
+    os.makedirs(os.path.join(working_dir, "videos", "benchmark"), exist_ok=True)
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    os.environ["PROGRESS_EVENT_INTERVAL"] = "0"
+    os.environ["STREAM_OUTPUTS"] = "probabilities"
+    if args.model == "stub":
+        labels_path = os.path.join(working_dir, "kinetics_600_labels.txt")
+        with open(labels_path, "w") as f:
+            f.writelines(f"stub class {i}\n" for i in range(600))
+
+    results = {}
+    with LocalS3() as s3:
+        from services.s3_service import s3_client
+
+        for num_frames in (int(value) for value in args.frames.split(",") if value):
+            path = os.path.join(work_dir, f"clip-{num_frames}f.mp4")
+            write_clip(path, num_frames, width, height)
+            source_key = s3.upload(path, f"videos/benchmark/{os.path.basename(path)}")
+            # One object per job, so the processes never download to the same file
+            video_keys = []
+            for i in range(args.jobs):
+                key = f"videos/benchmark/clip-{num_frames}f-{i:04d}.mp4"
+                s3_client.copy_object(Bucket=s3.bucket, Key=key, CopySource={"Bucket": s3.bucket, "Key": source_key})
+                video_keys.append(key)
+
+            for layout in layouts:
+                result = run_layout(args, s3, layout, num_frames, video_keys)
+                results.setdefault(f"{num_frames}f", {})[layout] = result
+                print(f"{num_frames}f {layout}: {json.dumps(result)}", flush=True)
+
+    print(
+        f"\n{'frames':>6s} {'layout':32s} {'jobs/s':>7s} {'fps':>8s} {'lat p50':>8s} {'lat p95':>8s}"
+        f" {'job p50':>8s} {'job p95':>8s} {'RSS MiB':>8s}"
+    )
+    for frames, layout_results in results.items():
+        best = max(layout_results, key=lambda layout: layout_results[layout]["jobs_per_second"])
+        for layout, result in layout_results.items():
+            print(
+                f"{frames:>6s} {layout + (' *' if layout == best else ''):32s} {result['jobs_per_second']:7.2f}"
+                f" {result['frames_per_second']:8.1f} {result['latency_p50']:8.2f} {result['latency_p95']:8.2f}"
+                f" {result['job_p50']:8.2f} {result['job_p95']:8.2f} {result['rss_mb']:8.1f}"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Runs the analysis core worker against the local S3 and EventBridge stand-in.
+
+Started by execution_layouts.py with the stand-in and the worker settings in
+the environment, and `BENCHMARK_STUB_MODEL=true` for the stub hub model. The
+worker processes of a layout import this module again when they start, so
+they use the same stand-ins.
+"""
+import os
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+if os.environ.get("BENCHMARK_STUB_MODEL") == "true":
+    from cold_start import lazy_stub_hub_module
+
+    sys.modules["tensorflow_hub"] = lazy_stub_hub_module()
+
+import app  # noqa: E402
+import boto3  # noqa: E402
+import worker  # noqa: E402
+
+app.events_client = boto3.client("events", endpoint_url=os.environ["S3_ENDPOINT_URL"])
+
+if __name__ == "__main__":
+    worker.main()
@@ -0,0 +1,78 @@
+import logging
+import os
+import socket
+
+from moto.server import ThreadedMotoServer
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalS3:
+    """Runs an in-process S3 and EventBridge stand-in on a local HTTP port.
+
+    The services talk to it over HTTP like to MinIO or S3, so the download and
+    upload stages keep their request overhead. `configure_environment` must run
+    before the analysis core modules are imported, since they read the
+    endpoint and the credentials from the environment at import time.
+    """
+
+    def __init__(self, bucket="video-action-recognizer", event_bus_name="default"):
+        self.bucket = bucket
+        self.event_bus_name = event_bus_name
+        self.port = _free_port()
+        self.endpoint_url = f"http://127.0.0.1:{self.port}"
+        self._server = ThreadedMotoServer(
+            ip_address="127.0.0.1", port=self.port, verbose=False
+        )
+
+    def configure_environment(self):
+        os.environ.update(
+            {
+                "S3_ENDPOINT_URL": self.endpoint_url,
+                "S3_ACCESS_KEY_ID": "benchmark",
+                "S3_SECRET_ACCESS_KEY": "benchmark",
+                "S3_REGION": "us-east-1",
+                "AWS_ACCESS_KEY_ID": "benchmark",
+                "AWS_SECRET_ACCESS_KEY": "benchmark",
+                "AWS_DEFAULT_REGION": "us-east-1",
+                "INPUT_VIDEO_S3_BUCKET": self.bucket,
+                "EVENT_BUS_NAME": self.event_bus_name,
+            }
+        )
+
+    def start(self):
+        # Keep the request log of the stand-in out of the benchmark output
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self._server.start()
+        self.configure_environment()
+        from services.s3_service import s3_client
+
+        s3_client.create_bucket(Bucket=self.bucket)
+        return self
+
+    def events_client(self):
+        """Returns an EventBridge client publishing to the stand-in."""
+        import boto3
+
+        return boto3.client(
+            "events", region_name="us-east-1", endpoint_url=self.endpoint_url
+        )
+
+    def upload(self, path, key):
+        from services.s3_service import s3_client
+
+        s3_client.upload_file(path, self.bucket, key)
+        return key
+
+    def stop(self):
+        self._server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
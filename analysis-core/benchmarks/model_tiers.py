@@ -0,0 +1,128 @@
+"""Benchmarks the model registry: lazy loads, LRU evictions and model tiers.
+
+Requests the models in turn from a ModelRegistry with a memory budget, runs
+each one on a synthetic clip at its resolution, and reports per model the
+load and eviction counts and times, the estimated memory and the inference
+throughput, so the cheap and accurate tiers can be compared.
+
+Usage (from analysis-core):
+  python benchmarks/model_tiers.py --budget-mb 0.05 --rounds 3
+  python benchmarks/model_tiers.py --model movinet --budget-mb 200 \\
+    --models a0-stream-kinetics-600-classification,a2-stream-kinetics-600-classification
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from synthetic_videos import write_clip  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--models",
+        default="a0-base,a2-base,a5-base,a0-stream,a2-stream,a5-stream",
+        help="comma separated model names, the -kinetics-600-classification suffix is optional",
+    )
+    parser.add_argument("--budget-mb", type=float, default=0, help="memory budget, 0 for none")
+    parser.add_argument("--rounds", type=int, default=2, help="requests of every model")
+    parser.add_argument("--frames", type=int, default=32, help="frames of the synthetic clip")
+    parser.add_argument(
+        "--model",
+        choices=("stub", "movinet"),
+        default="stub",
+        help="the stub model, or the MoViNet models from WORKING_DIR/models or TF Hub",
+    )
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="var-tiers-")
+    if args.model == "stub" or not os.environ.get("WORKING_DIR"):
+        os.environ["WORKING_DIR"] = work_dir
+    working_dir = os.environ["WORKING_DIR"]
+    path = write_clip(os.path.join(work_dir, "clip.mp4"), args.frames, 320, 240)
+
+    if args.model == "stub":
+        from stub_model import install_stub_model
+
+        install_stub_model(working_dir)
+    from services.model_registry import ModelRegistry, get_model_spec
+
+    names = [
+        name if name.endswith("-classification") else f"{name}-kinetics-600-classification"
+        for name in args.models.split(",")
+        if name
+    ]
+    registry = ModelRegistry(args.budget_mb * 1024**2)
+    stats = {
+        name: {"loads": [], "evictions": [], "bytes": None, "fps": []} for name in names
+    }
+    hits = 0
+    for _ in range(args.rounds):
+        for name in names:
+            spec = get_model_spec(name)
+            before = registry.loaded
+            predictor = registry.get(name)
+            if name in before:
+                hits += 1
+            else:
+                stats[name]["loads"].append(registry.load_seconds[name])
+                stats[name]["bytes"] = predictor.memory_bytes()
+            for evicted in set(before) - set(registry.loaded):
+                stats[evicted]["evictions"].append(registry.eviction_seconds[evicted])
+
+            start = time.perf_counter()
+            predictor.run_prediction(path, image_size=(spec.resolution, spec.resolution))
+            stats[name]["fps"].append(predictor.num_frames / (time.perf_counter() - start))
+
+    results = {
+        name: {
+            "resolution": get_model_spec(name).resolution,
+            "loads": len(result["loads"]),
+            "mean_load_seconds": round(statistics.mean(result["loads"]), 4),
+            "evictions": len(result["evictions"]),
+            "mean_eviction_seconds": (
+                round(statistics.mean(result["evictions"]), 4) if result["evictions"] else None
+            ),
+            "memory_mb": round(result["bytes"] / 1024**2, 3),
+            "fps": round(statistics.median(result["fps"]), 1),
+        }
+        for name, result in stats.items()
+    }
+    requests = args.rounds * len(names)
+    summary = {
+        "budget_mb": args.budget_mb,
+        "requests": requests,
+        "hit_rate": round(hits / requests, 3),
+        "loaded_at_end": registry.loaded,
+        "loaded_mb_at_end": round(registry.loaded_bytes / 1024**2, 3),
+    }
+
+    print(
+        f"\n{'model':40s} {'px':>4s} {'loads':>6s} {'load s':>8s} {'evicts':>7s}"
+        f" {'evict s':>8s} {'MiB':>8s} {'fps':>8s}"
+    )
+    for name, result in results.items():
+        eviction = result["mean_eviction_seconds"]
+        print(
+            f"{name:40s} {result['resolution']:4d} {result['loads']:6d}"
+            f" {result['mean_load_seconds']:8.3f} {result['evictions']:7d}"
+            f" {'-' if eviction is None else f'{eviction:.3f}':>8s}"
+            f" {result['memory_mb']:8.3f} {result['fps']:8.1f}"
+        )
+    print(json.dumps(summary))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
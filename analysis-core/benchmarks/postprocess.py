@@ -0,0 +1,141 @@
+"""Micro-benchmarks the NumPy post-processing against the former TensorFlow one.
+
+Times the streaming plot label selection and the top-k predictions of
+`services.postprocessing` and the TensorFlow implementations they replace,
+on random walk logits of several frame counts and batch sizes, and checks
+they select the same labels in the same order.
+
+Usage (from analysis-core):
+  python benchmarks/postprocess.py --frames 100,1000,10000 --batch 16
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from segment_deviation import timed  # noqa: E402
+
+NUM_CLASSES = 600
+
+
+def tf_streaming_label_indices(probs, k):
+    """The former `ResultsService.get_top_k_streaming_labels` selection."""
+    import tensorflow as tf
+
+    top_categories_last = tf.argsort(probs, -1, "DESCENDING")[-1, :1]
+    categories = tf.argsort(probs, -1, "DESCENDING")[:, :k]
+    categories = tf.reshape(categories, [-1])
+    counts = sorted(
+        [
+            (i.numpy(), tf.reduce_sum(tf.cast(categories == i, tf.int32)).numpy())
+            for i in tf.unique(categories)[0]
+        ],
+        key=lambda x: x[1],
+        reverse=True,
+    )
+    top_probs_idx = tf.constant([i for i, _ in counts[:k]])
+    top_probs_idx = tf.concat([top_categories_last, top_probs_idx], 0)
+    return tf.unique(top_probs_idx)[0][: k + 1].numpy()
+
+
+def tf_top_k(probs, k):
+    """The former `VideoPredictor.get_top_k` selection, a full sort."""
+    import tensorflow as tf
+
+    top_predictions = tf.argsort(probs, axis=-1, direction="DESCENDING")[:k]
+    return top_predictions.numpy(), tf.gather(probs, top_predictions, axis=-1).numpy()
+
+
+def random_walk_logits(num_videos, num_frames, seed=0):
+    """Logits drifting over the frames like the ones of a stream model."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(scale=0.3, size=(num_videos, num_frames, NUM_CLASSES)).astype(np.float32)
+    return np.cumsum(steps, axis=1) + rng.normal(scale=3, size=(num_videos, 1, NUM_CLASSES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--frames", default="100,1000,10000", help="comma separated frame counts")
+    parser.add_argument("--batch", type=int, default=16, help="videos of the batched runs")
+    parser.add_argument("--k", type=int, default=5, help="the predictor's k")
+    parser.add_argument("--clip-size", type=int, default=8, help="frames of a stream model clip")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs, the median is reported")
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from services.postprocessing import softmax, streaming_label_indices, top_k
+
+    results = {}
+    for num_frames in (int(value) for value in args.frames.split(",") if value):
+        logits = random_walk_logits(args.batch, num_frames)
+        probs = softmax(logits)
+        tf_probs = tf.constant(probs[0])
+        tf_selected, tf_seconds = timed(lambda: tf_streaming_label_indices(tf_probs, args.k), args.repeat)
+        selected, seconds = timed(lambda: streaming_label_indices(probs[0], args.k), args.repeat)
+        tf_batch = [tf.constant(video_probs) for video_probs in probs]
+        tf_batch_selected, tf_batch_seconds = timed(
+            lambda: [tf_streaming_label_indices(video_probs, args.k) for video_probs in tf_batch],
+            args.repeat,
+        )
+        batch_selected, batch_seconds = timed(
+            lambda: streaming_label_indices(probs, args.k), args.repeat
+        )
+        results[f"streaming_labels_{num_frames}f"] = {
+            "same_labels": bool(np.array_equal(tf_selected, selected))
+            and all(np.array_equal(a, b) for a, b in zip(tf_batch_selected, batch_selected)),
+            "tf_seconds": round(tf_seconds, 6),
+            "numpy_seconds": round(seconds, 6),
+            "speedup": round(tf_seconds / seconds, 1),
+            f"tf_batch{args.batch}_seconds": round(tf_batch_seconds, 6),
+            f"numpy_batch{args.batch}_seconds": round(batch_seconds, 6),
+            "batch_speedup": round(tf_batch_seconds / batch_seconds, 1),
+        }
+
+    # The final top-k of a video, and of a batch of videos as after a base model batch
+    final = probs[:, -1]
+    tf_final = [tf.constant(video_probs) for video_probs in final]
+    tf_top, tf_seconds = timed(lambda: [tf_top_k(video_probs, args.k) for video_probs in tf_final], args.repeat)
+    top, seconds = timed(lambda: top_k(final, args.k), args.repeat)
+    results[f"top_k_batch{args.batch}"] = {
+        "same_labels": all(np.array_equal(a[0], b) for a, b in zip(tf_top, top[0])),
+        "tf_seconds": round(tf_seconds, 6),
+        "numpy_seconds": round(seconds, 6),
+        "speedup": round(tf_seconds / seconds, 1),
+    }
+
+    # The softmax of a stream model clip, and of the final logits of a batch of videos
+    for name, batch_logits in (
+        (f"softmax_clip{args.clip_size}", logits[0, : args.clip_size]),
+        (f"softmax_batch{args.batch}", logits[:, -1]),
+    ):
+        tf_logits = tf.constant(batch_logits)
+        tf_probs, tf_seconds = timed(lambda: tf.nn.softmax(tf_logits, axis=-1).numpy(), args.repeat)
+        numpy_probs, seconds = timed(lambda: softmax(tf_logits), args.repeat)
+        results[name] = {
+            "max_difference": float(np.abs(tf_probs - numpy_probs).max()),
+            "tf_seconds": round(tf_seconds, 6),
+            "numpy_seconds": round(seconds, 6),
+            "speedup": round(tf_seconds / seconds, 1),
+        }
+
+    print(f"\n{'benchmark':28s} {'same':>5s} {'tf s':>10s} {'numpy s':>10s} {'speedup':>8s}")
+    for name, result in results.items():
+        same = result.get("same_labels")
+        print(
+            f"{name:28s} {'-' if same is None else str(same):>5s} {result['tf_seconds']:10.6f}"
+            f" {result['numpy_seconds']:10.6f} {result['speedup']:7.1f}x"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Measures the time to first feedback of stream analyses with progress events.
+
+Runs `app.process_job` on synthetic clips against the local S3 stand-in and
+a stub EventBridge client, and reports when the first 'FileAnalysisProgress'
+event and the 'FileAnalyzed' event were published, the number of progress
+events and PutEvents calls, and checks the 'FileAnalyzed' event is unchanged.
+
+Usage (from analysis-core):
+  python benchmarks/progress_events.py --frames 600 --interval 1
+  python benchmarks/progress_events.py --fail-calls 2 --fail-entries 1
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from local_s3 import LocalS3  # noqa: E402
+from stub_events import StubEventsClient  # noqa: E402
+from synthetic_videos import write_clip  # noqa: E402
+
+STREAM_MODEL = "a2-stream-kinetics-600-classification"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--frames", type=int, default=600, help="frames per clip")
+    parser.add_argument("--size", default="320x240", help="clip resolution as WIDTHxHEIGHT")
+    parser.add_argument("--formats", default="mp4,gif", help="clip formats")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between progress events")
+    parser.add_argument("--fail-calls", type=int, default=0, help="PutEvents calls failing first")
+    parser.add_argument("--fail-entries", type=int, default=0, help="entries failing first")
+    parser.add_argument(
+        "--model",
+        choices=("stub", "movinet"),
+        default="stub",
+        help="the stub model, or the MoViNet model cached in WORKING_DIR/models",
+    )
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.size.lower().split("x"))
+
+    work_dir = tempfile.mkdtemp(prefix="var-progress-")
+    if args.model == "stub" or not os.environ.get("WORKING_DIR"):
+        os.environ["WORKING_DIR"] = work_dir
+    working_dir = os.environ["WORKING_DIR"]
+    os.makedirs(os.path.join(working_dir, "videos", "benchmark"), exist_ok=True)
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    os.environ["PROGRESS_EVENT_INTERVAL"] = str(args.interval)
+    os.environ["PROGRESS_EVENT_FLUSH_INTERVAL"] = str(min(args.interval, 1.0))
+
+    results = {}
+    with LocalS3() as s3:
+        import app
+
+        if args.model == "stub":
+            from stub_model import install_stub_model
+
+            install_stub_model(working_dir)
+        for extension in (value for value in args.formats.split(",") if value):
+            path = os.path.join(work_dir, f"clip-{args.frames}f.{extension}")
+            write_clip(path, args.frames, width, height)
+            video_key = s3.upload(path, f"videos/benchmark/{os.path.basename(path)}")
+
+            client = StubEventsClient(args.fail_calls, args.fail_entries)
+            app.events_client = client
+            start = time.perf_counter()
+            app.process_job(
+                {
+                    "bucket": s3.bucket,
+                    "video_key": video_key,
+                    "user_id": "benchmark",
+                    "file_id": "benchmark",
+                    "analysis_id": f"benchmark-{extension}",
+                    "model_name": STREAM_MODEL,
+                }
+            )
+            progress = client.of_type("FileAnalysisProgress")
+            analyzed = client.of_type("FileAnalyzed")
+            final = analyzed[-1]["detail"] if analyzed else {}
+            results[extension] = {
+                "first_feedback_seconds": (
+                    round(progress[0]["time"] - start, 3) if progress else None
+                ),
+                "file_analyzed_seconds": (
+                    round(analyzed[-1]["time"] - start, 3) if analyzed else None
+                ),
+                "progress_events": len(progress),
+                "put_events_calls": len(client.calls),
+                "progress_before_result": all(
+                    event["time"] <= analyzed[-1]["time"] for event in progress
+                ) if analyzed else None,
+                # Existing consumers only read the output of the FileAnalyzed event
+                "file_analyzed_keys": sorted(final.get("data", {})),
+                "output_keys": sorted(json.loads(final["data"]["output"])) if final else [],
+                "last_progress": progress[-1]["detail"]["data"]["progress"] if progress else None,
+            }
+
+    print(f"\n{'format':8s} {'first feedback':>15s} {'FileAnalyzed':>13s} {'progress':>9s} {'calls':>6s}")
+    for name, result in results.items():
+        first, final = result["first_feedback_seconds"], result["file_analyzed_seconds"]
+        print(
+            f"{name:8s} {'-' if first is None else f'{first:.3f}s':>15s}"
+            f" {'-' if final is None else f'{final:.3f}s':>13s}"
+            f" {result['progress_events']:9d} {result['put_events_calls']:6d}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
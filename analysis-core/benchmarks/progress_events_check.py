@@ -0,0 +1,129 @@
+"""Checks the progress events of stream analyses are ordered, throttled and
+sent before the 'FileAnalyzed' event.
+
+Runs `app.process_job` with the stub model on synthetic clips against the
+local S3 stand-in and the stub EventBridge client, and checks that:
+
+  - the 'FileAnalysisProgress' events arrive in the order they were
+    reported, with the frames processed never going back, and the 'render'
+    stage last,
+  - no two inference events were reported closer than the interval, less
+    the coalescing delay of the publisher,
+  - every progress event was sent before the 'FileAnalyzed' event, and none
+    after it.
+
+Exits with an error if not. `--fail-calls` checks the same with failing
+PutEvents calls, which the publisher retries.
+
+Usage (from analysis-core):
+  python benchmarks/progress_events_check.py --frames 600 --interval 0.2
+  python benchmarks/progress_events_check.py --fail-calls 2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from local_s3 import LocalS3  # noqa: E402
+from stub_events import StubEventsClient  # noqa: E402
+from synthetic_videos import write_clip  # noqa: E402
+
+STREAM_MODEL = "a2-stream-kinetics-600-classification"
+TOLERANCE = 0.05
+"""Seconds of scheduling jitter allowed between two progress events."""
+
+
+def check_events(client, interval, flush_interval):
+    """Returns the named checks of the events captured by a StubEventsClient."""
+    progress = client.of_type("FileAnalysisProgress")
+    analyzed = client.of_type("FileAnalyzed")
+    reports = [event["detail"]["data"]["progress"] for event in progress]
+    inference = [
+        (event["time"], report)
+        for event, report in zip(progress, reports)
+        if report["stage"] == "inference"
+    ]
+    # A delivered event lags its report by at most the coalescing delay
+    gaps = [
+        later - earlier
+        for (earlier, _), (later, _) in zip(inference, inference[1:])
+    ]
+    return {
+        "progress events": len(inference) >= 2,
+        "sequence increasing": all(
+            earlier["sequence"] < later["sequence"] for earlier, later in zip(reports, reports[1:])
+        ),
+        "frames not going back": all(
+            earlier["frames_processed"] <= later["frames_processed"]
+            for earlier, later in zip(reports, reports[1:])
+        ),
+        "render stage last": bool(reports)
+        and reports[-1]["stage"] == "render"
+        and all(report["stage"] == "inference" for report in reports[:-1]),
+        "throttled": all(gap >= interval - flush_interval - TOLERANCE for gap in gaps),
+        "one FileAnalyzed": len(analyzed) == 1,
+        "progress before FileAnalyzed": bool(analyzed)
+        and all(event["time"] <= analyzed[0]["time"] for event in progress)
+        and client.events[-1]["detail_type"] == "FileAnalyzed",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--frames", type=int, default=600, help="frames per clip")
+    parser.add_argument("--size", default="320x240", help="clip resolution as WIDTHxHEIGHT")
+    parser.add_argument("--formats", default="mp4,gif", help="clip formats")
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds between progress events")
+    parser.add_argument("--flush-interval", type=float, default=0.05, help="seconds events are coalesced")
+    parser.add_argument("--fail-calls", type=int, default=0, help="PutEvents calls failing first")
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.size.lower().split("x"))
+
+    work_dir = tempfile.mkdtemp(prefix="var-progress-check-")
+    os.environ["WORKING_DIR"] = work_dir
+    os.makedirs(os.path.join(work_dir, "videos", "benchmark"), exist_ok=True)
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    os.environ["PROGRESS_EVENT_INTERVAL"] = str(args.interval)
+    os.environ["PROGRESS_EVENT_FLUSH_INTERVAL"] = str(args.flush_interval)
+
+    results = {}
+    with LocalS3() as s3:
+        import app
+        from stub_model import install_stub_model
+
+        install_stub_model(work_dir)
+        for extension in (value for value in args.formats.split(",") if value):
+            path = os.path.join(work_dir, f"clip-{args.frames}f.{extension}")
+            write_clip(path, args.frames, width, height)
+            video_key = s3.upload(path, f"videos/benchmark/{os.path.basename(path)}")
+
+            client = StubEventsClient(args.fail_calls)
+            app.events_client = client
+            app.process_job(
+                {
+                    "bucket": s3.bucket,
+                    "video_key": video_key,
+                    "user_id": "benchmark",
+                    "file_id": "benchmark",
+                    "analysis_id": f"progress-check-{extension}",
+                    "model_name": STREAM_MODEL,
+                }
+            )
+            # Progress events sent late would arrive after the job returned
+            time.sleep(max(1.0, 4 * args.flush_interval))
+            results[extension] = check_events(client, args.interval, args.flush_interval)
+
+    for extension, checks in results.items():
+        for name, passed in checks.items():
+            print(f"{extension:5s} {name:30s} {'ok' if passed else 'FAILED'}")
+    if not all(all(checks.values()) for checks in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
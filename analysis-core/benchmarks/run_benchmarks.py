@@ -0,0 +1,401 @@
+"""Offline benchmarks of the analysis core stages.
+
+Generates synthetic MP4 and GIF clips, then times every stage of
+VideoPredictor and ResultsService and the full `app.process_job` flow against a
+local S3 stand-in. Reports the latency, frames per second and peak memory of
+each stage, and saves them as a JSON baseline to compare later commits with.
+
+Usage (from analysis-core):
+  python benchmarks/run_benchmarks.py --output baseline.json
+  python benchmarks/run_benchmarks.py --compare baseline.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from local_s3 import LocalS3  # noqa: E402
+from synthetic_videos import write_clip  # noqa: E402
+
+STAGES = (
+    "cold_start",
+    "decode",
+    "model_load",
+    "inference",
+    "batch_inference",
+    "postprocess",
+    "render",
+    "app",
+)
+
+MODEL_NAMES = {
+    "base": "a2-base-kinetics-600-classification",
+    "stream": "a2-stream-kinetics-600-classification",
+}
+
+
+class PeakMemory:
+    """Samples the RSS of this process and its children (ffmpeg, render
+    workers) in the background and keeps the peak, in MiB."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._process = psutil.Process()
+
+    def _rss(self):
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss / 1024**2
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_mb = self._rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self._rss())
+
+
+def measure(fn, frames, repeat, warmup=1):
+    """Runs `fn` `repeat` times and returns its latency, fps and peak memory.
+
+    The first `warmup` runs are not measured, so one-off costs such as the
+    tracing of the tf.functions do not skew the median.
+    """
+    for _ in range(warmup):
+        fn()
+    seconds = []
+    peak_mb = 0.0
+    extra = None
+    for _ in range(repeat):
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            extra = fn()
+            seconds.append(time.perf_counter() - start)
+        peak_mb = max(peak_mb, memory.peak_mb)
+    median = statistics.median(seconds)
+    result = {
+        "seconds": round(median, 4),
+        "min_seconds": round(min(seconds), 4),
+        "fps": round(frames / median, 2) if frames and median else None,
+        "peak_rss_mb": round(peak_mb, 1),
+    }
+    if isinstance(extra, dict):
+        result.update(extra)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def cold_start(args, s3, video_key, mode, exported):
+    """Runs a job in a fresh process, with or without the exported models."""
+    env = dict(os.environ)
+    if not exported:
+        env["INFERENCE_MODEL_DIR"] = os.path.join(env["WORKING_DIR"], "no-export")
+    command = [
+        sys.executable,
+        os.path.join(BENCHMARKS_DIR, "cold_start.py"),
+        "--bucket",
+        s3.bucket,
+        "--video-key",
+        video_key,
+        "--model-name",
+        MODEL_NAMES[mode],
+    ]
+    if args.model == "stub":
+        command.append("--stub")
+    output = subprocess.run(
+        command, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark_clip(args, s3, path, modes, stages):
+    """Benchmarks the requested stages on one clip and returns them by name."""
+    import app
+    from services.frame_source import FrameSource
+    from services.results_service import ResultsService
+    from services.video_predictor import VideoPredictor
+    from utils import metrics
+
+    results = {}
+    num_frames = args.frames
+
+    if "decode" in stages:
+
+        def decode():
+            for _ in FrameSource(path).iter_chunks():
+                pass
+
+        results["decode"] = measure(decode, num_frames, args.repeat, args.warmup)
+
+    video_key = s3.upload(path, f"videos/benchmark/{os.path.basename(path)}")
+    for mode in modes:
+        if "cold_start" in stages:
+            # From the interpreter start to the end of the first inference
+            for exported, suffix in ((False, "_hub"), (True, "")):
+                results[f"cold_start_{mode}{suffix}"] = measure(
+                    lambda: cold_start(args, s3, video_key, mode, exported),
+                    None,
+                    args.repeat,
+                    warmup=0,
+                )
+
+        if "model_load" in stages:
+
+            def load_model():
+                VideoPredictor._instances.pop(mode, None)
+                VideoPredictor(mode)
+
+            # Every run is a cold load of the model
+            results[f"model_load_{mode}"] = measure(
+                load_model, None, args.repeat, args.warmup
+            )
+
+        predictor = VideoPredictor(mode)
+        if "inference" in stages or mode == "stream":
+
+            def inference():
+                predictor.run_prediction(path)
+
+            result = measure(inference, num_frames, args.repeat, args.warmup)
+            if "inference" in stages:
+                results[f"inference_{mode}"] = result
+
+        if mode == "base" and "batch_inference" in stages:
+            paths = [path] * args.batch_size
+
+            def sequential_inference():
+                for video_path in paths:
+                    predictor.run_prediction(video_path)
+
+            def batch_inference():
+                predictor.run_batch_prediction(paths)
+
+            # The same clips one by one and in one batch, the fps counts the frames of all clips
+            frames = num_frames * args.batch_size
+            results["sequential_inference_base"] = measure(
+                sequential_inference, frames, args.repeat, args.warmup
+            )
+            results["batch_inference_base"] = measure(
+                batch_inference, frames, args.repeat, args.warmup
+            )
+
+        if mode == "stream" and "postprocess" in stages:
+            service = ResultsService(predictor)
+            results["postprocess"] = measure(
+                service.get_top_k_streaming_labels, num_frames, args.repeat, args.warmup
+            )
+
+        if mode == "stream" and "render" in stages:
+
+            def render():
+                ResultsService(predictor).generate_stream_output(
+                    input_video_s3_key=video_key,
+                    output_s3_bucket=s3.bucket,
+                    output_s3_key=f"{video_key}.render{os.path.splitext(path)[1]}",
+                )
+
+            results["render"] = measure(render, num_frames, args.repeat, args.warmup)
+
+        if "app" in stages:
+
+            def process_job():
+                app.process_job(
+                    {
+                        "bucket": s3.bucket,
+                        "video_key": video_key,
+                        "user_id": "benchmark",
+                        "file_id": "benchmark",
+                        "analysis_id": "benchmark",
+                        "model_name": MODEL_NAMES[mode],
+                    }
+                )
+                # The stage breakdown of the last run, from its job metrics
+                return {"breakdown": metrics.current().summary()["timings"]}
+
+            results[f"app_{mode}"] = measure(
+                process_job, num_frames, args.repeat, args.warmup
+            )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Prints the latency change of every stage against a baseline.
+
+    Returns:
+      The names of the stages slower than the baseline by more than `tolerance`.
+    """
+    regressions = []
+    print(f"\n{'stage':45s} {'baseline':>10s} {'current':>10s} {'change':>8s}")
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before.get("seconds"):
+            print(f"{name:45s} {'-':>10s} {result['seconds']:10.4f}")
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  slower"
+        print(
+            f"{name:45s} {before['seconds']:10.4f} {result['seconds']:10.4f}"
+            f" {change:+8.1%}{flag}"
+        )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--frames", type=int, default=64, help="frames per clip")
+    parser.add_argument(
+        "--size", default="320x240", help="clip resolution as WIDTHxHEIGHT"
+    )
+    parser.add_argument("--fps", type=int, default=25, help="MP4 frame rate")
+    parser.add_argument("--formats", default="mp4,gif", help="clip formats")
+    parser.add_argument("--modes", default="base,stream", help="model modes")
+    parser.add_argument(
+        "--stages", default=",".join(STAGES), help="stages to benchmark"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage")
+    parser.add_argument(
+        "--batch-size", type=int, default=8, help="clips of the batch_inference stage"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=1, help="unmeasured runs before each stage"
+    )
+    parser.add_argument(
+        "--faststart",
+        action="store_true",
+        help="write MP4s with the moov box first, so they decode while downloading",
+    )
+    parser.add_argument(
+        "--model",
+        choices=("stub", "movinet"),
+        default="stub",
+        help="the stub model, or the MoViNet models cached in WORKING_DIR/models",
+    )
+    parser.add_argument("--output", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", help="a JSON baseline to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative slowdown reported as a regression",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    formats = [value for value in args.formats.split(",") if value]
+    modes = [value for value in args.modes.split(",") if value]
+    stages = [value for value in args.stages.split(",") if value]
+
+    work_dir = tempfile.mkdtemp(prefix="var-benchmark-")
+    if args.model == "stub" or not os.environ.get("WORKING_DIR"):
+        os.environ["WORKING_DIR"] = work_dir
+    working_dir = os.environ["WORKING_DIR"]
+    os.makedirs(os.path.join(working_dir, "videos", "benchmark"), exist_ok=True)
+    # Every run must do the full work instead of hitting the result cache
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+
+    with LocalS3() as s3:
+        import app
+
+        app.events_client = s3.events_client()
+        if args.model == "stub":
+            from stub_model import install_stub_model
+
+            install_stub_model(working_dir)
+        if "cold_start" in stages:
+            from export_models import export_models
+
+            # Exported like at Docker build time, replacing the exports of other runs
+            export_models(modes, force=args.model == "stub")
+
+        results = {}
+        for extension in formats:
+            path = os.path.join(work_dir, f"clip-{args.frames}f-{args.size}.{extension}")
+            write_clip(path, args.frames, width, height, args.fps, args.faststart)
+            for name, result in benchmark_clip(args, s3, path, modes, stages).items():
+                results[f"{extension}/{name}"] = result
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": args.model,
+            "frames": args.frames,
+            "size": args.size,
+            "fps": args.fps,
+            "faststart": args.faststart,
+            "repeat": args.repeat,
+            "batch_size": args.batch_size,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+
+    print(f"\n{'stage':45s} {'seconds':>10s} {'fps':>10s} {'peak MiB':>10s}")
+    for name, result in results.items():
+        fps = f"{result['fps']:10.1f}" if result["fps"] else f"{'-':>10s}"
+        print(f"{name:45s} {result['seconds']:10.4f} {fps} {result['peak_rss_mb']:10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved the baseline to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("frames") != args.frames or baseline["meta"].get(
+            "size"
+        ) != args.size:
+            print("Warning: the baseline was recorded with other clip settings")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than the baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Measures how far segment-parallel stream inference deviates from a sequential run.
+
+For every number of segments and warm-up length, runs the stream model over
+the segments of the same clips in parallel and reports the probability
+difference and the per-frame top-1 agreement with the sequential
+probabilities, as well as the speedup.
+
+Usage (from analysis-core):
+  python benchmarks/segment_deviation.py --segments 2,4,8 --warmups 0,8,16,32,64
+  python benchmarks/segment_deviation.py --model movinet --videos clip1.mp4 clip2.gif
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from backend_parity import top_k  # noqa: E402
+from synthetic_videos import write_clip  # noqa: E402
+
+
+def timed(fn, repeat):
+    """Returns the result of `fn` and its median duration over `repeat` runs."""
+    fn()  # Warmup, e.g. tracing
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    return result, statistics.median(seconds)
+
+
+def softmax(logits):
+    logits = np.asarray(logits, np.float64)
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def compare_segments(expected, actual, k=5):
+    """Compares the per-frame probabilities of a segmented run with the sequential ones."""
+    difference = np.abs(expected - actual)
+    expected_top = top_k(expected[-1], k)
+    actual_top = top_k(actual[-1], k)
+    return {
+        "max_prob_difference": float(difference.max()),
+        "mean_prob_difference": float(difference.mean()),
+        "per_frame_top1_agreement": float(np.mean(top_k(expected, 1) == top_k(actual, 1))),
+        "final_top1_agreement": float(expected_top[0] == actual_top[0]),
+        "final_top5_overlap": len(set(expected_top) & set(actual_top)) / k,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--segments", default="2,4,8", help="numbers of segments")
+    parser.add_argument("--warmups", default="0,8,16,32,64", help="warm-up lengths in frames")
+    parser.add_argument("--workers", type=int, help="segments run at once, all by default")
+    parser.add_argument("--videos", nargs="*", help="clips, synthetic ones by default")
+    parser.add_argument("--clips", type=int, default=2, help="synthetic clips")
+    parser.add_argument("--frames", type=int, default=256, help="frames per synthetic clip")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per setting")
+    parser.add_argument(
+        "--model",
+        choices=("stub", "movinet"),
+        default="stub",
+        help="the stub model, or the MoViNet model cached in WORKING_DIR/models",
+    )
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+
+    segment_counts = [int(value) for value in args.segments.split(",") if value]
+    warmups = [int(value) for value in args.warmups.split(",") if value]
+    work_dir = tempfile.mkdtemp(prefix="var-segments-")
+    if args.model == "stub" or not os.environ.get("WORKING_DIR"):
+        os.environ["WORKING_DIR"] = work_dir
+    working_dir = os.environ["WORKING_DIR"]
+
+    paths = args.videos or [
+        write_clip(os.path.join(work_dir, f"clip-{seed}.mp4"), args.frames, 320, 240, seed=seed)
+        for seed in range(args.clips)
+    ]
+
+    if args.model == "stub":
+        from stub_model import install_stub_model
+
+        install_stub_model(working_dir)
+    from services.frame_source import FrameSource
+    from services.video_predictor import VideoPredictor
+
+    predictor = VideoPredictor("stream")
+    videos = [np.concatenate(list(FrameSource(path).iter_chunks())) for path in paths]
+
+    sequential = []
+    sequential_seconds = 0.0
+    for video in videos:
+        logits, seconds = timed(lambda: predictor.stream_frames(video)[0], args.repeat)
+        sequential.append(softmax(logits))
+        sequential_seconds += seconds
+
+    results = {}
+    for num_segments in segment_counts:
+        for warmup in warmups:
+            comparisons = []
+            seconds = 0.0
+            for video, expected in zip(videos, sequential):
+                logits, video_seconds = timed(
+                    lambda: predictor.predict_segment_logits(
+                        video, num_segments, warmup, args.workers
+                    ),
+                    args.repeat,
+                )
+                comparisons.append(compare_segments(expected, softmax(logits)))
+                seconds += video_seconds
+            results[f"segments={num_segments}/warmup={warmup}"] = {
+                "speedup": round(sequential_seconds / seconds, 3),
+                **{
+                    name: round(statistics.mean(c[name] for c in comparisons), 6)
+                    for name in comparisons[0]
+                },
+            }
+
+    print(
+        f"\n{'setting':24s} {'speedup':>8s} {'max diff':>9s} {'mean diff':>10s}"
+        f" {'frame top-1':>12s} {'final top-1':>12s}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:24s} {result['speedup']:8.2f} {result['max_prob_difference']:9.2e}"
+            f" {result['mean_prob_difference']:10.2e} {result['per_frame_top1_agreement']:12.1%}"
+            f" {result['final_top1_agreement']:12.1%}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
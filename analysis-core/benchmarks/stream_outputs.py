@@ -0,0 +1,158 @@
+"""Compares the rendered plot video with the probability artifact of stream analyses.
+
+Runs `app.process_job` on synthetic clips against the local S3 stand-in,
+once rendering the plot video and once only writing the probability
+artifact, and reports the job times and output sizes. It then checks the
+artifact against the predictor: the plotted labels, the float16 error and a
+time range read with a single ranged GET, and renders the plot video again
+offline from the artifact.
+
+Usage (from analysis-core):
+  python benchmarks/stream_outputs.py --frames 300
+  python benchmarks/stream_outputs.py --logits --formats mp4
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from local_s3 import LocalS3  # noqa: E402
+from stub_events import StubEventsClient  # noqa: E402
+from synthetic_videos import write_clip  # noqa: E402
+
+STREAM_MODEL = "a2-stream-kinetics-600-classification"
+
+
+def object_size(s3_client, bucket, key):
+    return s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--frames", type=int, default=300, help="frames per clip")
+    parser.add_argument("--size", default="320x240", help="clip resolution as WIDTHxHEIGHT")
+    parser.add_argument("--formats", default="mp4,gif", help="clip formats")
+    parser.add_argument("--logits", action="store_true", help="store the logits in the artifact")
+    parser.add_argument("--range", default="1,2", help="the time range read, as START,END seconds")
+    parser.add_argument(
+        "--model",
+        choices=("stub", "movinet"),
+        default="stub",
+        help="the stub model, or the MoViNet model cached in WORKING_DIR/models",
+    )
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    range_start, range_end = (float(value) for value in args.range.split(","))
+
+    work_dir = tempfile.mkdtemp(prefix="var-outputs-")
+    if args.model == "stub" or not os.environ.get("WORKING_DIR"):
+        os.environ["WORKING_DIR"] = work_dir
+    working_dir = os.environ["WORKING_DIR"]
+    os.makedirs(os.path.join(working_dir, "videos", "benchmark"), exist_ok=True)
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    os.environ["PROGRESS_EVENT_INTERVAL"] = "0"
+
+    results = {}
+    with LocalS3() as s3:
+        import app
+        from services.probability_artifact import ProbabilityArtifact, render_plot_video
+        from services.results_service import ResultsService
+        from services.s3_service import s3_client
+
+        if args.model == "stub":
+            from stub_model import install_stub_model
+
+            install_stub_model(working_dir)
+        app.probability_artifact_logits = args.logits
+        for extension in (value for value in args.formats.split(",") if value):
+            path = os.path.join(work_dir, f"clip-{args.frames}f.{extension}")
+            write_clip(path, args.frames, width, height)
+            video_key = s3.upload(path, f"videos/benchmark/{os.path.basename(path)}")
+
+            result = {}
+            for outputs in (["video"], ["probabilities"]):
+                app.stream_outputs = outputs
+                app.events_client = StubEventsClient()
+                start = time.perf_counter()
+                app.process_job(
+                    {
+                        "bucket": s3.bucket,
+                        "video_key": video_key,
+                        "user_id": "benchmark",
+                        "file_id": "benchmark",
+                        "analysis_id": f"benchmark-{extension}",
+                        "model_name": STREAM_MODEL,
+                    }
+                )
+                seconds = time.perf_counter() - start
+                output = json.loads(
+                    app.events_client.of_type("FileAnalyzed")[-1]["detail"]["data"]["output"]
+                )
+                key = output.get("output_file_path") or output["probabilities_file_path"]
+                result[outputs[0]] = {
+                    "job_seconds": round(seconds, 3),
+                    "bytes": object_size(s3_client, s3.bucket, key),
+                    "output_keys": sorted(output),
+                }
+
+            # The predictor still holds the probabilities of the last job
+            predictor = app.load_predictor(STREAM_MODEL)
+            artifact = ProbabilityArtifact.from_s3(s3.bucket, output["probabilities_file_path"])
+            opened = (artifact.requests, artifact.bytes_read)
+            selected = artifact.read(range_start, range_end)
+            ranged = (artifact.requests - opened[0], artifact.bytes_read - opened[1])
+            _, top_labels, _ = ResultsService(predictor).get_top_k_streaming_labels()
+            frames = artifact.read_frames()
+            probs = predictor.probs.numpy()
+            plot_indices = artifact.index["plot_indices"]
+
+            start = time.perf_counter()
+            render_path = os.path.join(work_dir, f"offline-{extension}.mp4")
+            render_plot_video(artifact, render_path, video_path=path, work_dir=work_dir)
+            render_seconds = time.perf_counter() - start
+
+            result["artifact"] = {
+                "plot_labels_match": artifact.plot_labels == top_labels,
+                "max_plot_prob_error": float(np.abs(frames["plot_probs"] - probs[:, plot_indices]).max()),
+                "max_top_prob_error": float(
+                    np.abs(frames["top_k_probs"] - np.sort(probs, -1)[:, ::-1][:, : artifact.index["top_k"]]).max()
+                ),
+                "max_logit_error": (
+                    float(np.abs(frames["logits"] - predictor.logits.numpy()).max())
+                    if frames["logits"] is not None
+                    else None
+                ),
+                "open_requests": opened[0],
+                "open_bytes": opened[1],
+                "range_frames": selected["end"] - selected["start"],
+                "range_requests": ranged[0],
+                "range_bytes": ranged[1],
+                "offline_render_seconds": round(render_seconds, 3),
+                "offline_render_bytes": os.path.getsize(render_path),
+            }
+            results[extension] = result
+
+    print(f"\n{'format':8s} {'video job':>10s} {'video KiB':>10s} {'probs job':>10s} {'probs KiB':>10s}")
+    for name, result in results.items():
+        print(
+            f"{name:8s} {result['video']['job_seconds']:9.2f}s {result['video']['bytes'] / 1024:10.1f}"
+            f" {result['probabilities']['job_seconds']:9.2f}s {result['probabilities']['bytes'] / 1024:10.1f}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import itertools
+import json
+import threading
+import time
+
+
+class StubEventsClient:
+    """Captures the events the analysis core publishes, instead of EventBridge.
+
+    Set it as `app.events_client`. It can fail the first calls or entries, to
+    exercise the retries of `EventPublisher`.
+    """
+
+    def __init__(self, fail_calls=0, fail_entries=0):
+        """
+        Args:
+          fail_calls: the number of first `put_events` calls raising an error.
+          fail_entries: the number of first entries answered with an error code.
+        """
+        self.fail_calls = fail_calls
+        self.fail_entries = fail_entries
+        self.calls = []
+        self.events = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def put_events(self, Entries):
+        with self._lock:
+            self.calls.append((time.perf_counter(), len(Entries)))
+            if self.fail_calls > 0:
+                self.fail_calls -= 1
+                raise ConnectionError("Stub EventBridge is unavailable")
+            results = []
+            for entry in Entries:
+                if self.fail_entries > 0:
+                    self.fail_entries -= 1
+                    results.append({"ErrorCode": "ThrottlingException", "ErrorMessage": "Stub"})
+                    continue
+                self.events.append(
+                    {
+                        "time": time.perf_counter(),
+                        "detail_type": entry["DetailType"],
+                        "detail": json.loads(entry["Detail"]),
+                    }
+                )
+                results.append({"EventId": f"stub-{next(self._ids)}"})
+            failed = sum(1 for result in results if "ErrorCode" in result)
+            return {"FailedEntryCount": failed, "Entries": results}
+
+    def of_type(self, detail_type):
+        """Returns the captured events of a detail type, in publishing order."""
+        with self._lock:
+            return [event for event in self.events if event["detail_type"] == detail_type]
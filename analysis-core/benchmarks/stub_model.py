@@ -0,0 +1,96 @@
+import os
+import sys
+import types
+
+import tensorflow as tf
+
+NUM_CLASSES = 600
+
+
+class StubMovinet(tf.keras.layers.Layer):
+    """A tiny stand-in for the MoViNet hub layer with the same signatures.
+
+    The base mode maps {"image": video} to logits of shape (batch, classes).
+    The stream mode maps {**states, "image": clip} to (logits, states), and its
+    `resolved_object.signatures["init_states"]` builds the initial states from
+    an input shape, like the real stream model. A small convolution keeps the
+    per-frame cost proportional to the frame size.
+    """
+
+    def __init__(self, model_mode, num_classes=NUM_CLASSES, filters=8, seed=0):
+        super().__init__(name=f"stub_movinet_{model_mode}")
+        self.model_mode = model_mode
+        self.filters = filters
+        generator = tf.random.Generator.from_seed(seed)
+        self.kernel = tf.Variable(
+            generator.normal([1, 3, 3, 3, filters]), trainable=False
+        )
+        self.classifier = tf.Variable(
+            generator.normal([filters, num_classes]), trainable=False
+        )
+
+        @tf.function(input_signature=[tf.TensorSpec([5], tf.int32)])
+        def init_states(input_shape):
+            batch = input_shape[0]
+            return {
+                "stream_mean": tf.zeros([batch, filters]),
+                "stream_count": tf.zeros([batch, 1]),
+            }
+
+        self.resolved_object = types.SimpleNamespace(
+            signatures={"init_states": init_states}
+        )
+
+    def _frame_features(self, video):
+        """Returns the per-video sum of the pooled frame features and the frame count."""
+        # A per-frame convolution, without reshapes so TFLite keeps static shapes
+        features = tf.nn.relu(
+            tf.nn.conv3d(video, self.kernel, [1, 1, 2, 2, 1], "SAME")
+        )
+        pooled = tf.reduce_mean(features, [2, 3])
+        return tf.reduce_sum(pooled, 1), tf.cast(tf.shape(video)[1], tf.float32)
+
+    def call(self, inputs):
+        total, count = self._frame_features(inputs["image"])
+        if self.model_mode == "base":
+            return tf.matmul(total / count, self.classifier)
+
+        # The running mean over every frame seen so far plays the role of the states
+        seen = inputs["stream_count"] + count
+        mean = (inputs["stream_mean"] * inputs["stream_count"] + total) / seen
+        states = {"stream_mean": mean, "stream_count": seen}
+        return tf.matmul(mean, self.classifier), states
+
+
+def stub_hub_module(num_classes=NUM_CLASSES):
+    """Returns a module replacing `tensorflow_hub` whose KerasLayer is a stub.
+
+    The mode is taken from the hub path, which ends with the model mode when
+    loaded from the cache or contains it when loaded from TF Hub.
+    """
+
+    def keras_layer(hub_path, trainable=False):
+        mode = "stream" if "stream" in hub_path else "base"
+        return StubMovinet(mode, num_classes=num_classes)
+
+    return types.SimpleNamespace(KerasLayer=keras_layer)
+
+
+def install_stub_model(working_dir, num_classes=NUM_CLASSES):
+    """Makes VideoPredictor load the stub model and writes a stub label map.
+
+    Args:
+      working_dir: the analysis core working directory, receiving the label
+        map if it does not exist yet.
+      num_classes: the number of classes of the stub model.
+    """
+    from services.video_predictor import VideoPredictor
+
+    labels_path = os.path.join(working_dir, "kinetics_600_labels.txt")
+    if not os.path.exists(labels_path):
+        with open(labels_path, "w") as f:
+            f.writelines(f"stub class {i}\n" for i in range(num_classes))
+
+    # VideoPredictor imports tensorflow_hub when it loads a hub model
+    sys.modules["tensorflow_hub"] = stub_hub_module(num_classes)
+    VideoPredictor._instances.clear()
@@ -0,0 +1,77 @@
+import imageio_ffmpeg
+import numpy as np
+from PIL import Image
+
+
+def synthetic_frames(num_frames, width, height, seed=0):
+    """Yields uint8 RGB frames of a few colored squares moving over a gradient.
+
+    The motion keeps the encoded size and the decode cost close to a real clip,
+    unlike a static or random noise video.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    background = np.stack(
+        np.broadcast_arrays(x[None, :], y, (x[None, :] + y) / 2), axis=-1
+    ).astype(np.uint8)
+
+    side = max(4, min(width, height) // 6)
+    positions = rng.uniform(0, 1, (4, 2))
+    velocities = rng.uniform(-0.03, 0.03, (4, 2))
+    colors = rng.integers(0, 256, (4, 3), dtype=np.uint8)
+    for index in range(num_frames):
+        frame = background.copy()
+        points = np.abs((positions + velocities * index + 1) % 2 - 1)
+        for (px, py), color in zip(points, colors):
+            left = int(px * (width - side))
+            top = int(py * (height - side))
+            frame[top : top + side, left : left + side] = color
+        yield frame
+
+
+def write_mp4(path, num_frames, width, height, fps=25, faststart=False, seed=0):
+    """Writes a synthetic H.264 MP4 clip.
+
+    Args:
+      faststart: move the moov box to the front of the file, as for uploads
+        that can be decoded while they download.
+    """
+    params = ["-movflags", "+faststart"] if faststart else []
+    writer = imageio_ffmpeg.write_frames(
+        path,
+        (width, height),
+        fps=fps,
+        codec="libx264",
+        pix_fmt_out="yuv420p",
+        macro_block_size=2,
+        output_params=params,
+    )
+    writer.send(None)
+    for frame in synthetic_frames(num_frames, width, height, seed):
+        writer.send(frame)
+    writer.close()
+    return path
+
+
+def write_gif(path, num_frames, width, height, fps=10, seed=0):
+    """Writes a synthetic animated GIF clip."""
+    frames = [
+        Image.fromarray(frame)
+        for frame in synthetic_frames(num_frames, width, height, seed)
+    ]
+    frames[0].save(
+        path,
+        save_all=True,
+        append_images=frames[1:],
+        duration=int(1000 / fps),
+        loop=0,
+    )
+    return path
+
+
+def write_clip(path, num_frames, width, height, fps=25, faststart=False, seed=0):
+    """Writes an MP4 or GIF clip depending on the extension of `path`."""
+    if path.lower().endswith(".gif"):
+        return write_gif(path, num_frames, width, height, fps, seed)
+    return write_mp4(path, num_frames, width, height, fps, faststart, seed)
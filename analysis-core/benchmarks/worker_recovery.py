@@ -0,0 +1,108 @@
+"""Checks that the job of a worker process killed mid-job is requeued and finished.
+
+Starts the worker with several processes (`WORKER_LAYOUT`) against the local
+S3 stand-in, queues a stream job slow enough to render, kills the process
+that claimed it with SIGKILL, like the kernel on out of memory, and checks
+the job is requeued, finished once by another process and leaves no claim
+behind. Exits with an error if not.
+
+Usage (from analysis-core):
+  python benchmarks/worker_recovery.py --frames 200
+"""
+import argparse
+import os
+import signal
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from execution_layouts import MODEL_NAMES, WorkerRun  # noqa: E402
+from local_s3 import LocalS3  # noqa: E402
+from synthetic_videos import write_clip  # noqa: E402
+
+ANALYSIS_ID = "recovery"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--frames", type=int, default=200, help="frames of the clip")
+    parser.add_argument("--layout", default="processes:2", help="the worker layout, with several processes")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for each step")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="var-recovery-")
+    os.environ["WORKING_DIR"] = work_dir
+    os.makedirs(os.path.join(work_dir, "videos", "benchmark"), exist_ok=True)
+    with open(os.path.join(work_dir, "kinetics_600_labels.txt"), "w") as f:
+        f.writelines(f"stub class {i}\n" for i in range(600))
+    queue_dir = os.path.join(work_dir, "jobs")
+
+    with LocalS3() as s3:
+        from services.job_queue import DirectoryJobQueue
+
+        path = os.path.join(work_dir, "clip.mp4")
+        write_clip(path, args.frames, 320, 240)
+        video_key = s3.upload(path, "videos/benchmark/clip.mp4")
+        env = dict(
+            os.environ,
+            WORKER_LAYOUT=args.layout,
+            JOB_QUEUE_DIR=queue_dir,
+            WORKER_PRELOAD_MODELS=MODEL_NAMES["stream"],
+            WORKER_EXIT_WHEN_IDLE="false",
+            RESULT_CACHE_ENABLED="false",
+            PROGRESS_EVENT_INTERVAL="0",
+            PYTHONUNBUFFERED="1",
+            BENCHMARK_STUB_MODEL="true",
+        )
+        run = WorkerRun(env)
+        try:
+            run.wait_for(lambda: run.ready >= 2, args.timeout)
+            DirectoryJobQueue(queue_dir).put(
+                {
+                    "bucket": s3.bucket,
+                    "video_key": video_key,
+                    "user_id": "benchmark",
+                    "file_id": "benchmark",
+                    "analysis_id": ANALYSIS_ID,
+                    "model_name": MODEL_NAMES["stream"],
+                }
+            )
+
+            def claims():
+                return [name for name in os.listdir(queue_dir) if name.endswith(DirectoryJobQueue.CLAIM_EXTENSION)]
+
+            run.wait_for(claims, args.timeout)
+            claim = claims()[0]
+            pid = int(claim.rsplit(".json.", 1)[1].split("@")[0])
+            # Let the job start its analysis before killing its process
+            time.sleep(0.5)
+            if ANALYSIS_ID in run.finished:
+                sys.exit("The job finished before its process was killed, use a longer clip")
+            os.kill(pid, signal.SIGKILL)
+            print(f"Killed worker process {pid} during the job", flush=True)
+
+            run.wait_for(lambda: ANALYSIS_ID in run.finished, args.timeout)
+            time.sleep(1)
+        finally:
+            run.stop()
+
+    output = "".join(run.lines)
+    checks = {
+        "requeued": f"Requeuing job {ANALYSIS_ID}" in output,
+        "finished once": output.count(f"Job {ANALYSIS_ID} finished") == 1,
+        "not failed": ANALYSIS_ID not in run.failed,
+        "no job file left": not os.listdir(queue_dir),
+    }
+    for name, passed in checks.items():
+        print(f"{name:20s} {'ok' if passed else 'FAILED'}")
+    if not all(checks.values()):
+        print(output[-4000:])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,57 @@
 import json
 import os
+import threading
+import time
 
 import boto3
 import numpy as np
 
 from config import input_video_s3_bucket, output_s3_bucket, video_s3_key, user_id, file_id, analysis_id, event_bus_name, \
-    model_name
-from services.results_service import ResultsService
-from services.s3_service import download_video, upload_video
-from services.video_predictor import VideoPredictor
-from utils import logger
+    model_name, result_cache_enabled, result_cache_dir, result_cache_max_bytes, result_cache_s3_prefix, \
+    attach_metrics_to_event, frame_sampling, model_frame_sampling, \
+    stream_checkpoint_interval, stream_checkpoint_dir, stream_checkpoint_s3_prefix, stream_segments, \
+    early_exit, model_early_exit, progress_event_interval, progress_event_flush_interval, \
+    progress_event_max_attempts, model_memory_budget_mb, stream_outputs, probability_artifact_top_k, \
+    probability_artifact_logits, probability_artifact_chunk_frames, working_dir
+# Imported first, so the time to first inference includes the other imports
+from utils import logger, metrics
+from services.early_exit import EarlyExitPolicy
+from services.frame_sampling import FrameSampling
+from services.job_queue import validate_job
+from services.model_registry import MODELS, ModelRegistry, get_model_spec, model_frame_size
+from services.pipeline import AnalysisPipeline
+from services.probability_artifact import ARTIFACT_EXTENSION, write_probability_artifact
+from services.progress_events import EventPublisher, ProgressReporter
+from services.result_cache import ResultCache
+from services.s3_service import local_video_path, object_exists, remove_local_video, upload_file
+from services.stream_checkpoint import StreamCheckpoint
 
 events_client = boto3.client('events')
+_progress_publisher = None
+
+result_cache = ResultCache(
+    result_cache_dir, result_cache_max_bytes, output_s3_bucket, result_cache_s3_prefix
+) if result_cache_enabled else None
+
+model_registry = ModelRegistry(model_memory_budget_mb * 1024**2)
+
+MODEL_TYPES = {name: spec.mode for name, spec in MODELS.items()}
+"""Maps the supported analysis model names to the VideoPredictor model type."""
+
+
+def decode_settings(model_name):
+    """Returns the frame sampling policy and the frame size of an analysis model,
+    the resolution of the model unless configured."""
+    sampling = FrameSampling.parse(model_frame_sampling.get(model_name, frame_sampling))
+    size = model_frame_size(model_name)
+    return sampling, (size, size)
+
+
+def early_exit_policy(model_name, model_type):
+    """Returns the early exit policy of an analysis model, only stream models exit early."""
+    if model_type != "stream" or stream_segments > 1:
+        return EarlyExitPolicy()
+    return EarlyExitPolicy.parse(model_early_exit.get(model_name, early_exit))
 
 
 def default_serializer(obj):
@@ -21,92 +61,386 @@ def default_serializer(obj):
     raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
 
 
-if __name__ == "__main__":
-    logger.log_info(f"input_video_s3_bucket={input_video_s3_bucket}")
-    logger.log_info(f"video_s3_key={video_s3_key}")
-    logger.log_info(f"user_id={user_id}")
-    logger.log_info(f"file_id={file_id}")
-    logger.log_info(f"analysis_id={analysis_id}")
-    logger.log_info(f"model_name={model_name}")
+def load_predictor(model_name):
+    """Imports TensorFlow and returns the predictor of the model from the registry.
+
+    The import is deferred to here since the pipeline loads the predictor while
+    the video is already downloading and decoding, so they overlap.
+    """
+    return model_registry.get(model_name)
+
+
+def progress_publisher():
+    """Returns the EventPublisher of the progress events, shared by the jobs of
+    the process so their events are batched together."""
+    global _progress_publisher
+    if _progress_publisher is None or _progress_publisher.client is not events_client:
+        _progress_publisher = EventPublisher(
+            events_client, progress_event_flush_interval, progress_event_max_attempts
+        )
+    return _progress_publisher
+
+
+def progress_reporter(job, model_type):
+    """Returns the ProgressReporter of a stream analysis, or None if disabled."""
+    if model_type != "stream" or progress_event_interval <= 0 or stream_segments > 1:
+        return None
+    return ProgressReporter(progress_publisher(), job, event_bus_name, progress_event_interval)
+
+
+def publish_file_analyzed(job, output, job_metrics=None):
+    """Puts the 'FileAnalyzed' event with the JSON encoded analysis output.
+
+    The job's metrics summary is logged first, and attached to the event when
+    `attach_metrics_to_event` is enabled. `job_metrics` defaults to the
+    current job's.
+    """
+    event_payload = {
+        "userId": job["user_id"],
+        "fileId": job["file_id"],
+        "analysisId": job["analysis_id"],
+        "data": {
+            "model": job["model_name"],
+            "output": output
+        }
+    }
+    summary = (job_metrics or metrics.current()).emit()
+    if attach_metrics_to_event:
+        event_payload["metrics"] = summary
+    if _progress_publisher:
+        # The progress events of the analysis are sent before its result
+        _progress_publisher.flush()
+    event = {
+        'Entries': [
+            {
+                'Source': 'var.analysis_core',
+                'DetailType': 'FileAnalyzed',
+                'Detail': json.dumps(event_payload),
+                'EventBusName': event_bus_name
+            }
+        ]
+    }
+    response = events_client.put_events(**event)
+    print(f"Event published to EventBridge: 'FileAnalyzed'.", response)
+
+
+def analysis_version(model_name, sampling, image_size, exit_policy=None):
+    """Identifies the model, decode and early exit settings, whose results
+    differ from other ones."""
+    from services.video_predictor import VideoPredictor
+
+    version = VideoPredictor.model_version(model_name)
+    if sampling.policy != "all":
+        version += f"-{sampling}"
+    resolution = get_model_spec(model_name).resolution
+    if image_size != (resolution, resolution):
+        version += f"-{image_size[0]}px"
+    if exit_policy and exit_policy.enabled:
+        version += f"-exit-{exit_policy}"
+    return version
+
+
+def result_cache_lookup(model_name, sampling, image_size, job_metrics, cached, exit_policy=None):
+    """Returns an `on_downloaded` pipeline callback looking up the result cache.
+
+    The callback stores the cache key and entry in the `cached` dict, and
+    cancels the inference still running in the pipeline on a cache hit.
+    """
+
+    def check_result_cache(_, digest):
+        if not result_cache:
+            return False
+        model_version = analysis_version(model_name, sampling, image_size, exit_policy)
+        cached["key"] = ResultCache.key_from_digest(digest, model_name, model_version)
+        with job_metrics.span("cache_lookup"):
+            cached["entry"] = result_cache.get(cached["key"])
+        job_metrics.count("cache_hits" if cached["entry"] else "cache_misses")
+        return cached["entry"] is not None
+
+    return check_result_cache
+
+
+def upload_probability_artifact(job, predictor, s3_key, version):
+    """Writes the per frame predictions of a stream analysis to a probability
+    artifact and uploads it, so clients can draw the plot themselves.
+
+    The artifact metadata holds the decode settings of the analysis, so the
+    plot video can be rendered again offline, see `render_probabilities.py`.
+    """
+    fps = predictor.sampled_fps
+    if fps is None:
+        logger.log_warning("Unknown video duration, assuming 8 analyzed frames per second")
+        fps = 8.0
+    probs = predictor.probs.numpy()
+    logits, logits_source = None, "model"
+    if probability_artifact_logits:
+        logits = predictor.logits.numpy() if predictor.logits is not None else None
+        if logits is None:
+            # Restored from the result cache, the log probabilities have the same softmax
+            logits, logits_source = np.log(np.maximum(probs, np.finfo(np.float32).tiny)), "log_probs"
+
+    local_path = os.path.join(working_dir, "videos", f"{job['analysis_id']}{ARTIFACT_EXTENSION}")
+    size = write_probability_artifact(
+        local_path,
+        probs,
+        predictor.KINETICS_600_LABELS_LIST,
+        fps,
+        top_k=probability_artifact_top_k,
+        plot_k=predictor.k,
+        logits=logits,
+        logits_source=logits_source,
+        chunk_frames=probability_artifact_chunk_frames,
+        metadata={
+            "model": job["model_name"],
+            "model_version": version,
+            "image_size": list(predictor.frames.image_size),
+            "chunk_size": predictor.frames.chunk_size,
+            "sampling": str(predictor.frames.sampling),
+            "video_duration": predictor.frames.duration,
+            "early_exit": predictor.early_exit_report,
+        },
+    )
+    logger.log_info(f"Probability artifact of {predictor.num_frames} frames: {size} bytes")
+    try:
+        return upload_file(output_s3_bucket, s3_key, local_path)
+    finally:
+        os.remove(local_path)
+
+
+def process_job(job):
+    """Runs a single analysis job: download, predict, render and publish the result.
+
+    Args:
+      job: a dict with the `bucket`, `video_key`, `user_id`, `file_id`,
+        `analysis_id` and `model_name` of the analysis.
+    """
+    for field in job:
+        if not field.startswith("_"):
+            logger.log_info(f"{field}={job[field]}")
     logger.log_info(f"event_bus_name={event_bus_name}")
 
-    if not input_video_s3_bucket or not video_s3_key or not user_id or not file_id or not analysis_id or not event_bus_name or not model_name:
+    if validate_job(job) or not event_bus_name:
         logger.log_warning("No data provided")
-    else:
-        vide_path = download_video(input_video_s3_bucket, video_s3_key)
-        if not vide_path:
-            logger.log_warning("Could not download file.")
+        return
+
+    model_type = MODEL_TYPES.get(job["model_name"])
+    if model_type is None:
+        logger.log_warning(f"Unsupported model: {job['model_name']}")
+        return
+
+    # Removed once the result is published, the stream render decodes it again
+    vide_path = local_video_path(job["video_key"])
+    try:
+        job_metrics = metrics.start_job(
+            dimensions={"model": job["model_name"]},
+            properties={"analysisId": job["analysis_id"], "fileId": job["file_id"]},
+        )
+        video_key = job["video_key"]
+        sampling, image_size = decode_settings(job["model_name"])
+        exit_policy = early_exit_policy(job["model_name"], model_type)
+        cached = {}
+        check_result_cache = result_cache_lookup(
+            job["model_name"], sampling, image_size, job_metrics, cached, exit_policy
+        )
+
+        checkpoint = None
+        if model_type == "stream" and stream_checkpoint_interval > 0 and stream_segments <= 1:
+            # A task replacing an interrupted one resumes from the last checkpoint
+            checkpoint = StreamCheckpoint(
+                job["analysis_id"], analysis_version(job["model_name"], sampling, image_size, exit_policy),
+                stream_checkpoint_dir, stream_checkpoint_interval,
+                output_s3_bucket, stream_checkpoint_s3_prefix,
+            )
+
+        progress = progress_reporter(job, model_type)
+
+        # Download, decode and inference run concurrently. Only the stream model
+        # decodes the video again for rendering, the base model can skip the local file.
+        pipeline = AnalysisPipeline(job["bucket"], video_key, vide_path, image_size=image_size,
+                                    keep_file=model_type == "stream", on_downloaded=check_result_cache,
+                                    sampling=sampling, checkpoint=checkpoint, early_exit=exit_policy,
+                                    progress=progress)
+        try:
+            top5_predictions = pipeline.run(lambda: load_predictor(job["model_name"]))
+        except Exception as error:
+            logger.log_error(f"Analysis pipeline failed: {error}")
+            return
+
+        entry = cached.get("entry")
+        if entry:
+            top5_predictions = entry[0]
         else:
-            if model_name == "a2-base-kinetics-600-classification":
-                # Recognize the action in average for the whole video
-                predictor = VideoPredictor("base")
-                top5_predictions = predictor.run_prediction(vide_path)
-                for label, prob in top5_predictions:
-                    print(f"{label:20s}: {prob:.3f}")
-
-                # Put the event
-                event_payload = {
-                    "userId": user_id,
-                    "fileId": file_id,
-                    "analysisId": analysis_id,
-                    "data": {
-                        "model": model_name,
-                        "output": json.dumps({
-                            "predictions": top5_predictions
-                        }, default=default_serializer)
-                    }
-                }
-                event = {
-                    'Entries': [
-                        {
-                            'Source': 'var.analysis_core',
-                            'DetailType': 'FileAnalyzed',
-                            'Detail': json.dumps(event_payload),
-                            'EventBusName': event_bus_name
-                        }
-                    ]
-                }
-                response = events_client.put_events(**event)
-                print(f"Event published to EventBridge: 'FileAnalyzed'.", response)
-
-            elif model_name == "a2-stream-kinetics-600-classification":
-                # Generate a plot and output to a video tensor
-                predictor = VideoPredictor("stream")
-                top5_predictions = predictor.run_prediction(vide_path)
+            num_frames = pipeline.predictor.num_frames
+            job_metrics.count("frames", num_frames)
+            inference_seconds = job_metrics.timings["inference"] - job_metrics.timings.get("inference_wait", 0.0)
+            if inference_seconds > 0:
+                job_metrics.gauge("inference_fps", num_frames / inference_seconds, "Count/Second")
+            if result_cache:
+                result_cache.put(cached["key"], top5_predictions, pipeline.predictor.probs)
+            if progress:
+                # The predictions are final, only the rendering is left
+                progress.report(num_frames, top5_predictions, num_frames, stage="render")
+        if checkpoint:
+            checkpoint.clear()
+
+        if model_type == "base":
+            for label, prob in top5_predictions:
+                print(f"{label:20s}: {prob:.3f}")
+
+            publish_file_analyzed(job, json.dumps({
+                "predictions": top5_predictions
+            }, default=default_serializer))
+
+        elif model_type == "stream":
+            base_name_with_ext = os.path.basename(video_key)
+            base_name, extension = os.path.splitext(base_name_with_ext)
+            output_file_key = video_key.replace(base_name_with_ext,
+                                                f"{base_name}/{job['model_name']}{extension}")
+            artifact_key = video_key.replace(base_name_with_ext,
+                                             f"{base_name}/{job['model_name']}{ARTIFACT_EXTENSION}")
+
+            output = {}
+            if "video" in stream_outputs:
+                output["output_file_path"] = output_file_key
+            if "probabilities" in stream_outputs:
+                output["probabilities_file_path"] = artifact_key
+            if entry and all(object_exists(output_s3_bucket, key) for key in output.values()):
+                logger.log_info(f"Reusing the outputs {', '.join(output.values())}")
+                publish_file_analyzed(job, json.dumps(output))
+                return
+
+            predictor = load_predictor(job["model_name"])
+            if entry:
+                # Only the outputs are missing, skip the inference
+                predictor.restore_prediction(vide_path, entry[1], sampling, image_size, exit_policy)
+
+            if "probabilities" in stream_outputs:
+                with job_metrics.span("probability_artifact"):
+                    upload_probability_artifact(
+                        job, predictor, artifact_key,
+                        analysis_version(job["model_name"], sampling, image_size, exit_policy),
+                    )
 
+            if "video" in stream_outputs:
+                # Matplotlib and the renderer are only imported when a plot is rendered
+                from services.results_service import ResultsService
+
+                # Generate a plot and output to a video tensor
                 logger.log_info("Generating the output streaming plot output...")
                 results_service = ResultsService(predictor)
-                output_file_path = results_service.generate_stream_output(
-                    input_video_s3_key=video_s3_key
-                )
-
-                base_name_with_ext = os.path.basename(video_s3_key)
-                base_name, extension = os.path.splitext(base_name_with_ext)
-                output_file_key = video_s3_key.replace(base_name_with_ext,
-                                                       f"{base_name}/a2-stream-kinetics-600-classification{extension}")
-                upload_video(output_s3_bucket, output_file_key, output_file_path)
-
-                # Put the event
-                event_payload = {
-                    "userId": user_id,
-                    "fileId": file_id,
-                    "analysisId": analysis_id,
-                    "data": {
-                        "model": model_name,
-                        "output": json.dumps({
-                            "output_file_path": output_file_key
-                        })
-                    }
-                }
-                event = {
-                    'Entries': [
-                        {
-                            'Source': 'var.analysis_core',
-                            'DetailType': 'FileAnalyzed',
-                            'Detail': json.dumps(event_payload),
-                            'EventBusName': event_bus_name
-                        }
-                    ]
-                }
-                response = events_client.put_events(**event)
-                print(f"Event published to EventBridge: 'FileAnalyzed'.", response)
+                # Rendering, encoding and uploading overlap, so they are timed as one stage
+                with job_metrics.span("render"):
+                    results_service.generate_stream_output(
+                        input_video_s3_key=video_key,
+                        output_s3_bucket=output_s3_bucket,
+                        output_s3_key=output_file_key,
+                    )
+                job_metrics.rate("render_fps", predictor.num_frames, "render")
+
+            if predictor.early_exit_report:
+                output["early_exit"] = predictor.early_exit_report
+            publish_file_analyzed(job, json.dumps(output))
+    finally:
+        remove_local_video(vide_path)
+
+
+def process_base_jobs(jobs):
+    """Runs several base model jobs, analyzing their videos in batches.
+
+    The videos are downloaded and decoded concurrently, one pipeline per job,
+    then the ones missing from the result cache run through their base model
+    together, see `VideoPredictor.predict_batch_top_k`. Each job publishes its
+    own 'FileAnalyzed' event, as with `process_job`.
+
+    Args:
+      jobs: job dicts of base models, see `process_job`.
+    """
+    jobs = [
+        job for job in jobs
+        if not validate_job(job) and MODEL_TYPES.get(job["model_name"]) == "base"
+    ]
+    if not jobs or not event_bus_name:
+        logger.log_warning("No base model jobs to run")
+        return
+    # Removed once the jobs are published, the videos are only decoded once
+    local_paths = [local_video_path(job["video_key"]) for job in jobs]
+    try:
+        fetched = [None] * len(jobs)
+
+        def fetch(index, job):
+            job_metrics = metrics.JobMetrics(
+                dimensions={"model": job["model_name"]},
+                properties={"analysisId": job["analysis_id"], "fileId": job["file_id"]},
+            )
+            sampling, image_size = decode_settings(job["model_name"])
+            cached = {}
+            pipeline = AnalysisPipeline(
+                job["bucket"],
+                job["video_key"],
+                local_paths[index],
+                image_size=image_size,
+                keep_file=False,
+                on_downloaded=result_cache_lookup(
+                    job["model_name"], sampling, image_size, job_metrics, cached
+                ),
+                job_metrics=job_metrics,
+                sampling=sampling,
+            )
+            try:
+                frames = pipeline.fetch_frames()
+            except Exception as error:
+                logger.log_error(f"Analysis pipeline of job {job['analysis_id']} failed: {error}")
+                return
+            fetched[index] = (job, job_metrics, cached, frames)
+
+        threads = [threading.Thread(target=fetch, args=item) for item in enumerate(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # In the order of the jobs, without the failed ones
+        fetched = [item for item in fetched if item is not None]
+
+        missed = [item for item in fetched if not item[2].get("entry")]
+        # The videos of each model are analyzed together
+        for model_name in dict.fromkeys(job["model_name"] for job, *_ in missed):
+            analyzed = [item for item in missed if item[0]["model_name"] == model_name]
+            start = time.perf_counter()
+            predictor = load_predictor(model_name)
+            model_load_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            predictions = predictor.predict_batch_top_k([frames for *_, frames in analyzed])
+            inference_seconds = time.perf_counter() - start
+            for (job, job_metrics, cached, frames), top_k, probs in zip(
+                analyzed, predictions, predictor.batch_probs
+            ):
+                # The model load and the batched inference are shared by the jobs
+                job_metrics.add_timing("model_load", model_load_seconds)
+                job_metrics.add_timing("inference", inference_seconds)
+                job_metrics.count("frames", frames.shape[0])
+                job_metrics.gauge("batch_jobs", len(analyzed))
+                metrics.record_first_inference(job_metrics)
+                cached["top_k"] = top_k
+                if result_cache:
+                    result_cache.put(cached["key"], top_k, probs)
+
+        for job, job_metrics, cached, _ in fetched:
+            entry = cached.get("entry")
+            top5_predictions = entry[0] if entry else cached["top_k"]
+            publish_file_analyzed(job, json.dumps({
+                "predictions": top5_predictions
+            }, default=default_serializer), job_metrics)
+    finally:
+        for local_path in local_paths:
+            remove_local_video(local_path)
+
+
+if __name__ == "__main__":
+    process_job({
+        "bucket": input_video_s3_bucket,
+        "video_key": video_s3_key,
+        "user_id": user_id,
+        "file_id": file_id,
+        "analysis_id": analysis_id,
+        "model_name": model_name,
+    })
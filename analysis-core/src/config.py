@@ -1,5 +1,12 @@
+import os
 from os import getenv
 
+
+def _mapping(name):
+    """Parses a comma separated list of key=value pairs, e.g. per model settings."""
+    return dict(item.split("=", 1) for item in getenv(name, "").split(",") if item)
+
+
 working_dir = getenv("WORKING_DIR")
 input_video_s3_bucket = getenv("INPUT_VIDEO_S3_BUCKET")
 output_s3_bucket = getenv("INPUT_VIDEO_S3_BUCKET")
@@ -13,3 +20,57 @@ file_id = getenv("FILE_ID")
 analysis_id = getenv("ANALYSIS_ID")
 event_bus_name = getenv("EVENT_BUS_NAME")
 model_name = getenv("MODEL_NAME")
+frame_chunk_size = int(getenv("FRAME_CHUNK_SIZE", "32"))
+stream_clip_size = int(getenv("STREAM_CLIP_SIZE", "8"))
+job_queue_dir = getenv("JOB_QUEUE_DIR", f"{working_dir}/jobs")
+worker_preload_models = [m for m in getenv("WORKER_PRELOAD_MODELS", "").split(",") if m]
+worker_exit_when_idle = getenv("WORKER_EXIT_WHEN_IDLE", "false").lower() == "true"
+result_cache_enabled = getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+result_cache_dir = getenv("RESULT_CACHE_DIR", f"{working_dir}/cache")
+result_cache_max_bytes = int(getenv("RESULT_CACHE_MAX_BYTES", str(2 * 1024**3)))
+result_cache_s3_prefix = getenv("RESULT_CACHE_S3_PREFIX")
+render_workers = int(getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+render_min_segment_frames = int(getenv("RENDER_MIN_SEGMENT_FRAMES", "250"))
+output_video_codec = getenv("OUTPUT_VIDEO_CODEC", "libx264")
+output_video_crf = int(getenv("OUTPUT_VIDEO_CRF", "25"))
+output_video_preset = getenv("OUTPUT_VIDEO_PRESET", "medium")
+stream_upload = getenv("STREAM_UPLOAD", "true").lower() == "true"
+s3_upload_part_size = int(getenv("S3_UPLOAD_PART_SIZE", str(8 * 1024**2)))
+pipeline_queue_size = int(getenv("PIPELINE_QUEUE_SIZE", "4"))
+s3_download_part_size = int(getenv("S3_DOWNLOAD_PART_SIZE", str(8 * 1024**2)))
+s3_download_concurrency = int(getenv("S3_DOWNLOAD_CONCURRENCY", "8"))
+log_format = getenv("LOG_FORMAT", "text")
+metrics_format = getenv("METRICS_FORMAT", "json")
+metrics_namespace = getenv("METRICS_NAMESPACE", "VideoActionRecognizer/AnalysisCore")
+metrics_dir = getenv("METRICS_DIR")
+attach_metrics_to_event = getenv("ATTACH_METRICS_TO_EVENT", "false").lower() == "true"
+inference_model_dir = getenv("INFERENCE_MODEL_DIR", f"{working_dir}/models/inference")
+model_warmup = getenv("MODEL_WARMUP", "false").lower() == "true"
+inference_backend = getenv("INFERENCE_BACKEND", "tf")
+inference_backends = _mapping("INFERENCE_BACKENDS")
+tflite_num_threads = int(getenv("TFLITE_NUM_THREADS", "0")) or None
+frame_sampling = getenv("FRAME_SAMPLING", "all")
+model_frame_sampling = _mapping("MODEL_FRAME_SAMPLING")
+frame_size = int(getenv("FRAME_SIZE", "0")) or None
+model_frame_sizes = {name: int(size) for name, size in _mapping("MODEL_FRAME_SIZE").items()}
+base_batch_size = int(getenv("BASE_BATCH_SIZE", "8"))
+base_batch_frames = int(getenv("BASE_BATCH_FRAMES", "1024"))
+base_batch_padding = float(getenv("BASE_BATCH_PADDING", "0"))
+worker_batch_size = int(getenv("WORKER_BATCH_SIZE", "1"))
+worker_layout = getenv("WORKER_LAYOUT", "default")
+stream_segments = int(getenv("STREAM_SEGMENTS", "1"))
+stream_segment_warmup = int(getenv("STREAM_SEGMENT_WARMUP", "16"))
+stream_segment_workers = int(getenv("STREAM_SEGMENT_WORKERS", "0")) or None
+stream_checkpoint_interval = float(getenv("STREAM_CHECKPOINT_INTERVAL", "0"))
+stream_checkpoint_dir = getenv("STREAM_CHECKPOINT_DIR", f"{working_dir}/checkpoints")
+stream_checkpoint_s3_prefix = getenv("STREAM_CHECKPOINT_S3_PREFIX")
+early_exit = getenv("EARLY_EXIT", "off")
+model_early_exit = _mapping("MODEL_EARLY_EXIT")
+progress_event_interval = float(getenv("PROGRESS_EVENT_INTERVAL", "5"))
+progress_event_flush_interval = float(getenv("PROGRESS_EVENT_FLUSH_INTERVAL", "1"))
+progress_event_max_attempts = int(getenv("PROGRESS_EVENT_MAX_ATTEMPTS", "5"))
+model_memory_budget_mb = float(getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+stream_outputs = [o for o in getenv("STREAM_OUTPUTS", "video").split(",") if o]
+probability_artifact_top_k = int(getenv("PROBABILITY_ARTIFACT_TOP_K", "10"))
+probability_artifact_logits = getenv("PROBABILITY_ARTIFACT_LOGITS", "false").lower() == "true"
+probability_artifact_chunk_frames = int(getenv("PROBABILITY_ARTIFACT_CHUNK_FRAMES", "256"))
@@ -0,0 +1,146 @@
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from config import inference_model_dir
+from services.tflite_backend import (
+    QUANTIZATIONS,
+    TFLiteBackend,
+    convert_to_tflite,
+    init_states_path,
+    tflite_model_path,
+)
+from services.model_registry import MODELS, get_model_spec
+from services.video_predictor import VideoPredictor
+from utils import logger
+
+
+def load_hub_predictor(model_name):
+    """Loads the hub model of a model name or mode, whatever the exports and backends."""
+    spec = get_model_spec(model_name)
+    VideoPredictor._instances.pop(spec.export_name, None)
+    predictor = VideoPredictor.__new__(VideoPredictor, model_name)
+    predictor.spec = spec
+    predictor.model_type = spec.mode
+    predictor.backend = "tf"
+    predictor.load_movinet_from_hub(spec)
+    return predictor
+
+
+def logit_difference(predictor, steps, num_frames=8, image_size=None):
+    """Compares exported steps with the hub model on a random clip.
+
+    Args:
+      predictor: the VideoPredictor with the hub model.
+      steps: the (base_step, init_states_fn, stream_step) of the exported model.
+
+    Returns:
+      The largest absolute difference between the logits of both models.
+    """
+    base_step, init_states_fn, stream_step = steps
+    height, width = image_size or (predictor.spec.resolution, predictor.spec.resolution)
+    clip = tf.random.uniform([1, num_frames, height, width, 3], seed=0)
+
+    if predictor.model_type == "base":
+        expected = predictor.base_step(clip)
+        actual = base_step(clip)
+    else:
+        shape = tf.constant([1, 1, height, width, 3])
+        expected, _ = predictor.stream_step(predictor.init_states_fn(shape), clip)
+        actual, _ = stream_step(init_states_fn(shape), clip)
+    return float(np.max(np.abs(np.asarray(expected) - np.asarray(actual))))
+
+
+def export_models(model_names, export_root=inference_model_dir, quantizations=(), force=False):
+    """Exports the inference-only models of each model from the hub models.
+
+    Args:
+      model_names: the model names or modes to export, e.g. ["base", "stream",
+        "a0-stream-kinetics-600-classification"].
+      export_root: the directory receiving one SavedModel per model and the
+        TFLite models.
+      quantizations: the TFLite conversions to make, see `QUANTIZATIONS`.
+      force: replace the existing exports.
+    """
+    for model_name in model_names:
+        spec = get_model_spec(model_name)
+        model_type = spec.mode
+        export_dir = f"{export_root}/{spec.export_name}"
+        export_saved_model = force or not os.path.exists(export_dir)
+        conversions = [
+            quantization
+            for quantization in quantizations
+            if force
+            or not os.path.exists(tflite_model_path(export_root, spec.export_name, quantization))
+        ]
+        if not export_saved_model and not conversions:
+            logger.log_info(f"The {spec.name} model is already exported: {export_dir}")
+            continue
+
+        predictor = load_hub_predictor(model_name)
+        if export_saved_model:
+            shutil.rmtree(export_dir, ignore_errors=True)
+            start = time.perf_counter()
+            predictor.export_inference_model(export_dir)
+            logger.log_info(
+                f"Exported the {spec.name} model to {export_dir} in {time.perf_counter() - start:.2f}s"
+            )
+
+            exported = tf.saved_model.load(export_dir)
+            steps = (
+                getattr(exported, "base_step", None),
+                getattr(exported, "init_states", None),
+                getattr(exported, "stream_step", None),
+            )
+            difference = logit_difference(predictor, steps)
+            if difference > 1e-3:
+                raise RuntimeError(
+                    f"The exported {spec.name} model differs from the hub model by {difference}"
+                )
+            logger.log_info(f"Max logit difference of the exported {spec.name} model: {difference:.2e}")
+
+        for quantization in conversions:
+            model_path = convert_to_tflite(predictor, export_root, quantization)
+            backend = TFLiteBackend(
+                model_path, model_type, init_states=init_states_path(export_root, spec.export_name)
+            )
+            difference = logit_difference(
+                predictor, (backend.base_step, backend.init_states_fn, backend.stream_step)
+            )
+            # Quantized models are expected to differ, run benchmarks/backend_parity.py
+            # to compare their top-k predictions
+            logger.log_info(
+                f"Max logit difference of the {quantization} TFLite {spec.name} model: {difference:.2e}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Exports the inference-only models loaded at startup."
+    )
+    parser.add_argument(
+        "--models",
+        default="base,stream",
+        help="comma separated model names to export, or base and stream for the A2 models",
+    )
+    parser.add_argument(
+        "--tflite",
+        default="",
+        help=f"comma separated TFLite conversions to make, of {', '.join(QUANTIZATIONS)}",
+    )
+    parser.add_argument("--force", action="store_true", help="replace existing exports")
+    args = parser.parse_args()
+
+    model_names = [m for m in args.models.split(",") if m]
+    unsupported = set(model_names) - set(MODELS) - {"base", "stream"}
+    if unsupported:
+        parser.error(f"unsupported models: {', '.join(sorted(unsupported))}")
+    quantizations = [q for q in args.tflite.split(",") if q]
+    unsupported = set(quantizations) - set(QUANTIZATIONS)
+    if unsupported:
+        parser.error(f"unsupported TFLite conversions: {', '.join(sorted(unsupported))}")
+    export_models(model_names, quantizations=quantizations, force=args.force)
@@ -0,0 +1,46 @@
+import argparse
+import os
+import tempfile
+
+from services.probability_artifact import ProbabilityArtifact, render_plot_video
+from utils import logger
+
+
+def open_artifact(location):
+    """Opens a probability artifact from a local path or an s3://bucket/key URL."""
+    if location.startswith("s3://"):
+        bucket, _, s3_key = location[len("s3://") :].partition("/")
+        return ProbabilityArtifact.from_s3(bucket, s3_key)
+    return ProbabilityArtifact.open(location)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Renders the streaming plot video of a stream analysis from its probability artifact."
+    )
+    parser.add_argument("artifact", help="the artifact path, or its s3://bucket/key URL")
+    parser.add_argument("output", help="the output video path, an MP4 or a GIF")
+    parser.add_argument("--video", help="the analyzed video shown above the plot, none by default")
+    parser.add_argument("--start", type=float, help="renders from this time in seconds")
+    parser.add_argument("--end", type=float, help="renders until this time in seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="render processes")
+    parser.add_argument("--figure-height", type=int, default=500, help="output video height")
+    args = parser.parse_args()
+
+    artifact = open_artifact(args.artifact)
+    logger.log_info(
+        f"{artifact.num_frames} frames over {artifact.duration_seconds:.1f}s,"
+        f" plotting {', '.join(artifact.plot_labels)}"
+    )
+    with tempfile.TemporaryDirectory() as work_dir:
+        render_plot_video(
+            artifact,
+            args.output,
+            video_path=args.video,
+            work_dir=work_dir,
+            num_workers=args.workers,
+            figure_height=args.figure_height,
+            start_seconds=args.start,
+            end_seconds=args.end,
+        )
+    logger.log_info(f"Rendered {args.output}")
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+def length_buckets(lengths, max_batch_size, max_batch_frames=None, max_padding=0.0):
+    """Groups videos of similar lengths into batches.
+
+    The videos are taken by decreasing length, so each batch starts with its
+    longest video and the others are padded to it. Sorting makes the grouping
+    a single pass over the videos.
+
+    Args:
+      lengths: the number of frames of each video.
+      max_batch_size: the maximum number of videos per batch.
+      max_batch_frames: the maximum number of padded frames per batch, which
+        bounds the memory of a model call. A longer video gets a batch of its own.
+      max_padding: the largest fraction of padded frames of a video, relative
+        to the longest video of its batch. 0 only batches videos of the same length.
+
+    Returns:
+      Lists of indices into `lengths`, one per batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches = []
+    for index in order:
+        batch = batches[-1] if batches else None
+        if batch:
+            longest = lengths[batch[0]]
+            fits = (
+                len(batch) < max_batch_size
+                and longest - lengths[index] <= max_padding * longest
+                and (max_batch_frames is None or (len(batch) + 1) * longest <= max_batch_frames)
+            )
+            if fits:
+                batch.append(index)
+                continue
+        batches.append([index])
+    return batches
+
+
+def pad_frames(video, num_frames):
+    """Pads a video of shape (frames, height, width, 3) by repeating its last frame."""
+    missing = num_frames - video.shape[0]
+    if missing <= 0:
+        return video
+    return np.concatenate([video, np.repeat(video[-1:], missing, axis=0)])
@@ -0,0 +1,139 @@
+import numpy as np
+
+
+class EarlyExitPolicy:
+    """When the stream model may stop before the last frame of a video.
+
+    The top-k summary of a stream analysis only uses the probabilities of the
+    last analyzed frame, so the analysis can stop once they settle:
+
+    - "stable:<n>": the top-k classes stayed the same for n frames, with a
+      margin between the top-1 and top-2 probabilities of at least
+      "margin:<p>" (0 by default).
+    - "confidence:<p>": the top-1 probability reached p.
+    - "coverage:<fraction>": never stop before this fraction of the frames.
+
+    Options are joined with "+", e.g. "stable:24+margin:0.1+coverage:0.25".
+    "off" disables early exits.
+    """
+
+    OPTIONS = ("stable", "margin", "confidence", "coverage")
+
+    def __init__(self, stable=0, margin=0.0, confidence=None, coverage=0.0):
+        if stable < 0 or margin < 0 or not 0 <= coverage <= 1:
+            raise ValueError("Invalid early exit policy")
+        if confidence is not None and not 0 < confidence <= 1:
+            raise ValueError("The early exit confidence must be in (0, 1]")
+        self.stable = stable
+        self.margin = margin
+        self.confidence = confidence
+        self.coverage = coverage
+
+    @classmethod
+    def parse(cls, spec):
+        """Parses a policy such as "stable:24+margin:0.1", "confidence:0.9" or "off"."""
+        options = {}
+        if spec and spec != "off":
+            for option in spec.split("+"):
+                name, _, value = option.partition(":")
+                if name not in cls.OPTIONS:
+                    raise ValueError(f"Unsupported early exit option: {name}")
+                options[name] = int(value) if name == "stable" else float(value)
+        return cls(**options)
+
+    def __str__(self):
+        if not self.enabled:
+            return "off"
+        options = [
+            ("stable", self.stable),
+            ("margin", self.margin),
+            ("confidence", self.confidence),
+            ("coverage", self.coverage),
+        ]
+        return "+".join(f"{name}:{value:g}" for name, value in options if value)
+
+    @property
+    def enabled(self):
+        return self.stable > 0 or self.confidence is not None
+
+    def monitor(self, k, frame_index=0, expected_frames=None):
+        """Returns an EarlyExitMonitor applying the policy to one analysis."""
+        return EarlyExitMonitor(self, k, frame_index, expected_frames)
+
+
+class EarlyExitMonitor:
+    """Follows the per-frame probabilities of one analysis against a policy."""
+
+    def __init__(self, policy, k, frame_index=0, expected_frames=None):
+        """
+        Args:
+          policy: the EarlyExitPolicy.
+          k: the number of top classes that must stay stable.
+          frame_index: the number of frames analyzed before, e.g. on resume.
+          expected_frames: a callable returning the expected number of
+            analyzed frames, or None while unknown. Needed for the coverage.
+        """
+        self.policy = policy
+        self.k = k
+        self.frame_index = frame_index
+        self.expected_frames = expected_frames or (lambda: None)
+        self.reason = None
+        self._top = None
+        self._stable_frames = 0
+
+    def covered(self):
+        """Whether enough of the frames are analyzed to stop."""
+        if not self.policy.coverage:
+            return True
+        expected_frames = self.expected_frames()
+        # Without an estimate of the frames, the analysis goes on
+        return expected_frames is not None and self.frame_index >= self.policy.coverage * expected_frames
+
+    def update(self, probs):
+        """Follows the probabilities of the next frames.
+
+        Args:
+          probs: the probabilities of shape (frames, num_classes).
+
+        Returns:
+          Whether the analysis can stop after these frames.
+        """
+        probs = np.asarray(probs)
+        top = np.argpartition(-probs, self.k, axis=-1)[:, : self.k]
+        top2 = np.partition(probs, probs.shape[-1] - 2, axis=-1)[:, -2:]
+        margins = top2[:, 1] - top2[:, 0]
+        start = self.frame_index
+        for offset, (frame_top, top1, margin) in enumerate(zip(top, top2[:, 1], margins)):
+            self.frame_index = start + offset + 1
+            frame_top = frozenset(frame_top.tolist())
+            if frame_top == self._top and margin >= self.policy.margin:
+                self._stable_frames += 1
+            else:
+                self._stable_frames = 1 if margin >= self.policy.margin else 0
+            self._top = frame_top
+
+            if self.policy.confidence is not None and top1 >= self.policy.confidence:
+                self.reason = "confidence"
+            elif self.policy.stable and self._stable_frames >= self.policy.stable:
+                self.reason = "stable"
+            else:
+                continue
+            if self.covered():
+                # The frames after this one are analyzed already
+                self.frame_index = start + probs.shape[0]
+                return True
+            self.reason = None
+        return False
+
+    def report(self):
+        """Summarizes the policy outcome, e.g. for the analysis event."""
+        expected_frames = self.expected_frames()
+        frames_saved = max(expected_frames - self.frame_index, 0) if expected_frames else None
+        return {
+            "policy": str(self.policy),
+            "exited": self.reason is not None or bool(frames_saved),
+            "reason": self.reason,
+            "frames_analyzed": self.frame_index,
+            "expected_frames": expected_frames,
+            "frames_saved": frames_saved,
+        }
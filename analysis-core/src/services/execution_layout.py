@@ -0,0 +1,123 @@
+import os
+
+from utils import logger
+
+
+def available_cpus():
+    """Returns the sorted CPUs this process may run on, e.g. within a container's cpuset."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def configure_tf_threads(intra_op, inter_op):
+    """Sets the TensorFlow thread pools of this process, before its first op.
+
+    Args:
+      intra_op: the threads of a single op, e.g. a convolution, 0 keeps the
+        TensorFlow default (all CPUs).
+      inter_op: the ops run at once, 0 keeps the TensorFlow default.
+    """
+    import tensorflow as tf
+
+    try:
+        if intra_op:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        if inter_op:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError as error:
+        # TensorFlow fixes its thread pools once its runtime is initialized
+        logger.log_warning(f"Could not set the TensorFlow threads: {error}")
+
+
+class ExecutionLayout:
+    """How the worker spreads over the CPUs of its container.
+
+    - "processes:<n>": the worker processes, each with its own models, taking
+      jobs from the shared job queue (1 by default).
+    - "intra:<n>": the TensorFlow intra-op threads of each process, i.e. the
+      threads of one op. With several processes, the CPUs of a process by
+      default, otherwise the TensorFlow default (all CPUs).
+    - "inter:<n>": the TensorFlow inter-op threads of each process, i.e. the
+      ops run at once. 1 with several processes by default, otherwise the
+      TensorFlow default.
+    - "pin": pins each process to its own share of the CPUs.
+
+    Options are joined with "+", e.g. "processes:4+intra:2+inter:1+pin".
+    "default" is a single process with the TensorFlow defaults.
+    """
+
+    OPTIONS = ("processes", "intra", "inter", "pin")
+
+    def __init__(self, processes=1, intra=0, inter=0, pin=False):
+        if processes < 1 or intra < 0 or inter < 0:
+            raise ValueError("Invalid execution layout")
+        self.processes = processes
+        self.intra = intra
+        self.inter = inter
+        self.pin = pin
+
+    @classmethod
+    def parse(cls, spec):
+        """Parses a layout such as "processes:2+intra:4+pin" or "default"."""
+        options = {}
+        if spec and spec != "default":
+            for option in spec.split("+"):
+                name, _, value = option.partition(":")
+                if name not in cls.OPTIONS:
+                    raise ValueError(f"Unsupported execution layout option: {name}")
+                options[name] = True if name == "pin" else int(value)
+        return cls(**options)
+
+    def __str__(self):
+        options = [
+            ("processes", self.processes),
+            ("intra", self.intra),
+            ("inter", self.inter),
+        ]
+        spec = "+".join(f"{name}:{value}" for name, value in options if value)
+        return f"{spec}+pin" if self.pin else spec
+
+    def process_cpus(self, index, cpus=None):
+        """Returns the CPUs of the process `index`, or None if it is not pinned.
+
+        The CPUs are split into contiguous shares, as even as possible; with
+        more processes than CPUs, processes share single CPUs in turn.
+        """
+        if not self.pin:
+            return None
+        cpus = cpus or available_cpus()
+        if self.processes >= len(cpus):
+            return [cpus[index % len(cpus)]]
+        share, extra = divmod(len(cpus), self.processes)
+        start = index * share + min(index, extra)
+        return cpus[start : start + share + (index < extra)]
+
+    def threads(self, index, cpus=None):
+        """Returns the (intra_op, inter_op) threads of the process `index`, 0 for the TensorFlow default."""
+        if self.processes == 1 and not self.pin:
+            return self.intra, self.inter
+        process_cpus = self.process_cpus(index, cpus)
+        if process_cpus is not None:
+            default_intra = len(process_cpus)
+        else:
+            default_intra = max(1, len(cpus or available_cpus()) // self.processes)
+        return self.intra or default_intra, self.inter or (1 if self.processes > 1 else 0)
+
+    def configure_process(self, index):
+        """Pins the calling process and sets its TensorFlow threads, before any model is loaded.
+
+        Args:
+          index: the index of the process, in [0, processes).
+
+        Returns:
+          A dict of the process index, its CPUs (None if not pinned) and its
+          intra_op and inter_op threads.
+        """
+        cpus = available_cpus()
+        process_cpus = self.process_cpus(index, cpus)
+        if process_cpus is not None:
+            os.sched_setaffinity(0, process_cpus)
+        intra_op, inter_op = self.threads(index, cpus)
+        configure_tf_threads(intra_op, inter_op)
+        return {"process": index, "cpus": process_cpus, "intra_op": intra_op, "inter_op": inter_op}
@@ -0,0 +1,193 @@
+import math
+import re
+import subprocess
+
+import imageio_ffmpeg
+
+from utils import logger
+
+
+class FrameSampling:
+    """A temporal sampling policy of the frames fed to the model.
+
+    The policy is applied by an ffmpeg `select` filter inside the decode, so
+    dropped frames are neither scaled, copied out of ffmpeg nor analyzed:
+
+    - "all": every native frame.
+    - "fps:<rate>": the first frame of every 1/rate seconds, never more frames
+      than the native ones.
+    - "frames:<count>": at most `count` frames sampled uniformly over the
+      duration of the video.
+    - "stride:<n>": every n-th frame.
+    """
+
+    POLICIES = ("all", "fps", "frames", "stride")
+
+    def __init__(self, policy="all", value=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unsupported frame sampling policy: {policy}")
+        if policy != "all" and (value is None or value <= 0):
+            raise ValueError(f"The {policy} frame sampling needs a positive value")
+        self.policy = policy
+        self.value = value
+
+    @classmethod
+    def parse(cls, spec):
+        """Parses a policy such as "fps:8", "frames:64", "stride:2" or "all"."""
+        policy, _, value = (spec or "all").partition(":")
+        if policy == "all":
+            return cls()
+        number = float(value) if policy == "fps" else int(value)
+        return cls(policy, number)
+
+    def __str__(self):
+        return self.policy if self.policy == "all" else f"{self.policy}:{self.value:g}"
+
+    @property
+    def needs_duration(self):
+        return self.policy == "frames"
+
+    @property
+    def max_frames(self):
+        """The frame budget, or None if the number of frames is not capped."""
+        return self.value if self.policy == "frames" else None
+
+    def expected_frames(self, native_frames, duration=None):
+        """Estimates the number of sampled frames of a video of `native_frames` frames."""
+        if self.policy == "stride":
+            return math.ceil(native_frames / self.value)
+        if self.policy == "frames":
+            return min(native_frames, self.value)
+        if self.policy == "fps" and duration:
+            return min(native_frames, math.ceil(duration * self.value))
+        return native_frames
+
+    def ffmpeg_filter(self, duration=None):
+        """Returns the ffmpeg filter selecting the frames, or None for all frames.
+
+        Args:
+          duration: the video duration in seconds, needed by the "frames" policy.
+        """
+        if self.policy == "stride":
+            return f"select='not(mod(n\\,{self.value}))'"
+        if self.policy == "all":
+            return None
+
+        rate = self.value
+        if self.policy == "frames":
+            if not duration:
+                logger.log_warning(
+                    "Unknown video duration, keeping the first frames within the budget"
+                )
+                return None
+            rate = self.value / duration
+        # Keeps the first frame of every 1/rate seconds bucket, see `sampled_times`
+        return (
+            f"select='isnan(prev_selected_t)"
+            f"+gte(floor(t*{rate:.6f})\\,floor(prev_selected_t*{rate:.6f})+1)'"
+        )
+
+    def sampled_times(self, frame_times, duration=None):
+        """Returns the times of the frames `ffmpeg_filter` keeps, without decoding.
+
+        Args:
+          frame_times: the times of the native frames in seconds, from the
+            first one, see `probe_frame_times`.
+          duration: the video duration in seconds, needed by the "frames" policy.
+        """
+        if self.policy == "stride":
+            times = frame_times[:: self.value]
+        elif self.policy == "all" or (self.policy == "frames" and not duration):
+            times = frame_times
+        else:
+            # The rate as formatted in the filter expression
+            rate = float(f"{self.value if self.policy == 'fps' else self.value / duration:.6f}")
+            times = []
+            for t in frame_times:
+                if not times or math.floor(t * rate) >= math.floor(times[-1] * rate) + 1:
+                    times.append(t)
+        return times[: self.max_frames]
+
+
+def _copy_packets(file_path, output_format="null"):
+    """Runs a stream copy of the video packets, which decodes nothing.
+
+    Returns:
+      The completed process, with the muxer output and the ffmpeg log as text.
+    """
+    return subprocess.run(
+        [
+            imageio_ffmpeg.get_ffmpeg_exe(),
+            "-hide_banner",
+            "-i", file_path,
+            "-map", "0:v:0",
+            "-c", "copy",
+            "-f", output_format,
+            "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def probe_duration(file_path):
+    """Returns the duration of a video file in seconds, or None if unknown.
+
+    The duration is read from the container header. GIFs have none, so their
+    packets are then scanned with a stream copy.
+    """
+    header = subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-i", file_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    ).stderr
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", header)
+    if match is None:
+        times = re.findall(
+            r"time=(\d+):(\d+):(\d+(?:\.\d+)?)", _copy_packets(file_path).stderr
+        )
+        if not times:
+            return None
+        match = times[-1]
+    else:
+        match = match.groups()
+    hours, minutes, seconds = match
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return duration or None
+
+
+def probe_frame_count(file_path):
+    """Returns the number of native video frames of a file, or None if unknown.
+
+    The `framecrc` muxer lists one line per copied packet, i.e. per frame,
+    so the frames are counted without decoding them.
+    """
+    process = _copy_packets(file_path, "framecrc")
+    if process.returncode != 0:
+        return None
+    return sum(1 for line in process.stdout.splitlines() if line and not line.startswith("#"))
+
+
+def probe_frame_times(file_path):
+    """Returns the presentation times in seconds of the native video frames of
+    a file, from the first one, or None if unknown.
+
+    Like `probe_frame_count`, the packets are listed without decoding them.
+    """
+    process = _copy_packets(file_path, "framecrc")
+    if process.returncode != 0:
+        return None
+    time_base = None
+    pts = []
+    for line in process.stdout.splitlines():
+        if line.startswith("#tb 0:"):
+            numerator, denominator = line.split(":", 1)[1].strip().split("/")
+            time_base = int(numerator) / int(denominator)
+        elif line and not line.startswith("#"):
+            pts.append(int(line.split(",")[2]))
+    if time_base is None or not pts:
+        return None
+    pts.sort()
+    return [(value - pts[0]) * time_base for value in pts]
@@ -0,0 +1,222 @@
+import bisect
+import itertools
+import os
+import subprocess
+
+import imageio_ffmpeg
+import numpy as np
+
+from services.frame_sampling import FrameSampling, probe_duration, probe_frame_count, probe_frame_times
+
+DEFAULT_IMAGE_SIZE = (224, 224)
+DEFAULT_CHUNK_SIZE = 32
+
+
+def normalize(frames):
+    """Converts uint8 frames into the float32 [0, 1] range expected by MoViNet."""
+    import tensorflow as tf
+
+    return tf.cast(frames, tf.float32) / 255.0
+
+
+def chunk_frames(frames, chunk_size):
+    """Groups an iterable of frames into uint8 arrays of at most chunk_size frames."""
+    frames = iter(frames)
+    while True:
+        chunk = list(itertools.islice(frames, chunk_size))
+        if not chunk:
+            return
+        yield np.stack(chunk)
+
+
+class FfmpegDecoder:
+    """Decodes a video with ffmpeg into raw RGB frames scaled to `image_size`.
+
+    The input is either a file path or, when `file_path` is None, the bytes
+    passed to `feed`, so decoding can start while the file is still downloading.
+    Frames are passed through with their native timing, variable frame rate
+    videos and GIFs are not padded with duplicated frames.
+    """
+
+    def __init__(self, file_path, image_size, select_filter=None, start_time=None):
+        """
+        Args:
+          file_path: the video file, or None to decode the bytes passed to `feed`.
+          image_size: the (height, width) of the decoded frames.
+          select_filter: an optional ffmpeg filter dropping frames before they
+            are scaled, see `FrameSampling.ffmpeg_filter`.
+          start_time: seeks the file to this time in seconds from the first
+            frame, so only the frames from the keyframe before it are decoded.
+        """
+        self.image_size = tuple(image_size)
+        height, width = self.image_size
+        filters = [f"scale={width}:{height}:flags=bilinear"]
+        if select_filter:
+            filters.insert(0, select_filter)
+        seek_args = []
+        if start_time:
+            # The frames keep the times of a decode from the start, which the
+            # time based select filters depend on
+            seek_args = ["-copyts", "-start_at_zero", "-ss", f"{start_time:.6f}"]
+        self.process = subprocess.Popen(
+            [
+                imageio_ffmpeg.get_ffmpeg_exe(),
+                "-loglevel", "error",
+                *seek_args,
+                "-i", file_path or "pipe:0",
+                "-vf", ",".join(filters),
+                "-vsync", "passthrough",
+                "-f", "image2pipe",
+                "-vcodec", "rawvideo",
+                "-pix_fmt", "rgb24",
+                "pipe:1",
+            ],
+            stdin=subprocess.DEVNULL if file_path else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def feed(self, data):
+        self.process.stdin.write(data)
+
+    def finish_input(self):
+        self.process.stdin.close()
+
+    def __iter__(self):
+        height, width = self.image_size
+        frame_size = height * width * 3
+        try:
+            while True:
+                data = self.process.stdout.read(frame_size)
+                if len(data) < frame_size:
+                    break
+                yield np.frombuffer(data, np.uint8).reshape(height, width, 3)
+            if self.process.wait() != 0:
+                raise RuntimeError("ffmpeg could not decode the video")
+        finally:
+            self.close()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.stdout.close()
+        self.process.wait()
+
+
+class FrameSource:
+    """Lazily decodes an MP4 or GIF file into bounded chunks of uint8 frames.
+
+    Every pass over the source re-opens and decodes the file, so at most
+    `chunk_size` decoded frames are held in memory at a time regardless of the
+    video length. ffmpeg samples and scales the frames while decoding, so a
+    high frame rate or resolution upload does not cost more than needed.
+    """
+
+    def __init__(
+        self,
+        file_path,
+        image_size=DEFAULT_IMAGE_SIZE,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        sampling=None,
+        duration=None,
+        complete=None,
+    ):
+        """
+        Args:
+          file_path: the MP4 or GIF file.
+          image_size: the (height, width) of the decoded frames.
+          chunk_size: the maximum number of frames per chunk.
+          sampling: the FrameSampling policy, all frames by default.
+          duration: the video duration in seconds if already known, otherwise
+            it is probed from the file when needed.
+          complete: a callable telling whether the file is completely
+            written, e.g. while it is still downloading. Always by default.
+        """
+        self.file_path = file_path
+        self.image_size = tuple(image_size)
+        self.chunk_size = chunk_size
+        self.sampling = sampling or FrameSampling()
+        self.extension = os.path.splitext(file_path)[1].lower()
+        self._duration = duration
+        self._complete = complete or (lambda: True)
+        self._expected_frames = None
+        self._frame_times = None
+
+        self.num_frames = None
+        """The number of frames seen by the last complete pass over the source."""
+
+    @property
+    def duration(self):
+        """The duration of the video in seconds, or None if it is unknown."""
+        if self._duration is None:
+            self._duration = probe_duration(self.file_path)
+        return self._duration
+
+    def expected_frames(self):
+        """Estimates the number of sampled frames without decoding them.
+
+        Returns:
+          The estimate, or None while the file is incomplete.
+        """
+        if self._expected_frames is None and self._complete():
+            native_frames = probe_frame_count(self.file_path)
+            if native_frames is not None:
+                self._expected_frames = self.sampling.expected_frames(native_frames, self.duration)
+        return self._expected_frames
+
+    def select_filter(self):
+        """Returns the ffmpeg filter of the sampling policy for this video."""
+        duration = self.duration if self.sampling.needs_duration else None
+        return self.sampling.ffmpeg_filter(duration)
+
+    def seek_time(self, start):
+        """Returns the time to seek to for the sampled frame `start`, or None if unknown.
+
+        The time is between the native frame before it and itself, so the
+        decode starts exactly at it. The frame times are listed once, without
+        decoding.
+        """
+        if self._frame_times is None:
+            self._frame_times = probe_frame_times(self.file_path) or []
+        duration = self.duration if self.sampling.needs_duration else None
+        sampled = self.sampling.sampled_times(self._frame_times, duration)
+        if start >= len(sampled):
+            return None
+        index = bisect.bisect_left(self._frame_times, sampled[start])
+        if index == 0:
+            return None
+        return (self._frame_times[index - 1] + sampled[start]) / 2
+
+    def _iter_raw_frames(self, start=0):
+        """Yields the sampled RGB frames from the sampled frame `start`, scaled by ffmpeg, one by one."""
+        limit = self.sampling.max_frames
+        start_time = self.seek_time(start) if start else None
+        frames = iter(FfmpegDecoder(self.file_path, self.image_size, self.select_filter(), start_time))
+        if start_time is None:
+            return itertools.islice(frames, start, limit)
+        return itertools.islice(frames, None if limit is None else limit - start)
+
+    def iter_chunks(self, start=0, end=None):
+        """Yields uint8 arrays of shape (n, height, width, 3) with n <= chunk_size.
+
+        Args:
+          start: index of the first sampled frame to yield. The decode seeks to
+            it, from the keyframe before it, when the frame times are known;
+            otherwise earlier frames are decoded but not kept.
+          end: index after the last sampled frame to yield, or None for all frames.
+        """
+        count = 0
+        frames = itertools.islice(self._iter_raw_frames(start), None if end is None else max(0, end - start))
+        for chunk in chunk_frames(frames, self.chunk_size):
+            count += chunk.shape[0]
+            yield chunk
+        if start == 0 and end is None:
+            self.num_frames = count
+
+    def iter_frames(self, start=0, end=None):
+        """Yields the uint8 frames in [start, end) one by one."""
+        for chunk in self.iter_chunks(start, end):
+            for frame in chunk:
+                yield frame
+
+    def __iter__(self):
+        return self.iter_frames()
@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import socket
+import time
+import uuid
+
+from utils import logger
+
+JOB_FIELDS = ("bucket", "video_key", "user_id", "file_id", "analysis_id", "model_name")
+"""Keys every analysis job dict must provide."""
+JOB_ID_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,199}")
+"""The job ids usable as file names, so a job can only be written inside the queue directory."""
+
+
+def validate_job(job):
+    """Returns the list of required job fields that are missing or empty."""
+    return [field for field in JOB_FIELDS if not job.get(field)]
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, but run by another user
+        pass
+    return True
+
+
+class DirectoryJobQueue:
+    """A job queue backed by a directory of JSON files, one file per job.
+
+    Jobs are claimed by renaming `<id>.json` to `<id>.json.<pid>@<host>.processing`,
+    so several workers can share the same directory and the claims of a worker
+    that died can be requeued. Finished jobs are removed.
+    """
+
+    CLAIM_EXTENSION = ".processing"
+
+    def __init__(self, directory, poll_interval=0.5, max_attempts=3):
+        """
+        Args:
+          directory: the directory of the job files.
+          poll_interval: seconds between two scans of an empty directory.
+          max_attempts: the claims of a job by workers that died, after which
+            it is set aside as `<id>.json.failed` instead of requeued.
+        """
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, job):
+        job_id = job.get("analysis_id") or uuid.uuid4().hex
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            raise ValueError(f"Invalid job id for a file name: {job_id!r}")
+        tmp_path = os.path.join(self.directory, f".{job_id}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        # Publish atomically so a worker never reads a half written job
+        os.replace(tmp_path, os.path.join(self.directory, f"{job_id}.json"))
+
+    def _claim_next(self):
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            claimed_path = f"{path}.{os.getpid()}@{socket.gethostname()}{self.CLAIM_EXTENSION}"
+            try:
+                os.rename(path, claimed_path)
+            except FileNotFoundError:
+                # Claimed by another worker in the meantime
+                continue
+            try:
+                with open(claimed_path) as f:
+                    job = json.load(f)
+            except ValueError as error:
+                logger.log_error(f"Invalid job file {name}: {error}")
+                os.rename(claimed_path, f"{path}.invalid")
+                continue
+            job["_claimed_path"] = claimed_path
+            return job
+        return None
+
+    def get(self, timeout=None):
+        """Returns the next job, or None if nothing arrived within the timeout."""
+        waited = 0.0
+        while True:
+            job = self._claim_next()
+            if job is not None or (timeout is not None and waited >= timeout):
+                return job
+            sleep_time = self.poll_interval
+            if timeout is not None:
+                sleep_time = min(sleep_time, timeout - waited)
+            time.sleep(sleep_time)
+            waited += sleep_time
+
+    def done(self, job):
+        claimed_path = job.get("_claimed_path")
+        if claimed_path and os.path.exists(claimed_path):
+            os.remove(claimed_path)
+
+    def requeue_stale_claims(self):
+        """Requeues the jobs claimed by worker processes of this host that died
+        before finishing them, e.g. killed for running out of memory.
+
+        Returns:
+          The number of jobs requeued.
+        """
+        host = socket.gethostname()
+        requeued = 0
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(self.CLAIM_EXTENSION):
+                continue
+            job_name, _, owner = name[: -len(self.CLAIM_EXTENSION)].rpartition(".json.")
+            pid, _, owner_host = owner.partition("@")
+            if not job_name or owner_host != host or not pid.isdigit() or _process_alive(int(pid)):
+                continue
+
+            # Take the claim first, so a job is requeued by a single worker
+            taken_path = os.path.join(self.directory, f".{job_name}.{os.getpid()}.requeue")
+            try:
+                os.rename(os.path.join(self.directory, name), taken_path)
+            except FileNotFoundError:
+                # Requeued by another worker in the meantime
+                continue
+            try:
+                with open(taken_path) as f:
+                    job = json.load(f)
+            except ValueError as error:
+                logger.log_error(f"Invalid job file {name}: {error}")
+                os.rename(taken_path, os.path.join(self.directory, f"{job_name}.json.invalid"))
+                continue
+
+            job["_attempts"] = job.get("_attempts", 0) + 1
+            if job["_attempts"] >= self.max_attempts:
+                logger.log_error(
+                    f"Job {job_name} was claimed by {job['_attempts']} workers that died, setting it aside"
+                )
+                os.rename(taken_path, os.path.join(self.directory, f"{job_name}.json.failed"))
+                continue
+            logger.log_warning(f"Requeuing job {job_name}, its worker process {pid} died")
+            with open(taken_path, "w") as f:
+                json.dump(job, f)
+            os.replace(taken_path, os.path.join(self.directory, f"{job_name}.json"))
+            requeued += 1
+        return requeued
+
@@ -0,0 +1,202 @@
+import gc
+import threading
+import time
+from collections import OrderedDict
+
+from config import frame_size, model_frame_sizes, working_dir
+from utils import logger
+
+
+class ModelSpec:
+    """A MoViNet variant served under an analysis model name, e.g.
+    "a0-stream-kinetics-600-classification"."""
+
+    def __init__(self, model_id, mode, resolution, labels="kinetics-600", hub_version=3):
+        """
+        Args:
+          model_id: the MoViNet variant, "a0" to "a5".
+          mode: the model mode, "base" or "stream".
+          resolution: the frame height and width the variant was trained on.
+          labels: the label set of the classifier.
+          hub_version: the TF Hub version of the model.
+        """
+        self.model_id = model_id
+        self.mode = mode
+        self.resolution = resolution
+        self.labels = labels
+        self.hub_version = hub_version
+
+    def __repr__(self):
+        return f"ModelSpec({self.name!r}, {self.resolution}px)"
+
+    @property
+    def name(self):
+        return f"{self.model_id}-{self.mode}-{self.labels}-classification"
+
+    @property
+    def export_name(self):
+        """The directory name of the hub cache and of the exports of the model."""
+        # The A2 models were the only ones before the registry, their paths are kept
+        return self.mode if self.model_id == "a2" else f"{self.model_id}-{self.mode}"
+
+    @property
+    def hub_url(self):
+        return (
+            f"https://tfhub.dev/tensorflow/movinet/{self.model_id}/{self.mode}/"
+            f"{self.labels}/classification/{self.hub_version}"
+        )
+
+    @property
+    def version(self):
+        """Identifies the model weights, e.g. for keying cached results."""
+        return f"movinet-{self.model_id}-{self.mode}-{self.labels}-v{self.hub_version}"
+
+
+MOVINET_RESOLUTIONS = {"a0": 172, "a1": 172, "a2": 224, "a3": 256, "a4": 290, "a5": 320}
+"""The input resolution of each MoViNet variant, from the smallest to the most accurate."""
+
+LABEL_FILES = {"kinetics-600": "kinetics_600_labels.txt"}
+"""The label map file of each label set, in the working directory."""
+
+MODELS = {
+    spec.name: spec
+    for spec in (
+        ModelSpec(model_id, mode, resolution)
+        for model_id, resolution in MOVINET_RESOLUTIONS.items()
+        for mode in ("base", "stream")
+    )
+}
+"""Maps the supported analysis model names to their ModelSpec."""
+
+DEFAULT_MODELS = {
+    mode: MODELS[f"a2-{mode}-kinetics-600-classification"] for mode in ("base", "stream")
+}
+"""The model of each mode when only the mode is given, e.g. `VideoPredictor("base")`."""
+
+
+def get_model_spec(name):
+    """Returns the ModelSpec of a model name, or of the default model of a mode.
+
+    Raises:
+      ValueError: if the model is not supported.
+    """
+    spec = MODELS.get(name) or DEFAULT_MODELS.get(name)
+    if spec is None:
+        raise ValueError(f"Unsupported model: {name}")
+    return spec
+
+
+def model_frame_size(model_name):
+    """Returns the frame height and width of a model name, the resolution of the
+    model unless configured with `MODEL_FRAME_SIZE` or `FRAME_SIZE`."""
+    return model_frame_sizes.get(model_name) or frame_size or get_model_spec(model_name).resolution
+
+
+def labels_path(labels):
+    """Returns the label map file of a label set."""
+    return f"{working_dir}/{LABEL_FILES[labels]}"
+
+
+class ModelRegistry:
+    """Loads the predictors of the analysis models on first use, and keeps the
+    recently used ones within a memory budget.
+
+    Once the estimated memory of the loaded models exceeds the budget, the
+    least recently used ones are evicted, never the model just requested.
+    Predictors still used by a running analysis stay valid, the registry only
+    drops its references. Every load and eviction is logged as a metrics
+    record with its duration.
+    """
+
+    def __init__(self, memory_budget_bytes=None, create_predictor=None):
+        """
+        Args:
+          memory_budget_bytes: the most memory of the loaded models, unbounded
+            if None or 0.
+          create_predictor: a callable loading the predictor of a model name,
+            `VideoPredictor` by default.
+        """
+        self.memory_budget_bytes = memory_budget_bytes or None
+        self.create_predictor = create_predictor
+        self.load_seconds = {}
+        """The duration of the last load of each model."""
+        self.eviction_seconds = {}
+        """The duration of the last eviction of each model."""
+        self.evictions = 0
+        self._loaded = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self):
+        """The names of the loaded models, from the least to the most recently used."""
+        return list(self._loaded)
+
+    @property
+    def loaded_bytes(self):
+        return sum(size for _, size in self._loaded.values())
+
+    def get(self, name):
+        """Returns the predictor of a model name or mode, loading it if needed."""
+        spec = get_model_spec(name)
+        with self._lock:
+            if spec.name in self._loaded:
+                self._loaded.move_to_end(spec.name)
+                return self._loaded[spec.name][0]
+
+            start = time.perf_counter()
+            predictor = self._create(spec)
+            seconds = time.perf_counter() - start
+            size = predictor.memory_bytes()
+            self._loaded[spec.name] = (predictor, size)
+            self.load_seconds[spec.name] = seconds
+            logger.log_metrics(
+                {
+                    "event": "model_load",
+                    "model": spec.name,
+                    "seconds": seconds,
+                    "bytes": size,
+                    "loaded_bytes": self.loaded_bytes,
+                }
+            )
+            if self.memory_budget_bytes and size > self.memory_budget_bytes:
+                logger.log_warning(
+                    f"The {spec.name} model alone exceeds the memory budget of the registry"
+                )
+            self._evict(keep=spec.name)
+            return predictor
+
+    def _create(self, spec):
+        if self.create_predictor:
+            return self.create_predictor(spec.name)
+        from services.video_predictor import VideoPredictor
+
+        return VideoPredictor(spec.name)
+
+    def _evict(self, keep):
+        while (
+            self.memory_budget_bytes
+            and self.loaded_bytes > self.memory_budget_bytes
+            and len(self._loaded) > 1
+        ):
+            self.evict(next(name for name in self._loaded if name != keep))
+
+    def evict(self, name):
+        """Unloads a model, whose memory is freed once no analysis uses it anymore."""
+        with self._lock:
+            start = time.perf_counter()
+            predictor, size = self._loaded.pop(name)
+            predictor.release()
+            del predictor
+            gc.collect()
+            seconds = time.perf_counter() - start
+            self.eviction_seconds[name] = seconds
+            self.evictions += 1
+        logger.log_metrics(
+            {
+                "event": "model_eviction",
+                "model": name,
+                "seconds": seconds,
+                "bytes": size,
+                "loaded_bytes": self.loaded_bytes,
+            }
+        )
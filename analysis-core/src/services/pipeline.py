@@ -0,0 +1,408 @@
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from config import frame_chunk_size, pipeline_queue_size
+from services.frame_sampling import FrameSampling
+from services.frame_source import FfmpegDecoder, FrameSource, chunk_frames
+from services.s3_service import iter_object_ranges
+from utils import logger, metrics
+
+MAX_HEADER_BYTES = 4 * 1024 * 1024
+"""How far into an MP4 to look for the moov box before decoding from the file."""
+
+_END = object()
+
+
+def moov_before_mdat(header):
+    """Tells whether an MP4 can be decoded from a pipe, i.e. its moov box comes
+    before the mdat box. Returns None if the header is too short to tell."""
+    offset = 0
+    while offset + 8 <= len(header):
+        size = int.from_bytes(header[offset : offset + 4], "big")
+        box_type = header[offset + 4 : offset + 8]
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat":
+            return False
+        if size == 1:
+            if offset + 16 > len(header):
+                return None
+            size = int.from_bytes(header[offset + 8 : offset + 16], "big")
+        if size < 8:
+            # The box runs to the end of the file, or the header is invalid
+            return False
+        offset += size
+    return None
+
+
+def mp4_duration(header):
+    """Returns the duration in seconds from the mvhd box of an MP4 header, or
+    None if the header does not contain it."""
+    offset = header.find(b"mvhd")
+    if offset < 0:
+        return None
+    box = header[offset + 4 :]
+    version = box[0] if box else None
+    # version (1) + flags (3) + creation and modification times (4 or 8 each)
+    if version == 0 and len(box) >= 20:
+        timescale = int.from_bytes(box[12:16], "big")
+        duration = int.from_bytes(box[16:20], "big")
+    elif version == 1 and len(box) >= 32:
+        timescale = int.from_bytes(box[20:24], "big")
+        duration = int.from_bytes(box[24:32], "big")
+    else:
+        return None
+    return duration / timescale if timescale else None
+
+
+class PipelineCancelled(Exception):
+    """Raised in the inference stage once the pipeline is cancelled."""
+
+
+class AnalysisPipeline:
+    """Overlaps the download, decode and inference stages of one analysis.
+
+    The download thread fetches the S3 object with concurrent ranged GETs. When
+    the file is an MP4 with its moov box up front, ffmpeg starts decoding on the
+    first downloaded bytes, otherwise the file is decoded once it is complete.
+    With `keep_file` disabled, a streamable MP4 is piped straight into the
+    decoder and never written to disk. Decoded chunks go through a bounded
+    queue to the inference stage, which runs on the calling thread while later
+    chunks are still downloading and decoding.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        video_key,
+        local_path,
+        image_size=(224, 224),
+        chunk_size=frame_chunk_size,
+        queue_size=pipeline_queue_size,
+        keep_file=True,
+        on_downloaded=None,
+        job_metrics=None,
+        sampling=None,
+        checkpoint=None,
+        early_exit=None,
+        progress=None,
+    ):
+        """
+        Args:
+          bucket: the S3 bucket of the video.
+          video_key: the S3 key of the video.
+          local_path: where to store the downloaded video.
+          image_size: the (height, width) of the decoded frames.
+          chunk_size: the number of frames per decoded chunk.
+          queue_size: the number of decoded chunks buffered for inference.
+          keep_file: whether the video must end up in `local_path`, e.g. to be
+            decoded again for rendering. Non-streamable files are always kept.
+          on_downloaded: an optional callback taking the local path and the
+            SHA-256 hex digest of the video once downloaded. Returning True
+            cancels the pipeline, e.g. on a result cache hit.
+          job_metrics: the JobMetrics receiving the stage timings, defaults
+            to the current job's.
+          sampling: the FrameSampling policy of the decoded frames.
+          checkpoint: an optional StreamCheckpoint of the stream inference.
+          early_exit: an optional EarlyExitPolicy of the stream inference. The
+            download still completes after an early exit, the decode stops.
+          progress: an optional ProgressReporter of the stream inference.
+        """
+        self.bucket = bucket
+        self.video_key = video_key
+        self.local_path = local_path
+        self.image_size = tuple(image_size)
+        self.chunk_size = chunk_size
+        self.keep_file = keep_file
+        self.on_downloaded = on_downloaded
+        self.metrics = job_metrics or metrics.current()
+        self.sampling = sampling or FrameSampling()
+        self.checkpoint = checkpoint
+        self.early_exit = early_exit
+        self.progress = progress
+
+        self.digest = None
+        self.predictor = None
+        self.bytes_downloaded = 0
+        self.time_to_first_frame = None
+        self.duration = None
+        self._start = None
+        self._chunks = queue.Queue(maxsize=queue_size)
+        self._decoder = None
+        self._decision = threading.Event()
+        self._downloaded = threading.Event()
+        self._cancelled = threading.Event()
+        self._decoded = threading.Event()
+        # Set once the inference stops taking chunks, e.g. on an early exit
+        self._consumed = threading.Event()
+        self._errors = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _start_decoder(self, header):
+        """Starts decoding the MP4 from its first bytes, directly or from the file."""
+        # The moov box is in the header, so a frame budget can be spread over the duration
+        self.duration = mp4_duration(header)
+        duration = self.duration if self.sampling.needs_duration else None
+        self._decoder = FfmpegDecoder(
+            None, self.image_size, self.sampling.ffmpeg_filter(duration)
+        )
+        if self.keep_file:
+            threading.Thread(target=self._feed_decoder, daemon=True).start()
+
+    def _download(self):
+        digest = hashlib.sha256()
+        # Bytes held back until it is known whether the MP4 can be piped
+        header = b"" if os.path.splitext(self.local_path)[1].lower() != ".gif" else None
+        file = None
+        piped = False
+        try:
+            with self.metrics.span("download"):
+                for block in iter_object_ranges(self.bucket, self.video_key):
+                    if self.cancelled:
+                        return
+                    digest.update(block)
+                    self.bytes_downloaded += len(block)
+
+                    if header is not None:
+                        header += block
+                        streamable = moov_before_mdat(header)
+                        if streamable is None and len(header) <= MAX_HEADER_BYTES:
+                            continue
+                        block, header = header, None
+                        piped = bool(streamable) and not self.keep_file
+                        if not piped:
+                            # The file must exist before the decoder starts tailing it
+                            file = open(self.local_path, "wb")
+                            file.write(block)
+                            file.flush()
+                        if streamable:
+                            self._start_decoder(block)
+                        self._decision.set()
+                        if not piped:
+                            continue
+
+                    if piped:
+                        try:
+                            self._decoder.feed(block)
+                        except (BrokenPipeError, ValueError):
+                            if not self._decoded.is_set():
+                                # The decoder failed, the decode stage reports its error
+                                self._cancelled.set()
+                        continue
+                    file = file or open(self.local_path, "wb")
+                    file.write(block)
+                    file.flush()
+
+                if header is not None:
+                    file = file or open(self.local_path, "wb")
+                    file.write(header)
+            logger.log_info(f"File downloaded: {self.bucket}/{self.video_key}")
+        except Exception as error:
+            self._errors.append(error)
+            self._cancelled.set()
+            return
+        finally:
+            if file:
+                file.close()
+            if piped:
+                try:
+                    self._decoder.finish_input()
+                except BrokenPipeError:
+                    pass
+            self._downloaded.set()
+            self._decision.set()
+
+        self.digest = digest.hexdigest()
+        if self.on_downloaded and self.on_downloaded(self.local_path, self.digest):
+            logger.log_info("Pipeline cancelled after download")
+            self._cancelled.set()
+
+    def _feed_decoder(self):
+        """Tails the downloading file into the decoder's stdin."""
+        try:
+            with open(self.local_path, "rb") as f:
+                while not self.cancelled:
+                    download_finished = self._downloaded.is_set()
+                    data = f.read(1024 * 1024)
+                    if data:
+                        self._decoder.feed(data)
+                    elif download_finished:
+                        break
+                    else:
+                        self._downloaded.wait(0.05)
+        except (BrokenPipeError, ValueError):
+            # The decoder stopped early, its own error is reported by the decode stage
+            pass
+        finally:
+            try:
+                self._decoder.finish_input()
+            except BrokenPipeError:
+                pass
+
+    def _put(self, item):
+        while not self.cancelled and not self._consumed.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode(self):
+        try:
+            self._decision.wait()
+            if self._decoder is not None:
+                logger.log_info("Decoding while downloading")
+                frames = itertools.islice(self._decoder, self.sampling.max_frames)
+                chunks = chunk_frames(frames, self.chunk_size)
+            else:
+                self._downloaded.wait()
+                if self.cancelled:
+                    return
+                source = FrameSource(
+                    self.local_path, self.image_size, self.chunk_size, self.sampling
+                )
+                chunks = source.iter_chunks()
+
+            for chunk in self.metrics.timed_iter("decode", chunks):
+                if self.time_to_first_frame is None:
+                    self.time_to_first_frame = time.perf_counter() - self._start
+                if not self._put(chunk):
+                    break
+            if self._decoder is not None:
+                # The frame budget or an early exit may end the decode before
+                # the end of the input
+                self._decoded.set()
+                self._decoder.close()
+            # A streamed decode reads the file in one pass, check it was complete
+            self._downloaded.wait()
+        except Exception as error:
+            # A cancelled pipeline stops feeding the decoder, which is not an error
+            if not self.cancelled:
+                self._errors.append(error)
+                self._cancelled.set()
+        finally:
+            self._put(_END)
+
+    def _iter_chunks(self):
+        while True:
+            start = time.perf_counter()
+            item = None
+            while item is None:
+                if self.cancelled:
+                    raise PipelineCancelled()
+                try:
+                    item = self._chunks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            self.metrics.add_timing("inference_wait", time.perf_counter() - start)
+            if item is _END:
+                if self.cancelled:
+                    raise PipelineCancelled()
+                return
+            yield item
+
+    def _run_stages(self, consume):
+        """Runs the download and decode stages while `consume` takes the chunks.
+
+        Returns:
+          The result of `consume`, or None if the pipeline was cancelled.
+
+        Raises:
+          The first error of the download or decode stages.
+        """
+        self._start = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._download, daemon=True),
+            threading.Thread(target=self._decode, daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        result = None
+        try:
+            result = consume()
+        except PipelineCancelled:
+            pass
+        finally:
+            if result is None:
+                self._cancelled.set()
+            self._consumed.set()
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        self.metrics.add_timing("pipeline", time.perf_counter() - self._start)
+        self.metrics.count("bytes_downloaded", self.bytes_downloaded)
+        download_seconds = self.metrics.timings.get("download")
+        if download_seconds:
+            self.metrics.gauge(
+                "download_throughput",
+                self.bytes_downloaded / download_seconds / 1024**2,
+                "Megabytes/Second",
+            )
+        if self.time_to_first_frame is not None:
+            self.metrics.gauge("time_to_first_frame", self.time_to_first_frame, "Seconds")
+        return result
+
+    def run(self, get_predictor):
+        """Runs the pipeline and returns the top-k predictions.
+
+        Args:
+          get_predictor: a callable returning the VideoPredictor to use. It is
+            called while the download and decode stages are already running,
+            so a cold model load overlaps them too.
+
+        Returns:
+          The top-k predictions, or None if the pipeline was cancelled. The
+          predictor keeps the frame source and the probabilities of the video.
+
+        Raises:
+          The first error of the download or decode stages.
+        """
+
+        def predict():
+            with self.metrics.span("model_load"):
+                self.predictor = get_predictor()
+            self.predictor.load_frames(
+                self.local_path,
+                image_size=self.image_size,
+                sampling=self.sampling,
+                duration=self.duration,
+                complete=self._downloaded.is_set,
+            )
+            with self.metrics.span("inference"):
+                top_k = self.predictor.predict_top_k(
+                    chunks=self._iter_chunks(),
+                    checkpoint=self.checkpoint,
+                    early_exit=self.early_exit,
+                    progress=self.progress,
+                )
+            metrics.record_first_inference(self.metrics)
+            return top_k
+
+        return self._run_stages(predict)
+
+    def fetch_frames(self):
+        """Downloads and decodes the video without analyzing it, e.g. to batch
+        it with other videos.
+
+        Returns:
+          The uint8 frames of shape (frames, height, width, 3), or None if the
+          pipeline was cancelled.
+
+        Raises:
+          The first error of the download or decode stages.
+        """
+        return self._run_stages(lambda: np.concatenate(list(self._iter_chunks())))
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+def softmax(logits, axis=-1):
+    """Returns the probabilities of logits of any shape, e.g. one frame, the
+    frames of a clip or a batch of videos.
+
+    On small arrays it avoids the per op overhead of TensorFlow, whose
+    multithreaded softmax is faster on the probabilities of whole videos.
+
+    Args:
+      logits: the logits, with the classes on `axis`.
+      axis: the class axis.
+    """
+    logits = np.asarray(logits, dtype=np.float32)
+    exp = np.exp(logits - logits.max(axis=axis, keepdims=True))
+    exp /= exp.sum(axis=axis, keepdims=True)
+    return exp
+
+
+def top_k(probs, k):
+    """Returns the k most probable classes along the last axis.
+
+    Only the top k classes are sorted, after a linear time partial selection
+    of them, instead of sorting all classes. Equal probabilities are ordered
+    by class index.
+
+    Args:
+      probs: the probabilities of shape (..., num_classes), e.g. of one
+        video, of every frame of a video or of a batch of videos.
+      k: the number of classes.
+
+    Returns:
+      The class indices and their probabilities of shape (..., k), by
+      descending probability.
+    """
+    probs = np.asarray(probs)
+    k = min(k, probs.shape[-1])
+    indices = np.argpartition(probs, probs.shape[-1] - k, axis=-1)[..., -k:]
+    indices = np.sort(indices, axis=-1)
+    values = np.take_along_axis(probs, indices, axis=-1)
+    order = np.argsort(-values, axis=-1, kind="stable")
+    return np.take_along_axis(indices, order, axis=-1), np.take_along_axis(values, order, axis=-1)
+
+
+def top_k_predictions(probs, labels, k):
+    """Returns the top-k (label, probability) pairs of one video, or of each
+    video of a batch.
+
+    Args:
+      probs: the probabilities of shape (num_classes,), or (videos, num_classes).
+      labels: the label of each class.
+      k: the number of predictions.
+
+    Returns:
+      A tuple of k (label, probability) pairs, or a list of them per video.
+    """
+    indices, values = top_k(probs, k)
+    predictions = [
+        tuple((labels[index], value) for index, value in zip(video_indices, video_values))
+        for video_indices, video_values in zip(np.atleast_2d(indices), np.atleast_2d(values))
+    ]
+    return predictions[0] if indices.ndim == 1 else predictions
+
+
+def streaming_label_indices(probs, k, top_indices=None):
+    """Selects the classes of the streaming plot of one video or a batch of videos.
+
+    These are the top class of the last frame, then the classes most often
+    in the top k of the frames, the ones appearing first on ties. The counts
+    are one `bincount` over the per frame top-k of all videos, so the cost
+    is linear in the frames.
+
+    Args:
+      probs: the probabilities of shape (frames, num_classes), or
+        (videos, frames, num_classes) for videos of the same length.
+      k: the number of top classes per frame counted.
+      top_indices: the per frame top class indices by descending
+        probability, of shape (..., frames, >= k), if already known.
+
+    Returns:
+      An array of at most k + 1 class indices, or a list of them per video.
+    """
+    probs = np.asarray(probs)
+    num_classes = probs.shape[-1]
+    if top_indices is None:
+        top_indices = top_k(probs, k)[0]
+    top_indices = np.asarray(top_indices)[..., :k]
+    single = top_indices.ndim == 2
+    if single:
+        top_indices = top_indices[np.newaxis]
+    num_videos = top_indices.shape[0]
+
+    # The classes of the frames in order, offset so every video has its own bins
+    categories = top_indices.reshape(num_videos, -1) + (np.arange(num_videos) * num_classes)[:, np.newaxis]
+    categories = categories.reshape(-1)
+    counts = np.bincount(categories, minlength=num_videos * num_classes)
+    first = np.full(num_videos * num_classes, categories.size)
+    np.minimum.at(first, categories, np.arange(categories.size))
+
+    counts = counts.reshape(num_videos, num_classes)
+    first = first.reshape(num_videos, num_classes)
+    ranked = np.lexsort((first, -counts), axis=-1)[:, :k]
+    last = top_indices[:, -1, 0]
+
+    selected = []
+    for video_last, video_ranked in zip(last, ranked):
+        video_ranked = video_ranked[video_ranked != video_last]
+        selected.append(np.concatenate(([video_last], video_ranked))[: k + 1])
+    return selected[0] if single else selected
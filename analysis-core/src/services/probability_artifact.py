@@ -0,0 +1,320 @@
+import json
+import struct
+
+import numpy as np
+
+from services import postprocessing
+
+ARTIFACT_EXTENSION = ".probs"
+"""The extension of the artifact S3 keys, next to the rendered video."""
+MAGIC = b"VARP"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<4sHHI")
+"""The magic, the format version, reserved flags and the length of the JSON index."""
+HEAD_BYTES = 64 * 1024
+"""The bytes read first, enough for the index of most artifacts."""
+MIN_PROB = np.float16(2**-24)
+"""The smallest positive float16, probabilities are clamped to it so they stay
+plottable on a log scale."""
+
+
+def write_probability_artifact(
+    output_path,
+    probs,
+    labels,
+    fps,
+    top_k=10,
+    plot_k=5,
+    logits=None,
+    logits_source="model",
+    chunk_frames=256,
+    metadata=None,
+):
+    """Writes the per frame predictions of a stream analysis to a compact artifact.
+
+    The file starts with a fixed preamble (see `PREAMBLE`) and a JSON index
+    of the frame counts, labels, plot series and chunks, followed by the
+    chunks of `chunk_frames` frames. A chunk of n frames holds, little
+    endian and in this order:
+
+      - the top-k class indices, uint16 of shape (n, top_k),
+      - their probabilities, float16 of shape (n, top_k),
+      - the probabilities of the plotted classes, float16 of shape (n, plot classes),
+      - with logits, the logits of every class, float16 of shape (n, num_classes).
+
+    The chunk offsets in the index are relative to the end of the index, so a
+    time range is read with one ranged read once the index is known.
+
+    Args:
+      output_path: the artifact file.
+      probs: the probabilities of shape (num_frames, num_classes).
+      labels: the label of each class.
+      fps: the rate of the analyzed frames, which places them on the time axis.
+      top_k: the number of top classes kept per frame.
+      plot_k: the number of top classes per frame counted to select the
+        plotted classes, the predictor's k.
+      logits: the optional logits of shape (num_frames, num_classes).
+      logits_source: "model" for the model logits, or "log_probs" for log
+        probabilities standing in for them, which have the same softmax.
+      chunk_frames: the number of frames per chunk.
+      metadata: a JSON serializable dict stored as is, e.g. the model and
+        the decode settings needed to render the plot again.
+
+    Returns:
+      The size of the artifact in bytes.
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    num_frames, num_classes = probs.shape
+    top_k = min(max(top_k, plot_k), num_classes)
+    top_indices, top_probs = postprocessing.top_k(probs, top_k)
+    plot_indices = postprocessing.streaming_label_indices(probs, plot_k, top_indices).tolist()
+
+    chunks = []
+    blobs = []
+    offset = 0
+    for start in range(0, num_frames, chunk_frames):
+        end = min(start + chunk_frames, num_frames)
+        arrays = [
+            top_indices[start:end].astype("<u2"),
+            np.maximum(top_probs[start:end], MIN_PROB).astype("<f2"),
+            np.maximum(probs[start:end, plot_indices], MIN_PROB).astype("<f2"),
+        ]
+        if logits is not None:
+            arrays.append(np.asarray(logits[start:end]).astype("<f2"))
+        blob = b"".join(array.tobytes() for array in arrays)
+        chunks.append({"start": start, "end": end, "offset": offset, "length": len(blob)})
+        blobs.append(blob)
+        offset += len(blob)
+
+    index = json.dumps(
+        {
+            "version": FORMAT_VERSION,
+            "num_frames": num_frames,
+            "num_classes": num_classes,
+            "top_k": top_k,
+            "plot_k": plot_k,
+            "fps": fps,
+            "labels": list(labels),
+            "plot_indices": plot_indices,
+            "logits": logits_source if logits is not None else None,
+            "chunk_frames": chunk_frames,
+            "chunks": chunks,
+            "metadata": metadata or {},
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+    with open(output_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(index)))
+        f.write(index)
+        for blob in blobs:
+            f.write(blob)
+    return PREAMBLE.size + len(index) + offset
+
+
+class ProbabilityArtifact:
+    """Reads a probability artifact, see `write_probability_artifact`.
+
+    Only the index is read when opening. `read` and `read_frames` then fetch
+    the chunks of a time or frame range with a single ranged read, from a
+    local file or an S3 object.
+    """
+
+    def __init__(self, read_range):
+        """
+        Args:
+          read_range: a callable returning `length` bytes from an offset,
+            fewer at the end of the artifact.
+        """
+        self._read_range = read_range
+        self.requests = 0
+        self.bytes_read = 0
+        self._head = b""
+
+        head = self._read(0, HEAD_BYTES)
+        if len(head) < PREAMBLE.size:
+            raise ValueError("Not a probability artifact, too short")
+        magic, version, _, index_length = PREAMBLE.unpack_from(head)
+        if magic != MAGIC:
+            raise ValueError("Not a probability artifact, invalid magic")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported probability artifact version {version}")
+        index_end = PREAMBLE.size + index_length
+        if len(head) < index_end:
+            head += self._read(len(head), index_end - len(head))
+        self.index = json.loads(head[PREAMBLE.size : index_end].decode("utf-8"))
+        self.data_offset = index_end
+        # The first chunks of the artifact may already be in the head
+        self._head = head
+
+    @classmethod
+    def open(cls, path):
+        """Opens an artifact file."""
+
+        def read_range(offset, length):
+            with open(path, "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+
+        return cls(read_range)
+
+    @classmethod
+    def from_s3(cls, bucket, s3_key):
+        """Opens an artifact in S3, reading it with ranged GETs."""
+        from services.s3_service import get_object_range
+
+        return cls(lambda offset, length: get_object_range(bucket, s3_key, offset, length))
+
+    def _read(self, offset, length):
+        if offset + length <= len(self._head):
+            return self._head[offset : offset + length]
+        data = self._read_range(offset, length)
+        self.requests += 1
+        self.bytes_read += len(data)
+        return data
+
+    @property
+    def num_frames(self):
+        return self.index["num_frames"]
+
+    @property
+    def fps(self):
+        return self.index["fps"]
+
+    @property
+    def duration_seconds(self):
+        """The time the analyzed frames span."""
+        return self.num_frames / self.fps
+
+    @property
+    def labels(self):
+        return self.index["labels"]
+
+    @property
+    def plot_labels(self):
+        """The labels of the plotted classes, the top class of the last frame first."""
+        return [self.labels[index] for index in self.index["plot_indices"]]
+
+    @property
+    def has_logits(self):
+        return self.index["logits"] is not None
+
+    @property
+    def metadata(self):
+        return self.index["metadata"]
+
+    def frame_range(self, start_seconds=None, end_seconds=None):
+        """Returns the [start, end) frames of the frames shown within a time range."""
+        start = 0 if start_seconds is None else int(np.floor(start_seconds * self.fps))
+        end = self.num_frames if end_seconds is None else int(np.ceil(end_seconds * self.fps))
+        return max(0, min(start, self.num_frames)), max(0, min(end, self.num_frames))
+
+    def read(self, start_seconds=None, end_seconds=None):
+        """Reads the frames of a time range in seconds, see `read_frames`."""
+        return self.read_frames(*self.frame_range(start_seconds, end_seconds))
+
+    def read_frames(self, start=0, end=None):
+        """Reads the frames of a [start, end) frame range.
+
+        Returns:
+          A dict with the `start` and `end` frames, the `times` of the frames
+          in seconds, the `top_k_indices`, `top_k_probs` and `plot_probs`, and
+          the `logits` or None. The arrays have a row per frame.
+        """
+        end = self.num_frames if end is None else min(end, self.num_frames)
+        start = min(max(start, 0), end)
+        top_k = self.index["top_k"]
+        # The stored dtype, the columns and the returned dtype of the chunk arrays
+        layout = {
+            "top_k_indices": ("<u2", top_k, np.int64),
+            "top_k_probs": ("<f2", top_k, np.float32),
+            "plot_probs": ("<f2", len(self.index["plot_indices"]), np.float32),
+            "logits": ("<f2", self.index["num_classes"] if self.has_logits else 0, np.float32),
+        }
+        fields = {
+            name: [np.zeros((0, columns), dtype=dtype)]
+            for name, (_, columns, dtype) in layout.items()
+        }
+
+        chunks = [chunk for chunk in self.index["chunks"] if chunk["start"] < end and chunk["end"] > start]
+        if chunks:
+            # The chunks are contiguous, so they are read at once
+            first = chunks[0]["offset"]
+            data = self._read(
+                self.data_offset + first, chunks[-1]["offset"] + chunks[-1]["length"] - first
+            )
+        for chunk in chunks:
+            n = chunk["end"] - chunk["start"]
+            offset = chunk["offset"] - first
+            rows = slice(max(start, chunk["start"]) - chunk["start"], min(end, chunk["end"]) - chunk["start"])
+            for name, (stored, columns, dtype) in layout.items():
+                array = np.frombuffer(data, dtype=stored, count=n * columns, offset=offset)
+                fields[name].append(array.reshape(n, columns)[rows].astype(dtype))
+                offset += n * columns * np.dtype(stored).itemsize
+        arrays = {name: np.concatenate(values) for name, values in fields.items()}
+
+        return {
+            "start": start,
+            "end": end,
+            "times": np.arange(start, end) / self.fps,
+            "top_k_indices": arrays["top_k_indices"],
+            "top_k_probs": arrays["top_k_probs"],
+            "plot_probs": arrays["plot_probs"],
+            "logits": arrays["logits"] if self.has_logits else None,
+        }
+
+
+def render_plot_video(
+    artifact,
+    output,
+    video_path=None,
+    work_dir=".",
+    num_workers=1,
+    min_segment_frames=50,
+    figure_height=500,
+    fps=25,
+    start_seconds=None,
+    end_seconds=None,
+):
+    """Renders the streaming plot video of an analysis from its artifact.
+
+    The plot is the one of `ResultsService.generate_stream_output`. With the
+    uploaded video, its frames are decoded with the settings of the analysis
+    recorded in the artifact metadata and shown above the plot.
+
+    Args:
+      artifact: a ProbabilityArtifact.
+      output: the output video path, an MP4 or a GIF.
+      video_path: the analyzed video file, or None to only render the plot.
+      work_dir: the directory of the intermediate segment files.
+      num_workers: the number of worker processes.
+      min_segment_frames: the minimum number of frames worth a separate segment.
+      figure_height: the height of the output video.
+      fps: the output video fps.
+      start_seconds: renders from this time on, the beginning by default.
+      end_seconds: renders until this time, the end by default.
+
+    Returns:
+      The output video path.
+    """
+    from services.stream_output import render_stream_output
+
+    metadata = artifact.metadata
+    start, end = artifact.frame_range(start_seconds, end_seconds)
+    segment = {
+        "video_path": video_path,
+        "image_size": tuple(metadata.get("image_size", (224, 224))),
+        "chunk_size": metadata.get("chunk_size", 32),
+        "sampling": metadata.get("sampling", "all"),
+        "duration": metadata.get("video_duration"),
+        # The whole series is drawn as the dotted preview lines
+        "top_probs": artifact.read_frames()["plot_probs"].T,
+        "top_labels": artifact.plot_labels,
+        "duration_seconds": artifact.duration_seconds,
+        "figure_height": figure_height,
+        "fps": fps,
+        "output_format": "gif" if output.lower().endswith(".gif") else "mp4",
+        "start": start,
+        "end": end,
+    }
+    return render_stream_output(segment, output, work_dir, num_workers, min_segment_frames)
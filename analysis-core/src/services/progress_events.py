@@ -0,0 +1,225 @@
+import json
+import threading
+import time
+
+from utils import logger
+
+MAX_BATCH_ENTRIES = 10
+"""The most entries of one EventBridge PutEvents call."""
+
+
+class EventPublisher:
+    """Publishes EventBridge events in batches from a background thread.
+
+    Events published under the same key replace the queued one, e.g. the
+    progress of an analysis, so a slow or failing `put_events` never queues
+    stale events. Queued events are sent every `flush_interval` seconds, at
+    most MAX_BATCH_ENTRIES per call, and the failed calls and entries are
+    retried with an exponential backoff.
+    """
+
+    def __init__(
+        self, client, flush_interval=1.0, max_attempts=5, backoff=0.2, max_backoff=5.0
+    ):
+        """
+        Args:
+          client: the EventBridge client, or any object with its `put_events`.
+          flush_interval: how long events are coalesced before being sent.
+          max_attempts: the attempts to send an event before dropping it.
+          backoff: the delay before the first retry, doubled on every retry.
+          max_backoff: the longest delay between two retries.
+        """
+        self.client = client
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.dropped = 0
+        self._pending = {}
+        self._sequence = 0
+        self._sending = False
+        self._closed = False
+        self._flush_requested = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, entry, key=None):
+        """Queues a PutEvents entry, replacing the queued entry of the same key."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The event publisher is closed")
+            if key is None:
+                self._sequence += 1
+                key = ("event", self._sequence)
+            self._pending[key] = entry
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Sends the queued events now and waits until they are sent or dropped.
+
+        Returns:
+          Whether every queued event was handled within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            if self._pending:
+                self._flush_requested = True
+                self._condition.notify_all()
+            while self._pending or self._sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def close(self, timeout=None):
+        """Flushes the queued events and stops the background thread."""
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed and not self._pending:
+                    return
+                # Coalesces the events published during the interval
+                deadline = time.monotonic() + self.flush_interval
+                while not self._flush_requested and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                entries = list(self._pending.values())
+                self._pending.clear()
+                self._flush_requested = False
+                self._sending = True
+            try:
+                for start in range(0, len(entries), MAX_BATCH_ENTRIES):
+                    self._send(entries[start : start + MAX_BATCH_ENTRIES])
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _send(self, entries):
+        delay = self.backoff
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = self.client.put_events(Entries=entries)
+            except Exception as error:
+                logger.log_warning(f"Publishing {len(entries)} event(s) failed: {error}")
+            else:
+                # The results are in the order of the entries, the failed ones have an error code
+                failed = [
+                    (entry, result)
+                    for entry, result in zip(entries, response.get("Entries") or [])
+                    if result.get("ErrorCode")
+                ]
+                self.sent += len(entries) - len(failed)
+                if not failed:
+                    return
+                logger.log_warning(
+                    f"{len(failed)} event(s) failed: {failed[0][1].get('ErrorCode')}"
+                )
+                entries = [entry for entry, _ in failed]
+            if attempt < self.max_attempts:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        self.dropped += len(entries)
+        logger.log_warning(f"Dropped {len(entries)} event(s) after {self.max_attempts} attempts")
+
+
+class ProgressReporter:
+    """Publishes throttled 'FileAnalysisProgress' events of one stream analysis.
+
+    The events carry the running top-k predictions, the frames processed, the
+    expected frames and an ETA, so clients get feedback long before the
+    'FileAnalyzed' event, which is unchanged.
+    """
+
+    def __init__(self, publisher, job, event_bus_name, interval, source="var.analysis_core"):
+        """
+        Args:
+          publisher: the EventPublisher sending the events.
+          job: the job dict of the analysis, see `app.process_job`.
+          event_bus_name: the EventBridge bus of the events.
+          interval: the least seconds between two progress events.
+          source: the source of the events.
+        """
+        self.publisher = publisher
+        self.job = job
+        self.event_bus_name = event_bus_name
+        self.interval = interval
+        self.source = source
+        self.sequence = 0
+        self._last_report = None
+        self._start = None
+
+    def start(self, frame_index=0):
+        """Marks the start of the inference, from the frame `frame_index` on.
+
+        The first clip is reported right away, as the first feedback.
+        """
+        self._start = (time.perf_counter(), frame_index)
+        self._last_report = None
+
+    def due(self):
+        """Whether the interval since the last progress event has passed."""
+        return self._last_report is None or time.perf_counter() - self._last_report >= self.interval
+
+    def eta_seconds(self, frames_processed, expected_frames):
+        """Estimates the inference time left from the frame rate since `start`."""
+        if not expected_frames or self._start is None:
+            return None
+        start_time, start_frame = self._start
+        frames = frames_processed - start_frame
+        seconds = time.perf_counter() - start_time
+        if frames <= 0 or seconds <= 0:
+            return None
+        return max(expected_frames - frames_processed, 0) * seconds / frames
+
+    def report(self, frames_processed, predictions, expected_frames=None, stage="inference"):
+        """Publishes the progress of the analysis.
+
+        Args:
+          frames_processed: the number of frames analyzed so far.
+          predictions: the running top-k (label, probability) predictions.
+          expected_frames: the estimated number of frames to analyze, if known.
+          stage: "inference", or "render" once the predictions are final.
+        """
+        self._last_report = time.perf_counter()
+        self.sequence += 1
+        eta = self.eta_seconds(frames_processed, expected_frames) if stage == "inference" else None
+        progress = {
+            "stage": stage,
+            "sequence": self.sequence,
+            "frames_processed": int(frames_processed),
+            "expected_frames": expected_frames,
+            "fraction": (
+                round(min(frames_processed / expected_frames, 1.0), 4) if expected_frames else None
+            ),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "predictions": [[label, round(float(prob), 4)] for label, prob in predictions],
+        }
+        detail = {
+            "userId": self.job["user_id"],
+            "fileId": self.job["file_id"],
+            "analysisId": self.job["analysis_id"],
+            "data": {"model": self.job["model_name"], "progress": progress},
+        }
+        self.publisher.publish(
+            {
+                "Source": self.source,
+                "DetailType": "FileAnalysisProgress",
+                "Detail": json.dumps(detail),
+                "EventBusName": self.event_bus_name,
+            },
+            key=("progress", self.job["analysis_id"]),
+        )
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from services.s3_service import download_file, object_exists, upload_file
+from utils import logger
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """Returns the hex SHA-256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """A content-addressed cache of analysis results.
+
+    Entries are keyed by the video content hash plus the model name and version,
+    and hold the top-k predictions and the per-frame probability tensor in one
+    compressed `.npz` file. Lookups go to a size-bounded local disk tier first
+    and then to an optional S3 prefix tier.
+    """
+
+    def __init__(self, local_dir, max_local_bytes, s3_bucket=None, s3_prefix=None):
+        self.local_dir = local_dir
+        self.max_local_bytes = max_local_bytes
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix.strip("/") if s3_prefix else None
+        os.makedirs(local_dir, exist_ok=True)
+
+    @staticmethod
+    def key(video_path, model_name, model_version):
+        """Builds the cache key of a video analyzed by the given model."""
+        return ResultCache.key_from_digest(hash_file(video_path), model_name, model_version)
+
+    @staticmethod
+    def key_from_digest(digest, model_name, model_version):
+        """Builds the cache key from an already computed SHA-256 hex digest."""
+        return f"{digest}-{model_name}-{model_version}"
+
+    def _local_path(self, key):
+        return os.path.join(self.local_dir, f"{key}.npz")
+
+    def _s3_key(self, key):
+        return f"{self.s3_prefix}/{key}.npz"
+
+    def get(self, key):
+        """Returns the cached (top_k, probs) tuple of a key, or None on a miss."""
+        local_path = self._local_path(key)
+        if not os.path.exists(local_path):
+            if not self.s3_prefix or not object_exists(self.s3_bucket, self._s3_key(key)):
+                return None
+            if not download_file(self.s3_bucket, self._s3_key(key), local_path):
+                return None
+            logger.log_info(f"Result cache: S3 hit for {key}")
+            self._evict(keep=local_path)
+
+        try:
+            with np.load(local_path, allow_pickle=False) as entry:
+                top_k = json.loads(str(entry["top_k"]))
+                probs = entry["probs"]
+        except (OSError, ValueError, KeyError) as error:
+            logger.log_warning(f"Result cache: dropping unreadable entry {key}: {error}")
+            os.remove(local_path)
+            return None
+
+        # Refresh the access time used for LRU eviction
+        os.utime(local_path)
+        logger.log_info(f"Result cache: hit for {key}")
+        return tuple((label, prob) for label, prob in top_k), probs
+
+    def put(self, key, top_k, probs):
+        """Stores the top-k predictions and probabilities of a key in every tier."""
+        local_path = self._local_path(key)
+        tmp_path = f"{local_path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            top_k=np.array(json.dumps([[label, float(prob)] for label, prob in top_k])),
+            probs=np.asarray(probs, dtype=np.float32),
+        )
+        os.replace(tmp_path, local_path)
+
+        # A failed S3 write only loses the shared tier, the local entry still serves hits
+        if self.s3_prefix and not upload_file(self.s3_bucket, self._s3_key(key), local_path):
+            logger.log_warning(f"Result cache: could not store {key} in S3, only cached locally")
+        self._evict(keep=local_path)
+
+    def _evict(self, keep=None):
+        """Removes the least recently used local entries above the size budget."""
+        entries = []
+        for name in os.listdir(self.local_dir):
+            if not name.endswith(".npz") or ".tmp." in name:
+                continue
+            path = os.path.join(self.local_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_local_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total_size -= size
+            logger.log_info(f"Result cache: evicted {os.path.basename(path)}")
@@ -1,13 +1,13 @@
 import os
-from PIL import Image
-import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib as mpl
+import numpy as np
 import tqdm
-import tensorflow as tf
+from services.postprocessing import streaming_label_indices
+from services.s3_service import MultipartUploadWriter, upload_video
+from services.stream_output import render_stream_output
+from services.stream_plot_renderer import StreamPlotRenderer
 from utils import logger
-from config import working_dir
-import imageio
+from config import render_workers, render_min_segment_frames, stream_upload
 
 
 class ResultsService:
@@ -24,7 +24,7 @@ class ResultsService:
         )
 
     def plot_streaming_top_preds(
-        self, video_fps=25.0, figure_height=500, use_progbar=True
+        self, video_fps=None, figure_height=500, use_progbar=True
     ):
         """Generates a video plot of the top video model predictions.
         Args:
@@ -32,166 +32,111 @@ class ResultsService:
             the probability of each class on each frame.
           video: the video to display in the plot.
           top_k: the number of top predictions to select.
-          video_fps: the input video fps.
+          video_fps: the rate of the analyzed frames, the sampled rate of the
+            predictor by default.
           figure_fps: the output video fps.
           figure_height: the height of the output video.
           use_progbar: display a progress bar.
 
-        Returns:
-          A numpy array representing the output video.
+        Yields:
+          The rendered uint8 RGB frames of the output video one by one, so they
+          can be streamed into a writer without holding the whole video.
         """
-        video_fps = 8.0
-        steps = self.predictor.video.shape[0]
+        video_fps = video_fps or self.video_fps()
+        steps = self.predictor.num_frames
         duration = steps / video_fps
 
         top_probs, top_labels, _ = self.get_top_k_streaming_labels()
+        renderer = StreamPlotRenderer(
+            top_probs=top_probs,
+            top_labels=top_labels,
+            duration_seconds=duration,
+            figure_height=figure_height,
+        )
 
-        images = []
-        step_generator = tqdm.trange(steps) if use_progbar else range(steps)
-        for i in step_generator:
-            image, _ = self.plot_streaming_top_preds_at_step(
-                top_probs=top_probs,
-                top_labels=top_labels,
-                step=i,
-                image=self.predictor.video[i],
-                duration_seconds=duration,
-                figure_height=figure_height,
-            )
-            images.append(image)
-
-        return np.array(images)
+        # Frames are decoded again lazily, chunk by chunk, while plotting
+        step_generator = zip(range(steps), self.predictor.frames.iter_frames())
+        if use_progbar:
+            step_generator = tqdm.tqdm(step_generator, total=steps)
+        try:
+            for i, frame in step_generator:
+                yield renderer.render(step=i, image=frame)
+        finally:
+            renderer.close()
+
+    def video_fps(self):
+        """Returns the rate of the analyzed frames, which places them on the
+        time axis of the plot."""
+        video_fps = self.predictor.sampled_fps
+        if video_fps is None:
+            logger.log_warning("Unknown video duration, assuming 8 analyzed frames per second")
+            return 8.0
+        return video_fps
 
     def get_top_k_streaming_labels(self):
         """Returns the top-k labels over an entire video sequence.
 
         Returns:
-          a tuple of the top-k probabilities, labels, and logit indices
+          a tuple of the top-k probabilities of shape (labels, num_frames),
+          labels, and logit indices
         """
-        label_map = self.predictor.KINETICS_600_LABELS_LIST
-        k = self.predictor.k
-
-        top_categories_last = tf.argsort(self.predictor.probs, -1, "DESCENDING")[-1, :1]
-        categories = tf.argsort(self.predictor.probs, -1, "DESCENDING")[:, :k]
-        categories = tf.reshape(categories, [-1])
-
-        counts = sorted(
-            [
-                (i.numpy(), tf.reduce_sum(tf.cast(categories == i, tf.int32)).numpy())
-                for i in tf.unique(categories)[0]
-            ],
-            key=lambda x: x[1],
-            reverse=True,
-        )
-
-        top_probs_idx = tf.constant([i for i, _ in counts[:k]])
-        top_probs_idx = tf.concat([top_categories_last, top_probs_idx], 0)
-        top_probs_idx = tf.unique(top_probs_idx)[0][: k + 1]
-
-        top_probs = tf.gather(self.predictor.probs, top_probs_idx, axis=-1)
-        top_probs = tf.transpose(top_probs, perm=(1, 0))
-        top_labels = tf.gather(label_map, top_probs_idx, axis=0)
-        top_labels = [label.decode("utf8") for label in top_labels.numpy()]
+        probs = np.asarray(self.predictor.probs)
+        top_probs_idx = streaming_label_indices(probs, self.predictor.k)
+        top_probs = probs[:, top_probs_idx].T
+        top_labels = [self.predictor.KINETICS_600_LABELS_LIST[i] for i in top_probs_idx]
 
         return top_probs, top_labels, top_probs_idx
 
-    def plot_streaming_top_preds_at_step(
-        self,
-        top_probs,
-        top_labels,
-        step=None,
-        image=None,
-        legend_loc="lower left",
-        duration_seconds=10,
-        figure_height=500,
-        playhead_scale=0.8,
-        grid_alpha=0.3,
+    def generate_stream_output(
+        self, input_video_s3_key, output_s3_bucket, output_s3_key, figure_height=500
     ):
-        """Generates a plot of the top video model predictions at a given time step.
+        """Renders the streaming plot video and uploads it to S3.
 
-        Args:
-          top_probs: a tensor of shape (k, num_frames) representing the top-k
-            probabilities over all frames.
-          top_labels: a list of length k that represents the top-k label strings.
-          step: the current time step in the range [0, num_frames].
-          image: the image frame to display at the current time step.
-          legend_loc: the placement location of the legend.
-          duration_seconds: the total duration of the video.
-          figure_height: the output figure height.
-          playhead_scale: scale value for the playhead.
-          grid_alpha: alpha value for the gridlines.
+        With `stream_upload` enabled, the encoded bytes are uploaded as multipart
+        parts while encoding is still running and nothing is written locally.
 
         Returns:
-          A tuple of the output numpy image, figure, and axes.
+          The uploaded S3 key, or None if the upload failed.
         """
-        num_labels, num_frames = top_probs.shape
-        if step is None:
-            step = num_frames
-
-        fig = plt.figure(figsize=(6.5, 7), dpi=300)
-        gs = mpl.gridspec.GridSpec(8, 1)
-        ax2 = plt.subplot(gs[:-3, :])
-        ax = plt.subplot(gs[-3:, :])
-
-        if image is not None:
-            ax2.imshow(image, interpolation="nearest")
-            ax2.axis("off")
-
-        preview_line_x = tf.linspace(0.0, duration_seconds, num_frames)
-        preview_line_y = top_probs
-
-        line_x = preview_line_x[: step + 1]
-        line_y = preview_line_y[:, : step + 1]
-
-        for i in range(num_labels):
-            ax.plot(
-                preview_line_x,
-                preview_line_y[i],
-                label=None,
-                linewidth="1.5",
-                linestyle=":",
-                color="gray",
-            )
-            ax.plot(line_x, line_y[i], label=top_labels[i], linewidth="2.0")
-
-        ax.grid(which="major", linestyle=":", linewidth="1.0", alpha=grid_alpha)
-        ax.grid(which="minor", linestyle=":", linewidth="0.5", alpha=grid_alpha)
-
-        min_height = tf.reduce_min(top_probs) * playhead_scale
-        max_height = tf.reduce_max(top_probs)
-        ax.vlines(preview_line_x[step], min_height, max_height, colors="red")
-        ax.scatter(preview_line_x[step], max_height, color="red")
-
-        ax.legend(loc=legend_loc)
-
-        plt.xlim(0, duration_seconds)
-        plt.ylabel("Probability")
-        plt.xlabel("Time (s)")
-        plt.yscale("log")
-
-        fig.tight_layout()
-        fig.canvas.draw()
-
-        data = np.frombuffer(fig.canvas.tostring_rgb(), dtype=np.uint8)
-        data = data.reshape(fig.canvas.get_width_height()[::-1] + (3,))
-        plt.close()
-
-        figure_width = int(figure_height * data.shape[1] / data.shape[0])
-        image = Image.fromarray(data).resize((figure_width, figure_height))
-        image = np.array(image)
-
-        return image, (fig, ax, ax2)
-
-    def generate_stream_output(self, input_video_s3_key):
         logger.log_info(f"Generating video file from the streaming plot")
-        local_file_path = (
-            f"{working_dir}/videos/output_{os.path.basename(input_video_s3_key)}"
+        video_fps = self.video_fps()
+        steps = self.predictor.num_frames
+        top_probs, top_labels, _ = self.get_top_k_streaming_labels()
+        output_format = "gif" if output_s3_key.lower().endswith(".gif") else "mp4"
+
+        segment = {
+            "video_path": self.predictor.frames.file_path,
+            "image_size": self.predictor.frames.image_size,
+            "chunk_size": self.predictor.frames.chunk_size,
+            "sampling": str(self.predictor.frames.sampling),
+            "duration": self.predictor.frames.duration,
+            "top_probs": top_probs,
+            "top_labels": top_labels,
+            "duration_seconds": steps / video_fps,
+            "figure_height": figure_height,
+            "fps": 25,
+            "output_format": output_format,
+            "start": 0,
+            "end": steps,
+        }
+        # The directory of the job's video, which no other job or worker process writes to
+        work_dir = os.path.dirname(self.predictor.frames.file_path)
+
+        # Time ranges are rendered and encoded in worker processes, then concatenated
+        if stream_upload:
+            try:
+                with MultipartUploadWriter(output_s3_bucket, output_s3_key) as upload:
+                    render_stream_output(
+                        segment, upload, work_dir, render_workers, render_min_segment_frames
+                    )
+                return output_s3_key
+            except Exception as error:
+                logger.log_error("S3: {}".format(error))
+                return None
+
+        local_file_path = f"{work_dir}/output_{os.path.basename(input_video_s3_key)}"
+        render_stream_output(
+            segment, local_file_path, work_dir, render_workers, render_min_segment_frames
         )
-        plot_video = self.plot_streaming_top_preds()
-
-        # Convert the numpy array of images into a video and save it to the file system
-        imageio.mimsave(
-            local_file_path, plot_video, fps=25
-        )  # Set fps to desired frames per second
         logger.log_info(f"Stored {local_file_path}")
-
-        return local_file_path
+        return upload_video(output_s3_bucket, output_s3_key, local_file_path)
@@ -1,14 +1,25 @@
 import boto3
 import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from config import (
     s3_access_key_id,
     s3_secret_access_key,
     s3_endpoint_url,
     working_dir,
     s3_region,
+    s3_upload_part_size,
+    s3_download_part_size,
+    s3_download_concurrency,
 )
 from utils import logger
 
+# One pooled client shared by every thread, with a connection per concurrent ranged GET
+client_config = Config(max_pool_connections=max(10, s3_download_concurrency + 2))
 
 if s3_endpoint_url:
     s3_client = boto3.client(
@@ -17,28 +28,174 @@ if s3_endpoint_url:
         aws_access_key_id=s3_access_key_id,
         aws_secret_access_key=s3_secret_access_key,
         endpoint_url=s3_endpoint_url,
+        config=client_config,
     )
 else:
-    s3_client = boto3.client(service_name="s3", region_name=s3_region)
+    s3_client = boto3.client(service_name="s3", region_name=s3_region, config=client_config)
 
 
-def download_video(bucket, video_key):
-    local_file_path = f"{working_dir}/videos/{os.path.basename(video_key)}"
-
+def download_file(bucket, s3_key, local_file_path):
     try:
-        s3_client.download_file(bucket, video_key, local_file_path)
-        logger.log_info(f"File downloaded: {bucket}/{video_key}")
+        s3_client.download_file(bucket, s3_key, local_file_path)
+        logger.log_info(f"File downloaded: {bucket}/{s3_key}")
         return local_file_path
 
     except Exception as error:
         logger.log_error("S3: {}".format(error))
 
 
-def upload_video(bucket, s3_key, video_path):
+def upload_file(bucket, s3_key, file_path):
     try:
-        s3_client.upload_file(video_path, bucket, s3_key)
+        s3_client.upload_file(file_path, bucket, s3_key)
         logger.log_info(f"File uploaded: {bucket}/{s3_key}")
         return s3_key
 
     except Exception as error:
         logger.log_error("S3: {}".format(error))
+
+
+def object_exists(bucket, s3_key):
+    try:
+        s3_client.head_object(Bucket=bucket, Key=s3_key)
+        return True
+
+    except ClientError as error:
+        if error.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+            logger.log_error("S3: {}".format(error))
+        return False
+
+
+def delete_object(bucket, s3_key):
+    try:
+        s3_client.delete_object(Bucket=bucket, Key=s3_key)
+        return True
+
+    except Exception as error:
+        logger.log_error("S3: {}".format(error))
+        return False
+
+
+def _get_range(bucket, s3_key, first_byte, last_byte):
+    response = s3_client.get_object(
+        Bucket=bucket, Key=s3_key, Range=f"bytes={first_byte}-{last_byte}"
+    )
+    return response["Body"].read()
+
+
+def get_object_range(bucket, s3_key, offset, length):
+    """Returns `length` bytes of an S3 object from an offset, fewer at its end."""
+    return _get_range(bucket, s3_key, offset, offset + length - 1)
+
+
+def iter_object_ranges(
+    bucket, s3_key, part_size=s3_download_part_size, concurrency=s3_download_concurrency
+):
+    """Yields the content of an S3 object in order, fetched with concurrent ranged GETs.
+
+    At most `2 * concurrency` parts are in flight or buffered at a time, so
+    memory stays bounded even if the consumer is slower than the download.
+    """
+    size = s3_client.head_object(Bucket=bucket, Key=s3_key)["ContentLength"]
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            for first_byte in range(0, size, part_size):
+                last_byte = min(first_byte + part_size, size) - 1
+                pending.append(
+                    pool.submit(_get_range, bucket, s3_key, first_byte, last_byte)
+                )
+                if len(pending) >= 2 * concurrency:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def local_video_path(video_key):
+    """Returns a new local path for the video of a job, in a directory of its own.
+
+    Videos of different users often have the same file name, so jobs running
+    at the same time, in threads or worker processes, never share the file.
+    Remove it with `remove_local_video` once the job is done.
+    """
+    videos_dir = f"{working_dir}/videos"
+    os.makedirs(videos_dir, exist_ok=True)
+    job_dir = tempfile.mkdtemp(prefix="job-", dir=videos_dir)
+    return os.path.join(job_dir, os.path.basename(video_key))
+
+
+def remove_local_video(local_path):
+    """Removes a video from `local_video_path` and anything else in its directory."""
+    shutil.rmtree(os.path.dirname(local_path), ignore_errors=True)
+
+
+def download_video(bucket, video_key):
+    return download_file(bucket, video_key, local_video_path(video_key))
+
+
+def upload_video(bucket, s3_key, video_path):
+    return upload_file(bucket, s3_key, video_path)
+
+
+class MultipartUploadWriter:
+    """A writable sink uploading the bytes written to it as S3 multipart parts.
+
+    Parts are uploaded as soon as `part_size` bytes are buffered, so an upload
+    can run while the data is still being produced (e.g. by an encoder).
+    """
+
+    def __init__(self, bucket, s3_key, part_size=s3_upload_part_size):
+        self.bucket = bucket
+        self.s3_key = s3_key
+        self.part_size = part_size
+        self.parts = []
+        self.buffer = bytearray()
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=s3_key)[
+            "UploadId"
+        ]
+
+    def _upload_part(self, data):
+        part_number = len(self.parts) + 1
+        response = s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+
+    def close(self):
+        """Uploads the remaining bytes as the last part and completes the upload."""
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer = bytearray()
+        s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+        logger.log_info(f"File uploaded: {self.bucket}/{self.s3_key}")
+
+    def abort(self):
+        s3_client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.s3_key, UploadId=self.upload_id
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,112 @@
+import os
+import time
+
+import numpy as np
+
+from services.s3_service import delete_object, download_file, object_exists, upload_file
+from utils import logger
+
+
+class StreamCheckpoint:
+    """Periodic snapshots of the stream model progress on one analysis.
+
+    A snapshot holds the model states, the index of the next frame and the
+    logits of the frames before it in one compressed `.npz` file keyed by the
+    analysis id. It is written to a local directory and, if configured,
+    copied to an S3 prefix so a replacement task can resume the analysis of
+    an interrupted one. The logits are kept as float32 and the states as is,
+    so a resumed run ends with the same probabilities as an uninterrupted one.
+    """
+
+    STATE_PREFIX = "state/"
+
+    def __init__(self, analysis_id, version, local_dir, interval, s3_bucket=None, s3_prefix=None):
+        """
+        Args:
+          analysis_id: the analysis the snapshots belong to.
+          version: identifies the model and decode settings; snapshots of
+            other versions are ignored.
+          local_dir: the directory of the local snapshots.
+          interval: the minimum number of seconds between two snapshots.
+          s3_bucket: the bucket of the S3 snapshots.
+          s3_prefix: the S3 prefix of the snapshots, None to keep them local.
+        """
+        self.analysis_id = analysis_id
+        self.version = version
+        self.local_dir = local_dir
+        self.interval = interval
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix.strip("/") if s3_prefix else None
+        self._last_save = time.monotonic()
+        os.makedirs(local_dir, exist_ok=True)
+
+    @property
+    def local_path(self):
+        return os.path.join(self.local_dir, f"{self.analysis_id}.npz")
+
+    @property
+    def s3_key(self):
+        return f"{self.s3_prefix}/{self.analysis_id}.npz"
+
+    def due(self):
+        """Whether the last snapshot is older than the interval."""
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save(self, frame_index, states, logits):
+        """Writes a snapshot, replacing the previous one.
+
+        Args:
+          frame_index: the number of frames analyzed so far.
+          states: the dict of model states after these frames.
+          logits: the logits of these frames, of shape (frame_index, num_classes).
+        """
+        start = time.perf_counter()
+        tmp_path = f"{self.local_path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            version=np.array(self.version),
+            frame_index=np.array(frame_index),
+            logits=np.asarray(logits, dtype=np.float32),
+            **{f"{self.STATE_PREFIX}{name}": np.asarray(state) for name, state in states.items()},
+        )
+        os.replace(tmp_path, self.local_path)
+        if self.s3_prefix:
+            upload_file(self.s3_bucket, self.s3_key, self.local_path)
+        self._last_save = time.monotonic()
+        logger.log_info(
+            f"Stream checkpoint at frame {frame_index} saved in {time.perf_counter() - start:.2f}s"
+        )
+
+    def load(self):
+        """Returns the (frame_index, states, logits) of the last snapshot, or None."""
+        if not os.path.exists(self.local_path):
+            if not self.s3_prefix or not object_exists(self.s3_bucket, self.s3_key):
+                return None
+            if not download_file(self.s3_bucket, self.s3_key, self.local_path):
+                return None
+
+        try:
+            with np.load(self.local_path, allow_pickle=False) as snapshot:
+                if str(snapshot["version"]) != self.version:
+                    logger.log_warning("Ignoring a stream checkpoint of another model version")
+                    return None
+                frame_index = int(snapshot["frame_index"])
+                logits = snapshot["logits"]
+                states = {
+                    name[len(self.STATE_PREFIX) :]: snapshot[name]
+                    for name in snapshot.files
+                    if name.startswith(self.STATE_PREFIX)
+                }
+        except (OSError, ValueError, KeyError) as error:
+            logger.log_warning(f"Ignoring an unreadable stream checkpoint: {error}")
+            return None
+
+        logger.log_info(f"Resuming the stream analysis from frame {frame_index}")
+        return frame_index, states, logits
+
+    def clear(self):
+        """Removes the snapshots once the analysis result is stored."""
+        if os.path.exists(self.local_path):
+            os.remove(self.local_path)
+        if self.s3_prefix and object_exists(self.s3_bucket, self.s3_key):
+            delete_object(self.s3_bucket, self.s3_key)
@@ -0,0 +1,128 @@
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib as mpl
+
+from services.execution_layout import available_cpus
+from services.frame_sampling import FrameSampling
+from services.frame_source import FrameSource
+from services.stream_plot_renderer import StreamPlotRenderer
+from services.video_writer import VideoWriter, concat_videos
+from utils import logger
+
+
+def split_frame_ranges(num_frames, num_segments, min_segment_frames=1):
+    """Splits [0, num_frames) into at most `num_segments` contiguous ranges."""
+    num_segments = max(1, min(num_segments, num_frames // max(1, min_segment_frames)))
+    bounds = [round(i * num_frames / num_segments) for i in range(num_segments + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(num_segments)]
+
+
+def render_segment(segment):
+    """Renders and encodes the plot frames of one time range.
+
+    Runs in a worker process: it decodes only the frames of its range from the
+    input video and appends every rendered frame to the encoder right away.
+
+    Args:
+      segment: a dict with the `video_path` (None to only render the plot),
+        `image_size`, `chunk_size`, the frame `sampling` policy and video
+        `duration`, `top_probs`, `top_labels`, `duration_seconds`,
+        `figure_height`, `fps`, the frame range `start`/`end`, the `output`
+        path or sink and the `output_format` of the segment.
+
+    Returns:
+      The output of the encoded segment.
+    """
+    mpl.rcParams.update({"font.size": 10})
+    if segment["video_path"]:
+        frames = FrameSource(
+            segment["video_path"],
+            image_size=segment["image_size"],
+            chunk_size=segment["chunk_size"],
+            sampling=FrameSampling.parse(segment["sampling"]),
+            duration=segment["duration"],
+        ).iter_frames(segment["start"], segment["end"])
+    else:
+        # Only the plot is rendered
+        frames = itertools.repeat(None, segment["end"] - segment["start"])
+    renderer = StreamPlotRenderer(
+        top_probs=segment["top_probs"],
+        top_labels=segment["top_labels"],
+        duration_seconds=segment["duration_seconds"],
+        figure_height=segment["figure_height"],
+    )
+    writer = VideoWriter(
+        segment["output"],
+        fps=segment["fps"],
+        output_format=segment["output_format"],
+        faststart=segment.get("faststart", False),
+    )
+    try:
+        for step, frame in enumerate(frames, segment["start"]):
+            writer.append_data(renderer.render(step=step, image=frame))
+    finally:
+        writer.close()
+        renderer.close()
+    return segment["output"]
+
+
+def render_stream_output(segment, output, work_dir, num_workers, min_segment_frames):
+    """Renders the plot video of a frame range in parallel time range segments.
+
+    Args:
+      segment: the render settings shared by every segment, as in `render_segment`.
+      output: the final video path or a writable sink (rendered in-process).
+      work_dir: the directory of the intermediate segment files.
+      num_workers: the number of worker processes, at most one per CPU.
+      min_segment_frames: the minimum number of frames worth a separate
+        segment. Every worker process imports matplotlib and starts its own
+        decoder and encoder, which costs seconds, so short clips render
+        faster in this process.
+
+    Returns:
+      The final video output.
+    """
+    # More processes than CPUs only add their startup, e.g. on a 1-CPU host
+    num_workers = min(num_workers, len(available_cpus()))
+    ranges = split_frame_ranges(
+        segment["end"] - segment["start"], num_workers, min_segment_frames
+    )
+    if len(ranges) == 1:
+        return render_segment({**segment, "output": output})
+
+    segment_prefix = os.path.join(work_dir, f"segment-{os.getpid()}-{id(segment)}")
+    segments = [
+        {
+            **segment,
+            "start": segment["start"] + start,
+            "end": segment["start"] + end,
+            # Segments are always MP4 so they can be concatenated losslessly,
+            # with the moov box first so they can be streamed to the concat
+            "output": f"{segment_prefix}.part{index:03d}.mp4",
+            "output_format": "mp4",
+            "faststart": True,
+        }
+        for index, (start, end) in enumerate(ranges)
+    ]
+    logger.log_info(f"Rendering {len(segments)} segments in parallel")
+
+    # Spawned workers do not inherit the parent's TensorFlow thread pools
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=len(segments), mp_context=context) as pool:
+            futures = [pool.submit(render_segment, segment) for segment in segments]
+            # Each segment is concatenated, e.g. uploaded, as soon as it and the
+            # ones before it are encoded
+            return concat_videos(
+                (future.result() for future in futures),
+                output,
+                segment["output_format"],
+                num_segments=len(futures),
+            )
+    finally:
+        for part in segments:
+            if os.path.exists(part["output"]):
+                os.remove(part["output"])
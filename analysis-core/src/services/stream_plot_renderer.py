@@ -0,0 +1,143 @@
+import matplotlib as mpl
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class StreamPlotRenderer:
+    """Incrementally renders the streaming top predictions plot frame by frame.
+
+    The figure, the grid, the dotted preview lines, the axes and the legend are
+    built and rasterized once. Every step then restores that background and
+    redraws only the video frame, the progressive prediction lines and the
+    playhead (blitting). The figure is rasterized directly at `figure_height`
+    pixels, so no downsampling is needed.
+    """
+
+    figsize = (6.5, 7)
+
+    def __init__(
+        self,
+        top_probs,
+        top_labels,
+        duration_seconds=10,
+        figure_height=500,
+        legend_loc="lower left",
+        playhead_scale=0.8,
+        grid_alpha=0.3,
+    ):
+        """Builds the figure and its static layers.
+
+        Args:
+          top_probs: an array of shape (k, num_frames) representing the top-k
+            probabilities over all frames.
+          top_labels: a list of length k that represents the top-k label strings.
+          duration_seconds: the total duration of the video.
+          figure_height: the output figure height in pixels.
+          legend_loc: the placement location of the legend.
+          playhead_scale: scale value for the playhead.
+          grid_alpha: alpha value for the gridlines.
+        """
+        self.top_probs = np.asarray(top_probs)
+        num_labels, num_frames = self.top_probs.shape
+        self.line_x = np.linspace(0.0, duration_seconds, num_frames)
+
+        self.fig = Figure(figsize=self.figsize, dpi=figure_height / self.figsize[1])
+        self.canvas = FigureCanvasAgg(self.fig)
+        gs = mpl.gridspec.GridSpec(8, 1, figure=self.fig)
+        self.image_ax = self.fig.add_subplot(gs[:-3, :])
+        self.ax = self.fig.add_subplot(gs[-3:, :])
+        self.image_ax.axis("off")
+        self.image_artist = None
+
+        self.lines = []
+        for i in range(num_labels):
+            self.ax.plot(
+                self.line_x,
+                self.top_probs[i],
+                label=None,
+                linewidth="1.5",
+                linestyle=":",
+                color="gray",
+            )
+            (line,) = self.ax.plot(
+                self.line_x[:1],
+                self.top_probs[i, :1],
+                label=top_labels[i],
+                linewidth="2.0",
+                animated=True,
+            )
+            self.lines.append(line)
+
+        self.ax.grid(which="major", linestyle=":", linewidth="1.0", alpha=grid_alpha)
+        self.ax.grid(which="minor", linestyle=":", linewidth="0.5", alpha=grid_alpha)
+
+        # The playhead is part of the autoscaled data limits, like the vlines it replaces
+        min_height = self.top_probs.min() * playhead_scale
+        max_height = self.top_probs.max()
+        (self.playhead,) = self.ax.plot(
+            [0.0, 0.0],
+            [min_height, max_height],
+            color="red",
+            linewidth=mpl.rcParams["lines.linewidth"],
+            animated=True,
+        )
+        (self.playhead_marker,) = self.ax.plot(
+            [0.0], [max_height], color="red", marker="o", linestyle="", animated=True
+        )
+
+        self.legend = self.ax.legend(loc=legend_loc)
+        self.legend.set_animated(True)
+
+        self.ax.set_xlim(0, duration_seconds)
+        self.ax.set_ylabel("Probability")
+        self.ax.set_xlabel("Time (s)")
+        self.ax.set_yscale("log")
+
+        self.fig.tight_layout()
+        self.background = None
+
+    def _init_background(self, image):
+        if image is not None:
+            self.image_artist = self.image_ax.imshow(
+                image, interpolation="nearest", animated=True
+            )
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def render(self, step, image=None):
+        """Renders the plot at a given time step.
+
+        Args:
+          step: the current time step in the range [0, num_frames).
+          image: the video frame to display at the current time step.
+
+        Returns:
+          The output uint8 RGB image of shape (figure_height, width, 3).
+        """
+        if self.background is None:
+            self._init_background(image)
+
+        self.canvas.restore_region(self.background)
+
+        if self.image_artist is not None and image is not None:
+            self.image_artist.set_data(image)
+            self.image_ax.draw_artist(self.image_artist)
+
+        # Same stacking order as the static plot: playhead, lines, then legend
+        x = self.line_x[step]
+        self.playhead.set_xdata([x, x])
+        self.playhead_marker.set_xdata([x])
+        self.ax.draw_artist(self.playhead)
+        self.ax.draw_artist(self.playhead_marker)
+
+        for i, line in enumerate(self.lines):
+            line.set_data(self.line_x[: step + 1], self.top_probs[i, : step + 1])
+            self.ax.draw_artist(line)
+
+        self.ax.draw_artist(self.legend)
+
+        return np.asarray(self.canvas.buffer_rgba())[..., :3].copy()
+
+    def close(self):
+        self.fig.clear()
@@ -0,0 +1,213 @@
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from services.execution_layout import available_cpus
+from utils import logger
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+"""The TFLite conversions: none, float16 weights and dynamic-range int8 weights."""
+
+
+def tflite_model_path(export_root, export_name, quantization):
+    return f"{export_root}/tflite/{export_name}-{quantization}.tflite"
+
+
+def init_states_path(export_root, export_name):
+    return f"{export_root}/tflite/{export_name}-init-states.npz"
+
+
+def parse_backend(backend):
+    """Splits a backend name such as "tflite-int8" into ("tflite", "int8").
+
+    "tf" and "tflite" (float32) are the other valid names.
+    """
+    name, _, quantization = backend.partition("-")
+    if name == "tf" and not quantization:
+        return name, None
+    quantization = {"": "float32", "fp16": "float16"}.get(quantization, quantization)
+    if name != "tflite" or quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unsupported inference backend: {backend}")
+    return name, quantization
+
+
+def _state_name(index):
+    return f"state_{index:03d}"
+
+
+def convert_to_tflite(predictor, export_root, quantization, image_size=None):
+    """Converts the hub model of a predictor into a TFLite model.
+
+    The base model keeps a dynamic batch size and number of frames. The
+    stream model is converted as a single frame step whose states are explicit
+    inputs and outputs, renamed `state_000`, `state_001`, ... in the sorted
+    order of the original names; its initial states are saved next to it.
+
+    Args:
+      predictor: a VideoPredictor with the hub model loaded, i.e. a Keras `model`.
+      export_root: the directory of the exported models.
+      quantization: one of `QUANTIZATIONS`.
+      image_size: the (height, width) of the frames, fixed in the TFLite
+        model. Defaults to the resolution of the model.
+
+    Returns:
+      The path of the TFLite model.
+    """
+    height, width = image_size or (predictor.spec.resolution, predictor.spec.resolution)
+    model = predictor.model
+    path = tflite_model_path(export_root, predictor.spec.export_name, quantization)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if predictor.model_type == "base":
+
+        @tf.function(
+            input_signature=[
+                tf.TensorSpec([None, None, height, width, 3], tf.float32, name="image")
+            ]
+        )
+        def step(image):
+            return {"logits": model(image, training=False)}
+
+    else:
+        init_states = predictor.init_states_fn(tf.constant([1, 1, height, width, 3]))
+        names = sorted(init_states)
+        np.savez(
+            init_states_path(export_root, predictor.spec.export_name),
+            **{_state_name(i): init_states[name].numpy() for i, name in enumerate(names)},
+        )
+        specs = [
+            tf.TensorSpec(init_states[name].shape, init_states[name].dtype, name=_state_name(i))
+            for i, name in enumerate(names)
+        ]
+
+        @tf.function(
+            input_signature=[
+                tf.TensorSpec([1, 1, height, width, 3], tf.float32, name="image"),
+                *specs,
+            ]
+        )
+        def step(image, *states):
+            logits, states = model({**dict(zip(names, states)), "image": image})
+            outputs = {_state_name(i): states[name] for i, name in enumerate(names)}
+            return {"logits": logits, **outputs}
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [step.get_concrete_function()], model
+    )
+    if quantization != "float32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    logger.log_info(f"Converted the {predictor.spec.name} model to {path}")
+    return path
+
+
+class TFLiteBackend:
+    """Runs a converted model with the TFLite interpreter.
+
+    The float kernels run on the XNNPACK delegate, which the interpreter
+    applies by default, with `num_threads` threads. `base_step`,
+    `init_states_fn` and `stream_step` mirror the TensorFlow steps of
+    VideoPredictor, so either backend can run `predict_top_k`. Interpreters
+    are not thread safe, so every thread running `stream_step` gets its own.
+    """
+
+    def __init__(self, model_path, model_type, num_threads=None, init_states=None):
+        """
+        Args:
+          model_path: the TFLite model made by `convert_to_tflite`.
+          model_type: "base" or "stream".
+          num_threads: the interpreter and XNNPACK threads. By default the
+            TensorFlow intra-op threads if set, e.g. by the worker layout,
+            otherwise the CPUs the process may run on.
+          init_states: the .npz initial states of a stream model.
+        """
+        self.model_type = model_type
+        self.model_path = model_path
+        self.num_threads = (
+            num_threads
+            or tf.config.threading.get_intra_op_parallelism_threads()
+            or len(available_cpus())
+        )
+        self.interpreter = None
+        self._image_shape = None
+        self._local = threading.local()
+
+        self.initial_states = None
+        if model_type == "stream":
+            with np.load(init_states) as states:
+                self.initial_states = {name: states[name] for name in states.files}
+            self._create_interpreter()
+            self._local.interpreter = self.interpreter
+
+    def _create_interpreter(self, image_shape=None):
+        """Creates the interpreter, with the given image shape if dynamic.
+
+        XNNPACK only delegates graphs whose tensors all have a static size
+        when the tensors are first allocated, so a base model is resized to the
+        frame count of the video before that.
+        """
+        self.interpreter = tf.lite.Interpreter(
+            model_path=self.model_path, num_threads=self.num_threads
+        )
+        # The tensor indices of the signature, so each frame only copies data
+        runner = self.interpreter.get_signature_runner()
+        self._inputs = {
+            name: detail["index"] for name, detail in runner.get_input_details().items()
+        }
+        self._outputs = {
+            name: detail["index"] for name, detail in runner.get_output_details().items()
+        }
+        # The runner holds on to the interpreter's buffers, which blocks resizing
+        del runner
+        if image_shape is not None:
+            self.interpreter.resize_tensor_input(self._inputs["image"], image_shape)
+        self.interpreter.allocate_tensors()
+        self._image_shape = image_shape
+
+    def image_size(self):
+        """Returns the (height, width) of the frames, fixed when the model was converted."""
+        interpreter = self.interpreter or tf.lite.Interpreter(model_path=self.model_path)
+        shape = interpreter.get_signature_runner().get_input_details()["image"]["shape_signature"]
+        return int(shape[2]), int(shape[3])
+
+    def base_step(self, video):
+        """Maps videos of shape (batch, frames, height, width, 3) to (batch, num_classes) logits."""
+        video = np.asarray(video, np.float32)
+        if video.shape != self._image_shape:
+            self._create_interpreter(video.shape)
+        self.interpreter.set_tensor(self._inputs["image"], video)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self._outputs["logits"])
+
+    def init_states_fn(self, input_shape):
+        """Returns the initial states, the same for every video of the fixed size."""
+        return dict(self.initial_states)
+
+    def stream_step(self, states, clip):
+        """Advances the states over a clip of shape (1, frames, height, width, 3).
+
+        Returns:
+          The per-frame logits of shape (frames, num_classes) and the new states.
+        """
+        clip = np.asarray(clip, np.float32)
+        interpreter = getattr(self._local, "interpreter", None)
+        if interpreter is None:
+            interpreter = tf.lite.Interpreter(
+                model_path=self.model_path, num_threads=self.num_threads
+            )
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+        all_logits = []
+        for i in range(clip.shape[1]):
+            interpreter.set_tensor(self._inputs["image"], clip[:, i : i + 1])
+            for name, state in states.items():
+                interpreter.set_tensor(self._inputs[name], state)
+            interpreter.invoke()
+            all_logits.append(interpreter.get_tensor(self._outputs["logits"])[0])
+            states = {name: interpreter.get_tensor(self._outputs[name]) for name in states}
+        return np.stack(all_logits), states
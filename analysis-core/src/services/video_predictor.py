@@ -1,62 +1,237 @@
 import tensorflow as tf
-import tensorflow_io as tfio
-import tensorflow_hub as hub
+import numpy as np
 import os
 import tqdm
-from config import working_dir
+from concurrent.futures import ThreadPoolExecutor
+from config import working_dir, frame_chunk_size, stream_clip_size, inference_model_dir, model_warmup, \
+    inference_backend, inference_backends, tflite_num_threads, base_batch_size, base_batch_frames, base_batch_padding, \
+    stream_segments, stream_segment_warmup, stream_segment_workers
+from services.batching import length_buckets, pad_frames
+from services.frame_source import FrameSource, normalize
+from services.model_registry import get_model_spec, labels_path, model_frame_size
+from services.postprocessing import softmax, top_k_predictions
+from services.tflite_backend import TFLiteBackend, init_states_path, parse_backend, tflite_model_path
 from utils import logger
 
 
 class VideoPredictor:
-    _instance = None
+    _instances = {}
+    """One warm predictor per model, keyed by the export name of its ModelSpec,
+        so several models can be loaded in the same process at the same time."""
+
+    _label_maps = {}
+    """The (tensor, list) label map of each label set, loaded once per process."""
 
     KINETICS_600_LABELS = None
     KINETICS_600_LABELS_LIST = None
     k = 5
+    spec = None
+    """The ModelSpec of the model, see `services.model_registry`."""
     model_type = None
+    backend = None
+    """The inference backend: "tf", or "tflite" followed by the quantization."""
     model = None
-    video = None
-    """The user uploaded video to analyze and display in the plot."""
+    frames = None
+    """The lazily decoded frame source of the user uploaded video to analyze and
+        display in the plot."""
+
+    num_frames = None
 
     probs = None
     """The probability tensor of shape (num_frames, num_classes) that represents
         the probability of each class on each frame."""
 
+    logits = None
+    """The logits the probabilities were computed from, None if they were
+        restored from a previous run."""
+
+    early_exit_monitor = None
+    """The EarlyExitMonitor of the last stream analysis, if any."""
+
+    batch_probs = None
+    """The probabilities of shape (num_classes,) of each video of the last batch."""
+
     init_states_fn = None
+    base_step = None
+    stream_step = None
+    max_batch_size = None
+    """The most videos per base model call, None if unbounded."""
+
+    def __new__(cls, model_name="base"):
+        key = get_model_spec(model_name).export_name
+        if key not in cls._instances:
+            cls._instances[key] = super(VideoPredictor, cls).__new__(cls)
+        return cls._instances[key]
+
+    def __init__(self, model_name="base"):
+        """
+        Args:
+          model_name: an analysis model name of the registry, or "base" or
+            "stream" for the default model of the mode.
+        """
+        spec = get_model_spec(model_name)
+        self.load_labels(spec.labels)
+
+        if spec is not self.spec:
+            self.spec = spec
+            self.model_type = spec.mode
+            if self.backend_name(spec) == "tf" or not self.load_tflite_model(spec):
+                self.backend = "tf"
+                if not self.load_inference_model(spec):
+                    self.load_movinet_from_hub(spec)
+            if model_warmup:
+                self.warmup()
+
+    @staticmethod
+    def backend_name(spec):
+        """Returns the inference backend configured for the model name or mode of a ModelSpec."""
+        return inference_backends.get(spec.name, inference_backends.get(spec.mode, inference_backend))
+
+    @classmethod
+    def model_version(cls, model_name):
+        """Identifies the model weights, e.g. for keying cached results."""
+        spec = get_model_spec(model_name)
+        version = spec.version
+        backend = cls.backend_name(spec)
+        # Converted models and parallel segments do not give exactly the same probabilities
+        if backend != "tf":
+            version = f"{version}-{backend}"
+        if spec.mode == "stream" and stream_segments > 1:
+            version = f"{version}-segments{stream_segments}-warmup{stream_segment_warmup}"
+        return version
+
+    def load_labels(self, labels):
+        """Loads the label map of a label set, once per process."""
+        if labels not in self._label_maps:
+            with tf.io.gfile.GFile(labels_path(labels)) as f:
+                label_list = [line.strip() for line in f.readlines()]
+            self._label_maps[labels] = (tf.constant(label_list), label_list)
+        self.KINETICS_600_LABELS, self.KINETICS_600_LABELS_LIST = self._label_maps[labels]
 
-    def __new__(self, model_type):
-        if self._instance is None:
-            self._instance = super(VideoPredictor, self).__new__(self)
-        return self._instance
-
-    def __init__(self, model_type="base"):
-        if self.KINETICS_600_LABELS is None or self.KINETICS_600_LABELS_LIST is None:
-            with tf.io.gfile.GFile(f"{working_dir}/kinetics_600_labels.txt") as f:
-                lines = f.readlines()
-                self.KINETICS_600_LABELS_LIST = [line.strip() for line in lines]
-                self.KINETICS_600_LABELS = tf.constant(self.KINETICS_600_LABELS_LIST)
-
-        if model_type != self.model_type:
-            self.model_type = model_type
-            self.load_movinet_from_hub(
-                model_id="a2", model_mode=model_type, hub_version=3
+    def release(self):
+        """Forgets the predictor, the next one of the model loads it again."""
+        if self._instances.get(self.spec.export_name) is self:
+            del self._instances[self.spec.export_name]
+
+    def memory_bytes(self):
+        """Estimates the memory of the model weights, e.g. for the model registry."""
+        if isinstance(self.model, TFLiteBackend):
+            return os.path.getsize(self.model.model_path)
+        variables = getattr(self.model, "model_variables", None) or self.model.variables
+        return sum(int(np.prod(v.shape)) * v.dtype.size for v in variables)
+
+    def load_inference_model(self, spec):
+        """Loads the inference-only model exported by `export_inference_model`.
+
+        Returns:
+          False if the model was not exported, e.g. outside the Docker image.
+        """
+        model_mode = spec.mode
+        export_dir = f"{inference_model_dir}/{spec.export_name}"
+        if not os.path.exists(export_dir):
+            return False
+
+        logger.log_info(f"Loading the exported {spec.name} model: {export_dir}")
+        self.model = tf.saved_model.load(export_dir)
+        if model_mode == "base":
+            self.base_step = self.model.base_step
+            if self.base_step.input_signature[0].shape[0] == 1:
+                logger.log_warning(
+                    f"The exported base model predates batching, export it again: {export_dir}"
+                )
+                self.max_batch_size = 1
+        else:
+            self.init_states_fn = self.model.init_states
+            self.stream_step = self.model.stream_step
+        return True
+
+    def load_tflite_model(self, spec):
+        """Loads the TFLite model of the configured quantization.
+
+        Returns:
+          False if the model was not converted, or for frames of another size
+          than the configured one, the TF backend is used instead.
+        """
+        model_type = spec.mode
+        backend = self.backend_name(spec)
+        _, quantization = parse_backend(backend)
+        model_path = tflite_model_path(inference_model_dir, spec.export_name, quantization)
+        if not os.path.exists(model_path):
+            logger.log_warning(f"No {backend} model in {model_path}, using the TF backend")
+            return False
+
+        logger.log_info(f"Loading the {backend} {spec.name} model: {model_path}")
+        self.model = TFLiteBackend(
+            model_path,
+            model_type,
+            num_threads=tflite_num_threads,
+            init_states=init_states_path(inference_model_dir, spec.export_name),
+        )
+        # The TFLite models take frames of the size they were converted for only
+        size = model_frame_size(spec.name)
+        height, width = self.model.image_size()
+        if (height, width) != (size, size):
+            logger.log_warning(
+                f"The {backend} {spec.name} model takes {height}x{width} frames, "
+                f"not the configured {size}x{size}, using the TF backend"
             )
+            self.model = None
+            return False
+        if model_type == "base":
+            self.base_step = self.model.base_step
+        else:
+            self.init_states_fn = self.model.init_states_fn
+            self.stream_step = self.model.stream_step
+        self.backend = backend
+        return True
+
+    def export_inference_model(self, export_dir):
+        """Exports the compiled steps of the loaded model as a SavedModel.
 
-    def load_movinet_from_hub(self, model_id, model_mode, hub_version=3):
-        """Loads a MoViNet model either from the cache or TF Hub."""
+        Only the concrete functions and the variables they use are saved, so
+        loading the export skips the hub layer, the Keras model and the tracing.
+        """
+        module = tf.Module()
+        module.model_variables = list(self.model.variables)
+        if self.model_type == "base":
+            module.base_step = self.base_step
+        else:
+            module.init_states = tf.function(
+                self.init_states_fn, input_signature=[tf.TensorSpec([5], tf.int32)]
+            )
+            module.stream_step = self.stream_step
+        tf.saved_model.save(module, export_dir)
 
+    def warmup(self, num_frames=stream_clip_size, image_size=None):
+        """Runs the model once on a blank clip, so the first video does not pay
+        for the graph optimization and the kernel initialization. The frames
+        have the model resolution by default."""
+        height, width = image_size or (self.spec.resolution, self.spec.resolution)
+        clip = tf.zeros([1, num_frames, height, width, 3])
+        if self.model_type == "base":
+            self.base_step(clip)
+        else:
+            states = self.init_states_fn(tf.constant([1, 1, height, width, 3]))
+            self.stream_step(states, clip)
+
+    def load_movinet_from_hub(self, spec):
+        """Loads the MoViNet model of a ModelSpec either from the cache or TF Hub."""
+        # Only needed when no exported inference model is available
+        import tensorflow_hub as hub
+
+        model_mode = spec.mode
         # Designated cache location
-        cache_path = f"{working_dir}/models/{model_mode}"
+        cache_path = f"{working_dir}/models/{spec.export_name}"
 
         # Load model from cache if it exists
         if os.path.exists(cache_path):
-            logger.log_info(f"Found the {model_mode} model in cache: {cache_path}")
+            logger.log_info(f"Found the {spec.name} model in cache: {cache_path}")
             hub_path = cache_path
         else:
             logger.log_warning(
-                f"Couldn't find the model {model_mode} in cache. Loading from TF hub."
+                f"Couldn't find the model {spec.name} in cache. Loading from TF hub."
             )
-            hub_path = f"https://tfhub.dev/tensorflow/movinet/{model_id}/{model_mode}/kinetics-600/classification/{hub_version}"
+            hub_path = spec.hub_url
 
         encoder = hub.KerasLayer(hub_path, trainable=True)
 
@@ -91,65 +266,357 @@ class VideoPredictor:
         model.build([1, 1, 1, 1, 3])
         self.model = model
 
-    def predict_top_k(self):
-        """Outputs the top k model labels and probabilities on the given video."""
+        if model_mode == "base":
+            self.base_step = self.build_base_step(model)
+        else:
+            self.stream_step = self.build_stream_step(model, state_shapes)
+
+    @staticmethod
+    def build_base_step(model):
+        """Compiles the base model call for batches of videos of any length and size.
+
+        Returns:
+          A tf.function mapping videos of shape (batch, frames, height, width, 3)
+            to the logits of shape (batch, num_classes).
+        """
+
+        @tf.function(
+            input_signature=[tf.TensorSpec([None, None, None, None, 3], tf.float32)]
+        )
+        def base_step(video):
+            return model(video, training=False)
+
+        return base_step
+
+    @staticmethod
+    def build_stream_step(model, state_shapes):
+        """Compiles a step that advances the stream states over a clip of frames.
+
+        The input signature leaves the clip length and spatial dimensions
+        unknown, so clips of any size (including the shorter last clip) reuse
+        the same graph instead of retracing.
+
+        Args:
+          model: the stream Keras model taking the states and a single frame.
+          state_shapes: a dict mapping state names to (shape, dtype) tuples.
+
+        Returns:
+          A tf.function mapping (states, clip) to the per-frame logits of shape
+            (clip_frames, num_classes) and the updated states.
+        """
+        states_signature = {
+            name: tf.TensorSpec([None] * len(shape), dtype)
+            for name, (shape, dtype) in state_shapes.items()
+        }
+        clip_signature = tf.TensorSpec([1, None, None, None, 3], tf.float32)
+
+        @tf.function(input_signature=[states_signature, clip_signature])
+        def stream_step(states, clip):
+            num_frames = tf.shape(clip)[1]
+            all_logits = tf.TensorArray(tf.float32, size=num_frames)
+            # The model is still fed one frame at a time, so the logits match
+            # the eager frame by frame loop
+            for i in tf.range(num_frames):
+                logits, states = model({**states, "image": clip[:, i : i + 1]})
+                all_logits = all_logits.write(i, logits[0])
+            return all_logits.stack(), states
+
+        return stream_step
+
+    def predict_top_k(self, chunks=None, checkpoint=None, early_exit=None, progress=None):
+        """Outputs the top k model labels and probabilities on the given video.
+
+        Args:
+          chunks: an iterable of uint8 frame chunks to analyze, e.g. fed by a
+            concurrent decoder. Defaults to decoding `self.frames`.
+          checkpoint: an optional StreamCheckpoint the sequential stream
+            analysis resumes from and periodically saves its progress to.
+          early_exit: an optional EarlyExitPolicy of the sequential stream
+            analysis. Its outcome is reported by `early_exit_report`.
+          progress: an optional ProgressReporter the sequential stream
+            analysis reports its running top-k predictions to.
+        """
+        if chunks is None:
+            chunks = self.frames.iter_chunks()
+        self.early_exit_monitor = None
 
         if self.model_type == "base":
             logger.log_info("Running the base model over the whole video...")
-            outputs = self.model.predict(self.video[tf.newaxis])[0]
+            # The base model needs the whole clip at once, keep it as uint8 until the model call
+            video = np.concatenate(list(chunks))
+            self.num_frames = video.shape[0]
+            outputs = self.base_step(normalize(video)[tf.newaxis])[0]
+            self.logits = outputs
             self.probs = tf.nn.softmax(outputs)
             return self.get_top_k(self.probs)
+        elif stream_segments > 1:
+            logger.log_info(f"Running the stream model over {stream_segments} segments in parallel...")
+            # Every segment needs random access to the frames, so the whole clip is kept as uint8
+            video = np.concatenate(list(chunks))
+            logits = self.predict_segment_logits(video)
         else:
             logger.log_info("Running the stream model for frame by frame analysis...")
-            init_states = self.init_states_fn(tf.shape(self.video[tf.newaxis]))
-            images = tf.split(self.video[tf.newaxis], self.video.shape[0], axis=1)
-
             all_logits = []
-            # To run on a video, pass in one frame at a time
-            states = init_states
-            for image in tqdm.tqdm(images):
-                # predictions for each frame
-                logits, states = self.model({**states, "image": image})
+            states = None
+            resume_index = 0
+            restored = checkpoint.load() if checkpoint else None
+            if restored:
+                resume_index, states, logits = restored
                 all_logits.append(logits)
 
+            monitor = None
+            if early_exit and early_exit.enabled:
+                monitor = early_exit.monitor(self.k, resume_index, self.frames.expected_frames)
+                self.early_exit_monitor = monitor
+            # An early exit and the progress are checked after every clip instead of every chunk
+            clip_size = stream_clip_size if monitor or progress else None
+            if progress:
+                progress.start(resume_index)
+            with tqdm.tqdm(unit="frame") as progress_bar:
+                for frames, frame_index in self.iter_clips(chunks, resume_index, clip_size):
+                    logits, states = self.stream_frames(frames, states)
+                    all_logits.append(logits)
+                    progress_bar.update(frames.shape[0])
+                    if monitor and monitor.update(softmax(logits)):
+                        logger.log_info(f"Early exit at frame {frame_index}: {monitor.reason}")
+                        break
+                    if checkpoint and checkpoint.due():
+                        checkpoint.save(frame_index, states, tf.concat(all_logits, 0))
+                    if progress and progress.due():
+                        progress.report(
+                            frame_index,
+                            self.get_top_k(softmax(logits[-1])),
+                            self.frames.expected_frames(),
+                        )
+
             # concatinating all the logits
             logits = tf.concat(all_logits, 0)
-            # estimating probabilities
-            self.probs = tf.nn.softmax(logits, axis=-1)
-            final_probs = self.probs[-1]
-            return self.get_top_k(final_probs)
+
+        self.num_frames = logits.shape[0]
+        # estimating probabilities
+        self.logits = logits
+        self.probs = tf.nn.softmax(logits, axis=-1)
+        final_probs = self.probs[-1]
+        return self.get_top_k(final_probs)
+
+    @staticmethod
+    def iter_clips(chunks, start=0, clip_size=None):
+        """Yields the frames of the chunks from the frame index `start` on.
+
+        The frames before `start`, e.g. analyzed before a checkpoint, are only
+        decoded.
+
+        Args:
+          chunks: an iterable of uint8 frame chunks.
+          start: the index of the first frame to yield.
+          clip_size: the most frames yielded at once, a whole chunk by default.
+
+        Yields:
+          The uint8 frames and the index of the frame after them.
+        """
+        frame_index = 0
+        for chunk in chunks:
+            skip = min(max(start - frame_index, 0), chunk.shape[0])
+            step = clip_size or chunk.shape[0]
+            for first in range(skip, chunk.shape[0], step):
+                frames = chunk[first : first + step]
+                yield frames, frame_index + first + frames.shape[0]
+            frame_index += chunk.shape[0]
+
+    def stream_frames(self, frames, states=None):
+        """Advances the stream states over uint8 frames, several frames per compiled call.
+
+        Args:
+          frames: uint8 frames of shape (frames, height, width, 3).
+          states: the states to start from, the initial states by default.
+
+        Returns:
+          The per-frame logits of shape (frames, num_classes) and the new states.
+        """
+        if states is None:
+            height, width = frames.shape[1:3]
+            states = self.init_states_fn(tf.constant([1, 1, height, width, 3]))
+        all_logits = []
+        for start in range(0, frames.shape[0], stream_clip_size):
+            clip = normalize(frames[start : start + stream_clip_size])
+            logits, states = self.stream_step(states, clip[tf.newaxis])
+            all_logits.append(logits)
+        return tf.concat(all_logits, 0), states
+
+    @staticmethod
+    def segment_bounds(num_frames, num_segments, min_frames=1):
+        """Splits the frames into contiguous segments of about the same length.
+
+        Returns:
+          At most `num_segments` (start, end) frame ranges, fewer if the
+          segments would be shorter than `min_frames`.
+        """
+        num_segments = max(1, min(num_segments, num_frames // max(min_frames, 1)))
+        edges = np.linspace(0, num_frames, num_segments + 1).round().astype(int)
+        return [(int(start), int(end)) for start, end in zip(edges[:-1], edges[1:])]
+
+    def predict_segment_logits(
+        self,
+        video,
+        num_segments=stream_segments,
+        warmup_frames=stream_segment_warmup,
+        workers=stream_segment_workers,
+    ):
+        """Runs the stream model over segments of a video in parallel.
+
+        Every segment starts from the initial states and first runs over the
+        last `warmup_frames` frames of the previous segment, whose logits are
+        dropped, so its states get close to the sequential ones before its
+        own frames. The states accumulated over the whole video are lost
+        though, so the probabilities deviate from a sequential run, see
+        `benchmarks/segment_deviation.py`.
+
+        Args:
+          video: uint8 frames of shape (frames, height, width, 3).
+          num_segments: the number of segments, fewer for short videos.
+          warmup_frames: the frames of the previous segment replayed first.
+          workers: the segments run at the same time, all of them by default.
+
+        Returns:
+          The per-frame logits of shape (frames, num_classes), in order.
+        """
+        bounds = self.segment_bounds(
+            video.shape[0], num_segments, max(warmup_frames, stream_clip_size)
+        )
+
+        def run_segment(bound):
+            start, end = bound
+            first = max(0, start - warmup_frames)
+            logits, _ = self.stream_frames(video[first:end])
+            return logits[start - first :]
+
+        with ThreadPoolExecutor(max_workers=workers or len(bounds)) as executor:
+            return tf.concat(list(executor.map(run_segment, bounds)), 0)
+
+    def predict_batch_top_k(
+        self,
+        videos,
+        batch_size=base_batch_size,
+        batch_frames=base_batch_frames,
+        max_padding=base_batch_padding,
+    ):
+        """Runs the base model over several videos, batching the similar ones.
+
+        Videos of the same frame size are bucketed by length, see
+        `length_buckets`. Padded videos end with copies of their last frame,
+        which changes their probabilities slightly, so the default only
+        batches videos of the same length.
+
+        Args:
+          videos: uint8 arrays of shape (frames, height, width, 3).
+          batch_size: the maximum number of videos per model call.
+          batch_frames: the maximum number of padded frames per model call.
+          max_padding: the largest fraction of padded frames of a video.
+
+        Returns:
+          The top-k predictions of each video, in the order of `videos`. Their
+          probabilities are kept in `batch_probs`.
+        """
+        if self.model_type != "base":
+            raise ValueError("Only the base model analyzes batches of videos")
+        batch_size = min(batch_size, self.max_batch_size or batch_size)
+
+        by_frame_size = {}
+        for index, video in enumerate(videos):
+            by_frame_size.setdefault(video.shape[1:], []).append(index)
+
+        probs = [None] * len(videos)
+        for indices in by_frame_size.values():
+            lengths = [videos[i].shape[0] for i in indices]
+            for bucket in length_buckets(lengths, batch_size, batch_frames, max_padding):
+                batch = [indices[i] for i in bucket]
+                num_frames = videos[batch[0]].shape[0]
+                clips = np.stack([pad_frames(videos[i], num_frames) for i in batch])
+                logits = self.base_step(normalize(clips))
+                for index, video_probs in zip(batch, softmax(logits)):
+                    probs[index] = video_probs
+                logger.log_info(f"Analyzed a batch of {len(batch)} videos of {num_frames} frames")
+
+        self.batch_probs = probs
+        return top_k_predictions(np.stack(probs), self.KINETICS_600_LABELS_LIST, self.k)
 
     def get_top_k(self, probs):
         """Outputs the top k model labels and probabilities on the given video."""
-        top_predictions = tf.argsort(probs, axis=-1, direction="DESCENDING")[: self.k]
-        top_labels = tf.gather(self.KINETICS_600_LABELS, top_predictions, axis=-1)
-        top_labels = [label.decode("utf8") for label in top_labels.numpy()]
-        top_probs = tf.gather(probs, top_predictions, axis=-1).numpy()
-        return tuple(zip(top_labels, top_probs))
-
-    def load_mp4(self, file_path, image_size=(224, 224)):
-        video = tf.io.read_file(file_path)
-        video = tfio.experimental.ffmpeg.decode_video(video)
-        video = tf.image.resize(video, image_size)
-        video = tf.cast(video, tf.float32) / 255.0
-        self.video = video
-
-    def load_gif(self, file_path, image_size=(224, 224)):
-        """Loads a gif file into a TF tensor."""
-        with tf.io.gfile.GFile(file_path, "rb") as f:
-            video = tf.io.decode_gif(f.read())
-        video = tf.image.resize(video, image_size)
-        video = tf.cast(video, tf.float32) / 255.0
-        self.video = video
-
-    def run_prediction(self, vide_path):
-        _, file_extension = os.path.splitext(vide_path)
-        logger.log_info(f"Analyzing {vide_path}")
+        return top_k_predictions(probs, self.KINETICS_600_LABELS_LIST, self.k)
+
+    @property
+    def early_exit_report(self):
+        """The outcome of the early exit policy of the last stream analysis, or None."""
+        return self.early_exit_monitor.report() if self.early_exit_monitor else None
 
-        if file_extension == ".mp4":
-            self.load_mp4(vide_path)
-        elif file_extension == ".gif":
-            self.load_gif(vide_path)
+    @property
+    def sampled_fps(self):
+        """The rate of the analyzed frames over the video duration, or None if unknown."""
+        duration = self.frames.duration if self.frames else None
+        if not self.num_frames or not duration:
+            return None
+        report = self.early_exit_report
+        if report and report.get("frames_saved"):
+            # The analysis stopped early, the frames still span the whole video
+            return report["expected_frames"] / duration
+        return self.num_frames / duration
+
+    def load_frames(
+        self, file_path, image_size=(224, 224), sampling=None, duration=None, complete=None
+    ):
+        """Prepares a lazily decoded, chunked frame source for an MP4 or GIF file.
+
+        Args:
+          file_path: the video file.
+          image_size: the (height, width) the frames are scaled to.
+          sampling: the FrameSampling policy of the analyzed frames.
+          duration: the video duration in seconds, if already known.
+          complete: a callable telling whether the file is completely
+            written, e.g. while it is still downloading.
+        """
+        self.frames = FrameSource(
+            file_path,
+            image_size=image_size,
+            chunk_size=frame_chunk_size,
+            sampling=sampling,
+            duration=duration,
+            complete=complete,
+        )
+        self.num_frames = None
+
+    def restore_prediction(
+        self, vide_path, probs, sampling=None, image_size=(224, 224), early_exit=None
+    ):
+        """Restores the probabilities of a previous run on the same video.
+
+        With an `early_exit` policy, the probabilities may only cover the first frames.
+        """
+        self.load_frames(vide_path, image_size, sampling=sampling)
+        self.probs = tf.constant(probs)
+        self.logits = None
+        self.num_frames = self.probs.shape[0]
+        self.early_exit_monitor = None
+        if early_exit and early_exit.enabled:
+            self.early_exit_monitor = early_exit.monitor(
+                self.k, self.num_frames, self.frames.expected_frames
+            )
+
+    def run_batch_prediction(self, video_paths, sampling=None, image_size=(224, 224)):
+        """Decodes several video files and analyzes them in batches.
+
+        Returns:
+          The top-k predictions of each video, in the order of `video_paths`.
+        """
+        logger.log_info(f"Analyzing {len(video_paths)} videos")
+        videos = [
+            np.concatenate(list(FrameSource(path, image_size, frame_chunk_size, sampling).iter_chunks()))
+            for path in video_paths
+        ]
+        return self.predict_batch_top_k(videos)
+
+    def run_prediction(self, vide_path, sampling=None, image_size=(224, 224)):
+        logger.log_info(f"Analyzing {vide_path}")
+        self.load_frames(vide_path, image_size, sampling=sampling)
 
         # Run the model on the video and output the top 5 predictions
         return self.predict_top_k()
@@ -0,0 +1,189 @@
+import errno
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import imageio_ffmpeg
+import numpy as np
+
+from config import output_video_codec, output_video_crf, output_video_preset
+
+PIPE_CHUNK_SIZE = 1024 * 1024
+
+
+def _output_args(output, output_format, faststart=False):
+    """Returns the ffmpeg output arguments for a file path or a streamed sink."""
+    if output_format == "gif":
+        args = ["-f", "gif"]
+    else:
+        args = ["-f", "mp4"]
+        if not isinstance(output, str):
+            # A fragmented MP4 does not need to seek back to write the moov box
+            args += ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+        elif faststart:
+            # The moov box first, so the file can be read from a pipe
+            args += ["-movflags", "+faststart"]
+    return args + [output if isinstance(output, str) else "pipe:1"]
+
+
+def _pump(stream, sink):
+    """Copies the encoder's stdout into a writable sink until EOF."""
+    for block in iter(lambda: stream.read(PIPE_CHUNK_SIZE), b""):
+        sink.write(block)
+
+
+class _FfmpegProcess:
+    """Runs ffmpeg, streaming its stdout to a sink when output is not a path."""
+
+    def __init__(self, args, output, stdin=None):
+        self.output = output
+        self.process = subprocess.Popen(
+            [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error", *args],
+            stdin=stdin,
+            stdout=None if isinstance(output, str) else subprocess.PIPE,
+        )
+        self.pump = None
+        if not isinstance(output, str):
+            self.pump = threading.Thread(
+                target=_pump, args=(self.process.stdout, output), daemon=True
+            )
+            self.pump.start()
+
+    def wait(self):
+        if self.process.stdin:
+            self.process.stdin.close()
+        if self.pump:
+            self.pump.join()
+        return_code = self.process.wait()
+        if return_code != 0:
+            raise RuntimeError(f"ffmpeg exited with code {return_code}")
+
+
+class VideoWriter:
+    """Encodes RGB frames incrementally with ffmpeg.
+
+    Frames are piped to the encoder as soon as they are appended, so memory
+    stays flat regardless of the video length. The output is either a file path
+    or a writable sink (e.g. an S3 multipart upload) receiving the encoded bytes
+    while encoding is still running. With `faststart`, an MP4 file has its
+    moov box first, so `concat_videos` can stream it.
+    """
+
+    def __init__(
+        self,
+        output,
+        fps=25,
+        output_format="mp4",
+        codec=output_video_codec,
+        crf=output_video_crf,
+        preset=output_video_preset,
+        faststart=False,
+    ):
+        self.output = output
+        self.fps = fps
+        self.output_format = output_format
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.faststart = faststart
+        self._ffmpeg = None
+
+    def _start(self, frame):
+        height, width = frame.shape[:2]
+        args = [
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}",
+            "-r", str(self.fps),
+            "-i", "pipe:0",
+        ]
+        if self.output_format != "gif":
+            args += [
+                "-c:v", self.codec,
+                "-crf", str(self.crf),
+                "-preset", self.preset,
+                "-pix_fmt", "yuv420p",
+                # yuv420p needs even dimensions
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            ]
+        self._ffmpeg = _FfmpegProcess(
+            args + _output_args(self.output, self.output_format, self.faststart),
+            self.output,
+            stdin=subprocess.PIPE,
+        )
+
+    def append_data(self, frame):
+        if self._ffmpeg is None:
+            self._start(frame)
+        self._ffmpeg.process.stdin.write(np.ascontiguousarray(frame, np.uint8).tobytes())
+
+    def close(self):
+        if self._ffmpeg is not None:
+            self._ffmpeg.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _open_fifo(path, ffmpeg):
+    """Opens a FIFO for writing once ffmpeg opens it for reading, unless ffmpeg exits first."""
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as error:
+            # No reader yet
+            if error.errno != errno.ENXIO:
+                raise
+            if ffmpeg.process.poll() is not None:
+                raise RuntimeError(f"ffmpeg exited with code {ffmpeg.process.returncode}")
+            time.sleep(0.01)
+            continue
+        os.set_blocking(fd, True)
+        return os.fdopen(fd, "wb")
+
+
+def concat_videos(segment_paths, output, output_format="mp4", num_segments=None):
+    """Concatenates MP4 segments encoded with the same settings.
+
+    MP4 output is stream copied, so it is lossless. GIF output is transcoded.
+    The segments are fed to ffmpeg through FIFOs in order, so the output, e.g.
+    a multipart upload, is written as soon as the first segment is done while
+    the next ones may still be encoding. The segments must be faststart MP4s.
+
+    Args:
+      segment_paths: the segment files in order, or an iterator yielding each
+        once it is encoded.
+      output: the output path or a writable sink.
+      output_format: "mp4" or "gif".
+      num_segments: the number of segments, if `segment_paths` is an iterator.
+    """
+    if num_segments is None:
+        num_segments = len(segment_paths)
+    with tempfile.TemporaryDirectory(prefix="concat-") as fifo_dir:
+        fifos = [os.path.join(fifo_dir, f"segment{index:03d}.mp4") for index in range(num_segments)]
+        list_path = os.path.join(fifo_dir, "segments.txt")
+        with open(list_path, "w") as list_file:
+            for fifo in fifos:
+                os.mkfifo(fifo)
+                list_file.write(f"file '{fifo}'\n")
+
+        args = ["-f", "concat", "-safe", "0", "-i", list_path]
+        if output_format != "gif":
+            args += ["-c", "copy"]
+        ffmpeg = _FfmpegProcess(args + _output_args(output, output_format), output)
+        try:
+            for fifo, path in zip(fifos, segment_paths):
+                with _open_fifo(fifo, ffmpeg) as pipe, open(path, "rb") as segment:
+                    shutil.copyfileobj(segment, pipe, PIPE_CHUNK_SIZE)
+        except BaseException:
+            ffmpeg.process.kill()
+            ffmpeg.process.wait()
+            raise
+        ffmpeg.wait()
+    return output
@@ -1,10 +1,34 @@
+import json
+import time
+
+from config import log_format
+
+
+def _log_json(level, event):
+    print(json.dumps({"timestamp": time.time(), "level": level, "message": str(event)}))
+
+
 def log_info(event):
-    print(f'[ INFO ] - ', event)
+    if log_format == "json":
+        _log_json("INFO", event)
+    else:
+        print(f'[ INFO ] - ', event)
 
 
 def log_warning(event):
-    print(f'[ WARNING ] - {event}')
+    if log_format == "json":
+        _log_json("WARNING", event)
+    else:
+        print(f'[ WARNING ] - {event}')
 
 
 def log_error(event):
-    print(f'[ ERROR ] - {event}')
+    if log_format == "json":
+        _log_json("ERROR", event)
+    else:
+        print(f'[ ERROR ] - {event}')
+
+
+def log_metrics(record):
+    """Prints a metrics record as a single JSON line, whatever the log format."""
+    print(json.dumps(record, default=str), flush=True)
@@ -0,0 +1,176 @@
+import json
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from config import metrics_format, metrics_namespace, metrics_dir
+from utils import logger
+
+PROCESS_START = time.perf_counter()
+"""Approximates the process start: app.py imports this module before the others."""
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process and of its waited-for
+    children (ffmpeg, render workers) in MiB, as reported by the kernel."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1024**2 if sys.platform == "darwin" else 1024
+    return own / scale, children / scale
+
+
+def tf_thread_settings():
+    """Returns the TensorFlow thread pool settings, if TensorFlow is loaded."""
+    tf = sys.modules.get("tensorflow")
+    if tf is None:
+        return None
+    return {
+        "intra_op": tf.config.threading.get_intra_op_parallelism_threads(),
+        "inter_op": tf.config.threading.get_inter_op_parallelism_threads(),
+    }
+
+
+class JobMetrics:
+    """Collects the stage timings, counters and gauges of one analysis job.
+
+    Stages are timed with `span` (a context manager that also logs a JSON line
+    when the stage ends) or accumulated with `add_timing` from several threads.
+    `summary` returns everything as a dict and `emit` logs it as one JSON or
+    CloudWatch Embedded Metric Format line.
+    """
+
+    def __init__(self, dimensions=None, properties=None):
+        """
+        Args:
+          dimensions: low-cardinality values the metrics are grouped by, e.g.
+            the model name.
+          properties: other values logged with the summary, e.g. the ids.
+        """
+        self.dimensions = dict(dimensions or {})
+        self.properties = dict(properties or {})
+        self.timings = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def add_timing(self, name, seconds):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    @contextmanager
+    def span(self, name):
+        """Times a stage; repeated spans of the same name add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.add_timing(name, seconds)
+            logger.log_metrics({"event": "span", "name": name, "seconds": seconds})
+
+    def timed_iter(self, name, iterable):
+        """Yields from an iterable, timing only the production of each item."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_timing(name, time.perf_counter() - start)
+                return
+            self.add_timing(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value, unit="None"):
+        with self._lock:
+            self.gauges[name] = (value, unit)
+
+    def rate(self, name, count, seconds_name):
+        """Sets a per second gauge from a count and a recorded timing."""
+        seconds = self.timings.get(seconds_name)
+        if seconds:
+            self.gauge(name, count / seconds, "Count/Second")
+
+    def summary(self):
+        own_rss, children_rss = peak_rss_mb()
+        return {
+            **self.dimensions,
+            **self.properties,
+            "timings": {name: round(value, 4) for name, value in self.timings.items()},
+            "counters": dict(self.counters),
+            "gauges": {name: value for name, (value, _) in self.gauges.items()},
+            "peak_rss_mb": round(own_rss, 1),
+            "children_peak_rss_mb": round(children_rss, 1),
+            "tf_threads": tf_thread_settings(),
+        }
+
+    def to_emf(self):
+        """Formats the metrics as a CloudWatch Embedded Metric Format record."""
+        own_rss, children_rss = peak_rss_mb()
+        values = {name: (value, "Seconds") for name, value in self.timings.items()}
+        values.update({name: (value, "Count") for name, value in self.counters.items()})
+        values.update(self.gauges)
+        values["peak_rss_mb"] = (own_rss, "Megabytes")
+        values["children_peak_rss_mb"] = (children_rss, "Megabytes")
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": metrics_namespace,
+                        "Dimensions": [list(self.dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in values.items()
+                        ],
+                    }
+                ],
+            },
+            **self.dimensions,
+            **self.properties,
+            **{name: value for name, (value, _) in values.items()},
+        }
+
+    def emit(self):
+        """Logs the job summary and writes it to `metrics_dir` if configured."""
+        summary = self.summary()
+        logger.log_metrics(self.to_emf() if metrics_format == "emf" else summary)
+        if metrics_dir and self.properties.get("analysisId"):
+            with open(f"{metrics_dir}/{self.properties['analysisId']}.json", "w") as f:
+                json.dump(summary, f, indent=2, default=str)
+        return summary
+
+
+_current = JobMetrics()
+_first_inference_recorded = False
+
+
+def record_first_inference(job_metrics):
+    """Sets the `time_to_first_inference` gauge on the first inference of the
+    process, i.e. the cold start cost of the imports, model load and warmup."""
+    global _first_inference_recorded
+    if _first_inference_recorded:
+        return
+    _first_inference_recorded = True
+    job_metrics.gauge(
+        "time_to_first_inference", time.perf_counter() - PROCESS_START, "Seconds"
+    )
+
+
+def start_job(dimensions=None, properties=None):
+    """Starts collecting the metrics of a new job and makes them current."""
+    global _current
+    _current = JobMetrics(dimensions, properties)
+    return _current
+
+
+def current():
+    """Returns the metrics of the job being processed."""
+    return _current
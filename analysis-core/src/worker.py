@@ -0,0 +1,168 @@
+import multiprocessing
+import signal
+import sys
+import time
+from multiprocessing.connection import wait
+
+from app import MODEL_TYPES, load_predictor, process_base_jobs, process_job
+from config import job_queue_dir, worker_preload_models, worker_exit_when_idle, worker_batch_size, \
+    worker_layout
+from services.execution_layout import ExecutionLayout
+from services.job_queue import DirectoryJobQueue
+from services.model_registry import DEFAULT_MODELS
+from utils import logger
+
+
+def preload_models(model_names):
+    """Loads the predictors of the given model names so the first job starts warm."""
+    for name in model_names:
+        if name not in MODEL_TYPES:
+            logger.log_warning(f"Skipping preload of unsupported model: {name}")
+            continue
+        start = time.perf_counter()
+        load_predictor(name)
+        logger.log_info(f"Preloaded {name} in {time.perf_counter() - start:.2f}s")
+
+
+def next_jobs(job_queue, poll_timeout, batch_size):
+    """Returns the next job, and the jobs already queued after it up to `batch_size`."""
+    job = job_queue.get(timeout=poll_timeout)
+    if job is None:
+        return []
+    jobs = [job]
+    while len(jobs) < batch_size:
+        job = job_queue.get(timeout=0)
+        if job is None:
+            break
+        jobs.append(job)
+    return jobs
+
+
+def run_worker(job_queue, poll_timeout=1.0, exit_when_idle=False, batch_size=1):
+    """Pulls analysis jobs from the queue and processes them with warm models.
+
+    Args:
+      job_queue: any queue with `get(timeout)` and `done(job)` methods.
+      poll_timeout: seconds to wait for a job before polling again.
+      exit_when_idle: return once the queue is drained instead of waiting.
+      batch_size: the most queued base model jobs analyzed in one batch.
+    """
+    logger.log_info("Worker is waiting for jobs...")
+    while True:
+        jobs = next_jobs(job_queue, poll_timeout, batch_size)
+        if not jobs:
+            if exit_when_idle:
+                logger.log_info("Job queue is empty, stopping the worker.")
+                return
+            continue
+
+        base_jobs = [job for job in jobs if MODEL_TYPES.get(job.get("model_name")) == "base"]
+        if len(base_jobs) > 1:
+            start = time.perf_counter()
+            try:
+                process_base_jobs(base_jobs)
+            except Exception as error:
+                logger.log_error(f"Batch of {len(base_jobs)} jobs failed: {error}")
+            finally:
+                for job in base_jobs:
+                    job_queue.done(job)
+            logger.log_info(
+                f"Batch of {len(base_jobs)} jobs finished in {time.perf_counter() - start:.2f}s"
+            )
+            jobs = [job for job in jobs if job not in base_jobs]
+
+        for job in jobs:
+            start = time.perf_counter()
+            try:
+                process_job(job)
+            except Exception as error:
+                logger.log_error(f"Job {job.get('analysis_id')} failed: {error}")
+            finally:
+                job_queue.done(job)
+            logger.log_info(
+                f"Job {job.get('analysis_id')} finished in {time.perf_counter() - start:.2f}s"
+            )
+
+
+def run_worker_process(layout, index, model_names, queue_dir, exit_when_idle=False, batch_size=1):
+    """Runs one worker process of a layout on the shared directory job queue."""
+    settings = layout.configure_process(index)
+    logger.log_info(f"Worker process {index} started with {settings}")
+    preload_models(model_names)
+    job_queue = DirectoryJobQueue(queue_dir)
+    job_queue.requeue_stale_claims()
+    run_worker(job_queue, exit_when_idle=exit_when_idle, batch_size=batch_size)
+
+
+def run_worker_processes(layout, model_names, queue_dir, exit_when_idle=False, batch_size=1):
+    """Runs the worker processes of a layout, which take jobs from the same
+    directory job queue.
+
+    Every process is spawned, so it loads its own models and starts its
+    TensorFlow runtime with the threads of the layout; forking a process
+    whose TensorFlow runtime already runs is not safe. The job of a process
+    exiting with an error, e.g. killed for running out of memory, is
+    requeued, and the process is restarted unless the workers exit when idle.
+
+    Args:
+      layout: the ExecutionLayout.
+      model_names: the models every process loads at startup.
+      queue_dir: the directory of the job queue.
+      exit_when_idle: return once the queue is drained and every process stopped.
+      batch_size: the most queued base model jobs a process analyzes in one batch.
+    """
+    context = multiprocessing.get_context("spawn")
+    job_queue = DirectoryJobQueue(queue_dir)
+
+    def start(index):
+        process = context.Process(
+            target=run_worker_process,
+            args=(layout, index, model_names, queue_dir, exit_when_idle, batch_size),
+            name=f"worker-{index}",
+        )
+        process.start()
+        return process
+
+    # Stopping the container stops the processes too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    logger.log_info(f"Starting {layout.processes} worker processes with the layout {layout}")
+    processes = {index: start(index) for index in range(layout.processes)}
+    try:
+        while processes:
+            wait([process.sentinel for process in processes.values()])
+            for index, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                del processes[index]
+                if process.exitcode != 0:
+                    job_queue.requeue_stale_claims()
+                if process.exitcode != 0 and not exit_when_idle:
+                    logger.log_warning(f"Worker process {index} exited with code {process.exitcode}, restarting it")
+                    time.sleep(1)
+                    processes[index] = start(index)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+
+def main():
+    layout = ExecutionLayout.parse(worker_layout)
+    model_names = worker_preload_models or [spec.name for spec in DEFAULT_MODELS.values()]
+    if layout.processes > 1:
+        run_worker_processes(
+            layout, model_names, job_queue_dir, exit_when_idle=worker_exit_when_idle, batch_size=worker_batch_size
+        )
+        return
+
+    layout.configure_process(0)
+    preload_models(model_names)
+    job_queue = DirectoryJobQueue(job_queue_dir)
+    # The jobs of a previous run of the worker that was killed
+    job_queue.requeue_stale_claims()
+    run_worker(job_queue, exit_when_idle=worker_exit_when_idle, batch_size=worker_batch_size)
+
+
+if __name__ == "__main__":
+    main()
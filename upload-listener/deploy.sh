@@ -42,7 +42,7 @@ echo "Cleaning old build artifacts"
 rm -rf ./package && rm -rf ./build
 echo "Copying source code"
 mkdir -p ./package && mkdir -p ./build
-cp listener_lambda.py ./package/
+cp listener_lambda.py media_probe.py ./package/
 echo "Entering python virtual environment"
 python -m venv venv
 source venv/bin/activate
@@ -3,9 +3,11 @@ import os
 import json
 import re
 
-# Initialize ECS and S3 clients
+from media_probe import InvalidMediaError, probe_media
+
+# Initialize ECS and S3 clients, S3_ENDPOINT_URL points S3 to a local stand-in
 ecs_client = boto3.client("ecs")
-s3_client = boto3.client("s3")
+s3_client = boto3.client("s3", endpoint_url=os.getenv("S3_ENDPOINT_URL"))
 events_client = boto3.client('events')
 
 
@@ -31,6 +33,21 @@ def lambda_handler(event, _):
             and object_key.lower().startswith("upload/")
             and re.match(pattern, object_key)
             and object_size < size_limit):
+        # Validate the video from its header before copying it
+        try:
+            media = probe_media(s3_client, source_bucket_name, object_key, object_size)
+        except InvalidMediaError as error:
+            print("File is not a valid video.", {
+                "key": object_key,
+                "size": object_size,
+                "error": str(error),
+            })
+            return {
+                "statusCode": 200,
+                "body": json.dumps(f"Rejected the uploaded file: {error}"),
+            }
+        print(f"Probed '{object_key}'.", media)
+
         # Copy the object to the new bucket
         copy_source = {'Bucket': source_bucket_name, 'Key': object_key}
         destination_object_key = object_key.replace("upload/", "files/", 1)
@@ -48,7 +65,8 @@ def lambda_handler(event, _):
         event_payload = {
             "userId": user_id,
             "key": destination_object_key,
-            "name": filename
+            "name": filename,
+            "media": media
         }
 
         event = {
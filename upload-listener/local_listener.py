@@ -0,0 +1,110 @@
+"""Runs the listener Lambda on local files against an in-process S3 stand-in.
+
+Uploads every file, and a truncated and a garbage copy of it, to the upload
+prefix of a moto S3 server, invokes `lambda_handler` with the EventBridge
+event of each upload, and prints the outcome, the probed metadata and the
+bytes the probe fetched. Needs the packages of requirements-dev.txt.
+
+Usage (from upload-listener):
+  python local_listener.py clip.mp4 animation.gif
+"""
+import json
+import os
+import socket
+import sys
+import uuid
+
+from moto.server import ThreadedMotoServer
+
+SOURCE_BUCKET = "var-upload"
+DESTINATION_BUCKET = "var-files"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class RecordingEventsClient:
+    """Keeps the published events instead of sending them to EventBridge."""
+
+    def __init__(self):
+        self.entries = []
+
+    def put_events(self, Entries):
+        self.entries.extend(Entries)
+        return {"FailedEntryCount": 0, "Entries": [{"EventId": str(uuid.uuid4())} for _ in Entries]}
+
+
+def upload_event(key, size):
+    return {
+        "detail": {
+            "bucket": {"name": SOURCE_BUCKET},
+            "object": {"key": key, "size": size},
+        }
+    }
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+
+    port = free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    os.environ.update(
+        {
+            "S3_ENDPOINT_URL": f"http://127.0.0.1:{port}",
+            "AWS_ACCESS_KEY_ID": "local",
+            "AWS_SECRET_ACCESS_KEY": "local",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "DESTINATION_BUCKET_NAME": DESTINATION_BUCKET,
+        }
+    )
+    # The clients are created at import time from the environment
+    import listener_lambda
+
+    s3_client = listener_lambda.s3_client
+    events = RecordingEventsClient()
+    listener_lambda.events_client = events
+    s3_client.create_bucket(Bucket=SOURCE_BUCKET)
+    s3_client.create_bucket(Bucket=DESTINATION_BUCKET)
+
+    try:
+        for path in paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            name = os.path.basename(path)
+            variants = {
+                "original": data,
+                "truncated": data[: len(data) // 2],
+                "garbage": os.urandom(len(data)),
+            }
+            for variant, body in variants.items():
+                key = f"upload/{uuid.uuid4()}/{name}"
+                s3_client.put_object(Bucket=SOURCE_BUCKET, Key=key, Body=body)
+                published = len(events.entries)
+                result = listener_lambda.lambda_handler(upload_event(key, len(body)), None)
+                media = None
+                if len(events.entries) > published:
+                    media = json.loads(events.entries[-1]["Detail"]).get("media")
+                print(
+                    json.dumps(
+                        {
+                            "file": name,
+                            "variant": variant,
+                            "size": len(body),
+                            "result": json.loads(result["body"]),
+                            "media": media,
+                        }
+                    )
+                )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import os
+
+HEAD_BYTES = int(os.getenv("PROBE_HEAD_BYTES", str(64 * 1024)))
+"""The bytes fetched first, enough for the header of a GIF or a faststart MP4."""
+MAX_MOOV_BYTES = int(os.getenv("PROBE_MAX_MOOV_BYTES", str(8 * 1024 * 1024)))
+"""The largest MP4 moov box fetched, larger ones are rejected."""
+GIF_SCAN_BYTES = int(os.getenv("PROBE_GIF_SCAN_BYTES", str(4 * 1024 * 1024)))
+"""GIFs up to this size are read whole, to count their frames and sum their delays."""
+
+# Boxes walked to reach the video track metadata
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+class InvalidMediaError(Exception):
+    """The uploaded file is not a valid MP4 or GIF video."""
+
+
+class RangeReader:
+    """Reads byte ranges of an S3 object with ranged GETs.
+
+    The first `head_bytes` are fetched once and reused, so small headers cost
+    a single request. `requests` and `bytes_read` count the actual transfers.
+    """
+
+    def __init__(self, s3_client, bucket, key, size, head_bytes=HEAD_BYTES):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.requests = 0
+        self.bytes_read = 0
+        self.head = self._get(0, min(head_bytes, size))
+
+    def _get(self, offset, length):
+        if length <= 0:
+            return b""
+        response = self.s3_client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={offset}-{offset + length - 1}"
+        )
+        data = response["Body"].read()
+        self.requests += 1
+        self.bytes_read += len(data)
+        return data
+
+    def read(self, offset, length):
+        length = min(length, self.size - offset)
+        if offset + length <= len(self.head):
+            return self.head[offset : offset + length]
+        if offset < len(self.head):
+            # Only fetch the part after the cached head
+            return self.head[offset:] + self._get(len(self.head), offset + length - len(self.head))
+        return self._get(offset, length)
+
+
+def _u16(data, offset, byteorder="big"):
+    return int.from_bytes(data[offset : offset + 2], byteorder)
+
+
+def _u32(data, offset):
+    return int.from_bytes(data[offset : offset + 4], "big")
+
+
+def _u64(data, offset):
+    return int.from_bytes(data[offset : offset + 8], "big")
+
+
+def _box_header(data, offset, end):
+    """Returns the (size, header size, type) of the MP4 box at `offset`."""
+    if offset + 8 > end:
+        raise InvalidMediaError("Truncated MP4 box header")
+    size = _u32(data, offset)
+    box_type = data[offset + 4 : offset + 8]
+    header_size = 8
+    if size == 1:
+        if offset + 16 > end:
+            raise InvalidMediaError("Truncated MP4 box header")
+        size = _u64(data, offset + 8)
+        header_size = 16
+    elif size == 0:
+        size = end - offset
+    if size < header_size:
+        raise InvalidMediaError(f"Invalid MP4 box size {size}")
+    return size, header_size, box_type
+
+
+def _iter_boxes(data, start, end):
+    """Yields the (type, payload start, payload end) of the boxes in data[start:end]."""
+    offset = start
+    while offset < end:
+        size, header_size, box_type = _box_header(data, offset, end)
+        if offset + size > end:
+            raise InvalidMediaError(f"Truncated MP4 {box_type.decode('latin-1')} box")
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def _find_moov(reader):
+    """Walks the top-level boxes with small reads and returns the moov box payload."""
+    offset = 0
+    first = True
+    while offset < reader.size:
+        header = reader.read(offset, 16)
+        size, header_size, box_type = _box_header(header, 0, reader.size - offset)
+        if first and box_type != b"ftyp":
+            raise InvalidMediaError("Not an MP4 file, no ftyp box")
+        first = False
+        if offset + size > reader.size:
+            raise InvalidMediaError(f"Truncated MP4 file, the {box_type.decode('latin-1')} box ends after it")
+        if box_type == b"moov":
+            if size > MAX_MOOV_BYTES:
+                raise InvalidMediaError(f"The MP4 moov box of {size} bytes is too large")
+            moov = reader.read(offset + header_size, size - header_size)
+            _check_mdat(reader, offset + size)
+            return moov
+        offset += size
+    raise InvalidMediaError("No moov box in the MP4 file")
+
+
+def _check_mdat(reader, offset, max_boxes=4):
+    """Checks the first mdat box after a faststart moov box is not cut short."""
+    for _ in range(max_boxes):
+        if offset + 8 > reader.size:
+            return
+        size, _, box_type = _box_header(reader.read(offset, 16), 0, reader.size - offset)
+        if offset + size > reader.size:
+            raise InvalidMediaError(f"Truncated MP4 file, the {box_type.decode('latin-1')} box ends after it")
+        if box_type == b"mdat":
+            return
+        offset += size
+
+
+def _parse_track(data, start, end, track):
+    """Collects the video track fields of a trak box and its children."""
+    for box_type, payload, box_end in _iter_boxes(data, start, end):
+        version = data[payload] if payload < box_end else None
+        if box_type in _MP4_CONTAINERS:
+            _parse_track(data, payload, box_end, track)
+        elif box_type == b"tkhd":
+            offset = payload + (88 if version == 1 else 76)
+            if offset + 8 <= box_end:
+                # 16.16 fixed point numbers
+                track["width"] = _u32(data, offset) >> 16
+                track["height"] = _u32(data, offset + 4) >> 16
+        elif box_type == b"hdlr" and payload + 12 <= box_end:
+            track["handler"] = data[payload + 8 : payload + 12]
+        elif box_type == b"mdhd":
+            if version == 1 and payload + 32 <= box_end:
+                track["timescale"] = _u32(data, payload + 20)
+                track["duration"] = _u64(data, payload + 24)
+            elif payload + 20 <= box_end:
+                track["timescale"] = _u32(data, payload + 12)
+                track["duration"] = _u32(data, payload + 16)
+        elif box_type == b"stsd" and payload + 16 <= box_end:
+            track["codec"] = data[payload + 12 : payload + 16].decode("latin-1")
+        elif box_type == b"stsz" and payload + 12 <= box_end:
+            track["frame_count"] = _u32(data, payload + 8)
+        elif box_type == b"stts" and payload + 8 <= box_end and "frame_count" not in track:
+            # The entry count is untrusted, only the entries within the box are read
+            entries = min(_u32(data, payload + 4), (box_end - payload - 8) // 8)
+            track["frame_count"] = sum(_u32(data, payload + 8 + 8 * i) for i in range(entries))
+
+
+def probe_mp4(reader):
+    """Returns the metadata of the video track of an MP4, read from its moov box."""
+    moov = _find_moov(reader)
+    movie_duration = None
+    video = None
+    for box_type, payload, box_end in _iter_boxes(moov, 0, len(moov)):
+        if box_type == b"mvhd":
+            if payload >= box_end:
+                raise InvalidMediaError("Empty MP4 mvhd box")
+            if moov[payload] == 1 and payload + 32 <= box_end:
+                timescale, duration = _u32(moov, payload + 20), _u64(moov, payload + 24)
+            elif payload + 20 <= box_end:
+                timescale, duration = _u32(moov, payload + 12), _u32(moov, payload + 16)
+            else:
+                continue
+            movie_duration = duration / timescale if timescale else None
+        elif box_type == b"trak" and video is None:
+            track = {}
+            _parse_track(moov, payload, box_end, track)
+            if track.get("handler") == b"vide":
+                video = track
+    if video is None:
+        raise InvalidMediaError("No video track in the MP4 file")
+
+    duration = movie_duration
+    if video.get("timescale") and video.get("duration"):
+        duration = video["duration"] / video["timescale"]
+    # Fragmented MP4s list their samples in moof boxes, not in the moov box
+    frame_count = video.get("frame_count") or None
+    return {
+        "format": "mp4",
+        "codec": video.get("codec"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "duration": round(duration, 3) if duration else None,
+        "frame_count": frame_count,
+        "fps": round(frame_count / duration, 3) if frame_count and duration else None,
+    }
+
+
+def _skip_sub_blocks(data, offset):
+    """Returns the offset after the data sub-blocks of a GIF block, or None if truncated."""
+    while offset < len(data):
+        length = data[offset]
+        offset += 1 + length
+        if length == 0:
+            return offset
+    return None
+
+
+def probe_gif(reader):
+    """Returns the metadata of a GIF from its header, and the frame count and
+    duration if the whole file is within GIF_SCAN_BYTES."""
+    header = reader.read(0, 13)
+    if header[:6] not in (b"GIF87a", b"GIF89a"):
+        raise InvalidMediaError("Not a GIF file, invalid signature")
+    if len(header) < 13:
+        raise InvalidMediaError("Truncated GIF header")
+    width, height = _u16(header, 6, "little"), _u16(header, 8, "little")
+    packed = header[10]
+    offset = 13
+    if packed & 0x80:
+        offset += 3 * 2 ** ((packed & 0x07) + 1)
+
+    complete = reader.size <= GIF_SCAN_BYTES
+    data = reader.read(0, reader.size) if complete else reader.head
+    frame_count = 0
+    duration = 0.0
+    delay = None
+    terminated = False
+    while offset < len(data):
+        block = data[offset]
+        if block == 0x3B:  # Trailer
+            terminated = True
+            break
+        if block == 0x21:  # Extension
+            if offset + 2 > len(data):
+                break
+            if data[offset + 1] == 0xF9 and offset + 6 < len(data):  # Graphic control
+                delay = _u16(data, offset + 4, "little")
+            next_offset = _skip_sub_blocks(data, offset + 2)
+        elif block == 0x2C:  # Image descriptor
+            if offset + 10 > len(data):
+                break
+            frame_count += 1
+            # Browsers and ffmpeg show frames without a delay for 1/10 s
+            duration += (delay or 10) / 100
+            delay = None
+            descriptor = offset + 10
+            if data[offset + 9] & 0x80:
+                descriptor += 3 * 2 ** ((data[offset + 9] & 0x07) + 1)
+            # The LZW minimum code size precedes the image data sub-blocks
+            next_offset = _skip_sub_blocks(data, descriptor + 1)
+        else:
+            raise InvalidMediaError(f"Invalid GIF block 0x{block:02x}")
+        if next_offset is None:
+            break
+        offset = next_offset
+
+    if complete and not terminated:
+        raise InvalidMediaError("Truncated GIF file, no trailer")
+    if frame_count == 0 and complete:
+        raise InvalidMediaError("No image in the GIF file")
+    if not complete:
+        # Only the first frames were scanned
+        frame_count, duration = None, None
+    return {
+        "format": "gif",
+        "codec": "gif",
+        "width": width,
+        "height": height,
+        "duration": round(duration, 3) if duration else None,
+        "frame_count": frame_count,
+        "fps": round(frame_count / duration, 3) if frame_count and duration else None,
+    }
+
+
+def probe_media(s3_client, bucket, key, size):
+    """Validates an uploaded MP4 or GIF from its header and returns its metadata.
+
+    Only the header is fetched with ranged GETs: the first HEAD_BYTES, then
+    the top-level MP4 box headers up to the moov box and the moov box itself.
+
+    Returns:
+      A dict with the `format`, `codec`, `width`, `height`, `duration` (in
+      seconds), `frame_count` and `fps`, the unknown ones being None, and the
+      `probe_requests` and `probe_bytes` transferred.
+
+    Raises:
+      InvalidMediaError: if the file is not a valid video of its extension.
+    """
+    if size <= 0:
+        raise InvalidMediaError("Empty file")
+    reader = RangeReader(s3_client, bucket, key, size)
+    extension = os.path.splitext(key)[1].lower()
+    is_gif = reader.head[:3] == b"GIF"
+    if is_gif != (extension == ".gif"):
+        raise InvalidMediaError(f"The file content does not match its {extension} extension")
+    metadata = probe_gif(reader) if is_gif else probe_mp4(reader)
+    if not metadata["width"] or not metadata["height"]:
+        raise InvalidMediaError("The video has no resolution")
+    metadata["probe_requests"] = reader.requests
+    metadata["probe_bytes"] = reader.bytes_read
+    return metadata